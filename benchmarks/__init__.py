@@ -2,9 +2,15 @@
 Benchmarking tools for the distributed key-value store
 """
 
-from .performance import KeyValueStoreBenchmark, BenchmarkResults
+from .performance import (KeyValueStoreBenchmark, BenchmarkResults, LoadGenerator,
+                          LatencyHistogram, ZipfianGenerator, WORKLOADS, compare_results)
 
 __all__ = [
     'KeyValueStoreBenchmark',
-    'BenchmarkResults'
+    'BenchmarkResults',
+    'LoadGenerator',
+    'LatencyHistogram',
+    'ZipfianGenerator',
+    'WORKLOADS',
+    'compare_results'
 ]
@@ -0,0 +1,229 @@
+import gc
+import sys
+import json
+import time
+import argparse
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.store.store import DistributedStore
+
+DEFAULT_TOLERANCE = 0.25
+
+def _key(index: int) -> str:
+    return f"key{index:08d}"
+
+def _filled_store(keys: int) -> DistributedStore:
+    store = DistributedStore()
+    store.put_many({_key(i): f"value{i}" for i in range(keys)})
+    return store
+
+def _run_threads(threads: int, keys: int, work: Callable[[range], None]) -> float:
+    """Run ``work`` over an equal slice of the key range per thread.
+
+    Every thread waits on a barrier, so thread start-up is not timed.
+    """
+    barrier = threading.Barrier(threads + 1)
+    step = (keys + threads - 1) // threads
+
+    def target(index: int):
+        barrier.wait()
+        work(range(index * step, min((index + 1) * step, keys)))
+
+    workers = [threading.Thread(target=target, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+def bench_create(keys: int, threads: int) -> Tuple[float, int]:
+    store = DistributedStore()
+
+    def work(indexes):
+        for i in indexes:
+            store.create(_key(i), "value")
+    return _run_threads(threads, keys, work), keys
+
+def bench_read(keys: int, threads: int) -> Tuple[float, int]:
+    store = _filled_store(keys)
+
+    def work(indexes):
+        for i in indexes:
+            store.read(_key(i))
+    return _run_threads(threads, keys, work), keys
+
+def bench_update(keys: int, threads: int) -> Tuple[float, int]:
+    store = _filled_store(keys)
+
+    def work(indexes):
+        for i in indexes:
+            store.update(_key(i), "updated")
+    return _run_threads(threads, keys, work), keys
+
+def bench_delete(keys: int, threads: int) -> Tuple[float, int]:
+    store = _filled_store(keys)
+
+    def work(indexes):
+        for i in indexes:
+            store.delete(_key(i))
+    return _run_threads(threads, keys, work), keys
+
+def bench_merge(keys: int, threads: int) -> Tuple[float, int]:
+    # Half of the peer map is newer than the local copy, half is new keys
+    store = _filled_store(keys // 2)
+    now = time.time()
+    peer = {_key(i): (f"peer{i}", 5, now) for i in range(keys)}
+    start = time.perf_counter()
+    store.merge(peer)
+    return time.perf_counter() - start, keys
+
+def bench_get_all_entries(keys: int, threads: int) -> Tuple[float, int]:
+    store = _filled_store(keys)
+    # Small stores copy in well under a millisecond, so time several copies
+    rounds = max(1, 100000 // keys)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        store.get_all_entries()
+    return time.perf_counter() - start, keys * rounds
+
+def bench_scan(keys: int, threads: int) -> Tuple[float, int]:
+    # Page through one tenant's keys, a tenth of the store, 100 at a time
+    store = DistributedStore()
+    store.put_many({f"tenant{t}/{_key(i)}": i for t in range(10) for i in range(keys // 10)})
+    start = time.perf_counter()
+    after = None
+    scanned = 0
+    while True:
+        page = [key for key, _ in store.scan(prefix="tenant3/", after=after, limit=100)]
+        scanned += len(page)
+        if len(page) < 100:
+            break
+        after = page[-1]
+    return time.perf_counter() - start, scanned
+
+# name -> (function, whether it runs with more than one thread)
+CASES: Dict[str, Tuple[Callable[[int, int], Tuple[float, int]], bool]] = {
+    'create': (bench_create, True),
+    'read': (bench_read, True),
+    'update': (bench_update, True),
+    'delete': (bench_delete, True),
+    'merge': (bench_merge, False),
+    'get_all_entries': (bench_get_all_entries, False),
+    'scan': (bench_scan, False),
+}
+
+def case_name(case: str, keys: int, threads: int) -> str:
+    return f"{case}/keys={keys}/threads={threads}"
+
+def run_case(case: str, keys: int, threads: int, repeat: int = 5) -> Dict[str, Any]:
+    """Time one case, keeping the best of ``repeat`` runs as timeit does"""
+    function, _ = CASES[case]
+    best = None
+    ops = 0
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            elapsed, ops = function(keys, threads)
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        'name': case_name(case, keys, threads),
+        'case': case,
+        'keys': keys,
+        'threads': threads,
+        'ops': ops,
+        'seconds': best,
+        'ns_per_op': best / ops * 1e9 if ops else 0.0,
+        'ops_per_sec': ops / best if best else 0.0
+    }
+
+def run_suite(cases: Optional[List[str]] = None, key_counts: List[int] = (1000, 10000),
+              thread_counts: List[int] = (1, 4), repeat: int = 5) -> List[Dict[str, Any]]:
+    results = []
+    for case in cases or list(CASES):
+        if case not in CASES:
+            raise ValueError(f"Unknown benchmark case: {case}")
+        threaded = CASES[case][1]
+        for keys in key_counts:
+            for threads in (thread_counts if threaded else [1]):
+                results.append(run_case(case, keys, threads, repeat))
+    return results
+
+def save_baseline(results: List[Dict[str, Any]], path: str,
+                  tolerance: float = DEFAULT_TOLERANCE):
+    baseline = {
+        'tolerance': tolerance,
+        'python': sys.version.split()[0],
+        'cases': {result['name']: {'ns_per_op': result['ns_per_op']} for result in results}
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+def check_baseline(results: List[Dict[str, Any]], baseline: Dict[str, Any],
+                   tolerance: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Return the cases slower than their baseline by more than the tolerance.
+
+    A case may set its own ``tolerance`` in the baseline file; otherwise the
+    ``tolerance`` argument, then the file's default, applies. Cases missing
+    from the baseline are not checked.
+    """
+    default = tolerance if tolerance is not None else baseline.get('tolerance', DEFAULT_TOLERANCE)
+    regressions = []
+    for result in results:
+        expected = baseline['cases'].get(result['name'])
+        if expected is None:
+            continue
+        allowed = expected.get('tolerance', default)
+        ratio = result['ns_per_op'] / expected['ns_per_op'] if expected['ns_per_op'] else 1.0
+        if ratio > 1 + allowed:
+            regressions.append({'name': result['name'], 'baseline_ns': expected['ns_per_op'],
+                                'current_ns': result['ns_per_op'], 'ratio': ratio,
+                                'tolerance': allowed})
+    return regressions
+
+def _int_list(text: str) -> List[int]:
+    return [int(item) for item in text.split(',') if item]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="In-process DistributedStore microbenchmarks")
+    parser.add_argument('--cases', help="comma separated subset of: " + ', '.join(CASES))
+    parser.add_argument('--keys', type=_int_list, default=[1000, 10000])
+    parser.add_argument('--threads', type=_int_list, default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="write the JSON results to this file")
+    parser.add_argument('--baseline', help="fail if slower than this baseline file")
+    parser.add_argument('--save-baseline', help="store these results as a baseline file")
+    parser.add_argument('--tolerance', type=float,
+                        help=f"allowed slowdown as a fraction (default {DEFAULT_TOLERANCE})")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.cases.split(',') if args.cases else None,
+                        args.keys, args.threads, args.repeat)
+    for result in results:
+        print(f"{result['name']:<40} {result['ns_per_op']:>10.0f} ns/op "
+              f"{result['ops_per_sec']:>12.0f} ops/s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline,
+                      args.tolerance if args.tolerance is not None else DEFAULT_TOLERANCE)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = check_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['name']}: {regression['current_ns']:.0f} ns/op vs "
+                  f"{regression['baseline_ns']:.0f} baseline "
+                  f"(+{(regression['ratio'] - 1) * 100:.0f}%, allowed "
+                  f"{regression['tolerance'] * 100:.0f}%)")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,354 @@
 import time
+import json
+import random
+import argparse
+import itertools
+import threading
 import requests
 import concurrent.futures
 import statistics
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+# Histogram buckets are exact below 2**SUB_BUCKET_BITS microseconds and keep
+# the same number of linear sub-buckets per power of two above it, so every
+# recorded value is within 1/64 (~1.6%) of its bucket's lower bound.
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+class LatencyHistogram:
+    """HDR-style log-linear latency histogram with microsecond resolution.
+
+    Recording is a couple of integer operations, histograms from several
+    threads can be merged, and the bucket counts serialize to JSON so two
+    runs can be compared percentile by percentile.
+    """
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max = 0
+
+    @staticmethod
+    def _index(value: int) -> int:
+        if value < SUB_BUCKET_COUNT:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + (value >> shift) - SUB_BUCKET_HALF
+
+    @staticmethod
+    def _lower_bound(index: int) -> int:
+        if index < SUB_BUCKET_COUNT:
+            return index
+        shift, offset = divmod(index - SUB_BUCKET_COUNT, SUB_BUCKET_HALF)
+        return (offset + SUB_BUCKET_HALF) << (shift + 1)
+
+    def record(self, seconds: float):
+        micros = max(0, int(seconds * 1e6))
+        index = self._index(micros)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += micros
+        if self.min is None or micros < self.min:
+            self.min = micros
+        if micros > self.max:
+            self.max = micros
+
+    def merge(self, other: 'LatencyHistogram'):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent: float) -> float:
+        """Return the latency in seconds at ``percent`` (0-100)"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(percent / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._lower_bound(index), self.max) / 1e6
+        return self.max / 1e6
+
+    def mean(self) -> float:
+        return self.total / self.count / 1e6 if self.count else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'min': (self.min or 0) / 1e6,
+            'mean': self.mean(),
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+            'max': self.max / 1e6
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'counts': {str(index): count for index, count in sorted(self.counts.items())},
+                'min': self.min, 'max': self.max, 'total': self.total}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencyHistogram':
+        histogram = cls()
+        histogram.counts = {int(index): count for index, count in data['counts'].items()}
+        histogram.count = sum(histogram.counts.values())
+        histogram.min, histogram.max, histogram.total = data['min'], data['max'], data['total']
+        return histogram
+
+class UniformGenerator:
+    """Picks every key index with the same probability"""
+
+    def __init__(self, items: int):
+        self.items = items
+
+    def next(self, rng: random.Random) -> int:
+        return rng.randrange(self.items)
+
+class ZipfianGenerator:
+    """Zipfian key indexes as generated by YCSB (Gray et al.'s method).
+
+    With ``scrambled`` the popular indexes are hashed across the key space so
+    hot keys do not all land next to each other (and on the same shard).
+    """
+
+    def __init__(self, items: int, theta: float = 0.99, scrambled: bool = True):
+        self.items = items
+        self.theta = theta
+        self.scrambled = scrambled
+        self.zetan = sum(1.0 / (i ** theta) for i in range(1, items + 1))
+        zeta2 = 1.0 + 1.0 / (2 ** theta)
+        self.alpha = 1.0 / (1.0 - theta)
+        self.eta = (1 - (2.0 / items) ** (1 - theta)) / (1 - zeta2 / self.zetan)
+
+    def next(self, rng: random.Random) -> int:
+        u = rng.random()
+        uz = u * self.zetan
+        if uz < 1.0:
+            index = 0
+        elif uz < 1.0 + 0.5 ** self.theta:
+            index = 1
+        else:
+            index = int(self.items * ((self.eta * u - self.eta + 1) ** self.alpha))
+        index = min(index, self.items - 1)
+        if self.scrambled:
+            # FNV-1a over the index, as in YCSB's ScrambledZipfianGenerator
+            h = 0xcbf29ce484222325
+            for byte in index.to_bytes(8, 'little'):
+                h = ((h ^ byte) * 0x100000001b3) & 0xffffffffffffffff
+            index = h % self.items
+        return index
+
+KEY_DISTRIBUTIONS = {
+    'uniform': UniformGenerator,
+    'zipfian': ZipfianGenerator
+}
+
+class Workload:
+    """An operation mix in the style of the YCSB core workloads"""
+
+    def __init__(self, name: str, read: float = 0.0, update: float = 0.0,
+                 insert: float = 0.0, scan: float = 0.0, scan_length: int = 10):
+        self.name = name
+        self.mix = [(op, weight) for op, weight in
+                    (('read', read), ('update', update), ('insert', insert), ('scan', scan))
+                    if weight > 0]
+        self.scan_length = scan_length
+
+    def choose(self, rng: random.Random) -> str:
+        point = rng.random() * sum(weight for _, weight in self.mix)
+        for op, weight in self.mix:
+            point -= weight
+            if point < 0:
+                return op
+        return self.mix[-1][0]
+
+WORKLOADS = {
+    'update-heavy': Workload('update-heavy', read=0.5, update=0.5),    # YCSB A
+    'read-heavy': Workload('read-heavy', read=0.95, update=0.05),      # YCSB B
+    'read-only': Workload('read-only', read=1.0),                      # YCSB C
+    'write-heavy': Workload('write-heavy', read=0.1, update=0.9),
+    'scan': Workload('scan', scan=0.95, insert=0.05),                  # YCSB E
+}
+
+class LoadGenerator:
+    """Drives a workload against a node over keep-alive HTTP sessions.
+
+    In closed-loop mode each thread issues its next request as soon as the
+    previous one returns. With ``target_rate`` the generator is open-loop:
+    request ``i`` is due at ``start + i / target_rate`` and its latency is
+    measured from that due time, so requests delayed behind a stall are
+    charged for the wait instead of silently being issued late
+    (coordinated omission). Service time, measured from the actual send, is
+    recorded separately.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:8000", workload: str = 'read-heavy',
+                 record_count: int = 10000, threads: int = 16,
+                 distribution: str = 'zipfian', value_size: int = 100,
+                 target_rate: Optional[float] = None, timeout: float = 5.0, seed: int = 0):
+        if workload not in WORKLOADS:
+            raise ValueError(f"Unknown workload: {workload}")
+        if distribution not in KEY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown key distribution: {distribution}")
+        self.base_url = base_url.rstrip('/')
+        self.workload = WORKLOADS[workload]
+        self.record_count = record_count
+        self.threads = threads
+        self.distribution = distribution
+        self.keys = KEY_DISTRIBUTIONS[distribution](record_count)
+        self.value = 'x' * value_size
+        self.target_rate = target_rate
+        self.timeout = timeout
+        self.seed = seed
+        self._local = threading.local()
+        self._inserted = itertools.count(record_count)
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    @staticmethod
+    def key_name(index: int) -> str:
+        return f"user{index:010d}"
+
+    def load(self, batch_size: int = 1000):
+        """Insert the initial records through /mput"""
+        session = self._session()
+        for start in range(0, self.record_count, batch_size):
+            items = {self.key_name(i): self.value
+                     for i in range(start, min(start + batch_size, self.record_count))}
+            response = session.post(f"{self.base_url}/mput",
+                                    json={'items': items, 'overwrite': True},
+                                    timeout=self.timeout)
+            response.raise_for_status()
+
+    def _execute(self, op: str, rng: random.Random) -> bool:
+        session = self._session()
+        if op == 'read':
+            response = session.get(f"{self.base_url}/kv/{self.key_name(self.keys.next(rng))}",
+                                   timeout=self.timeout)
+            return response.status_code == 200
+        if op == 'update':
+            response = session.post(f"{self.base_url}/mput",
+                                    json={'items': {self.key_name(self.keys.next(rng)): self.value},
+                                          'overwrite': True},
+                                    timeout=self.timeout)
+            return response.status_code == 200
+        if op == 'insert':
+            response = session.put(f"{self.base_url}/kv/{self.key_name(next(self._inserted))}",
+                                   json={'value': self.value}, timeout=self.timeout)
+            return response.status_code == 201
+        # Short range read starting at a chosen key
+        response = session.get(f"{self.base_url}/scan",
+                               params={'start': self.key_name(self.keys.next(rng)),
+                                       'limit': rng.randint(1, self.workload.scan_length)},
+                               timeout=self.timeout)
+        return response.status_code == 200
+
+    def run(self, duration: float = 10.0, operations: Optional[int] = None) -> Dict[str, Any]:
+        """Run the workload for ``duration`` seconds or ``operations`` requests"""
+        ops = [op for op, _ in self.workload.mix]
+        latency = {op: LatencyHistogram() for op in ops}
+        service = {op: LatencyHistogram() for op in ops}
+        errors = {op: 0 for op in ops}
+        merge_lock = threading.Lock()
+        counter = itertools.count()
+        start = time.perf_counter() + 0.05
+        deadline = start + duration
+
+        def worker(thread_index: int):
+            rng = random.Random(self.seed * 1000003 + thread_index)
+            local_latency = {op: LatencyHistogram() for op in ops}
+            local_service = {op: LatencyHistogram() for op in ops}
+            local_errors = {op: 0 for op in ops}
+            while True:
+                sequence = next(counter)
+                if operations is not None and sequence >= operations:
+                    break
+                intended = start + sequence / self.target_rate if self.target_rate else None
+                if intended is not None:
+                    delay = intended - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                sent = time.perf_counter()
+                if operations is None and sent >= deadline:
+                    break
+                op = self.workload.choose(rng)
+                try:
+                    ok = self._execute(op, rng)
+                except requests.RequestException:
+                    ok = False
+                done = time.perf_counter()
+                if not ok:
+                    local_errors[op] += 1
+                local_service[op].record(done - sent)
+                local_latency[op].record(done - (intended if intended is not None else sent))
+            with merge_lock:
+                for op in ops:
+                    latency[op].merge(local_latency[op])
+                    service[op].merge(local_service[op])
+                    errors[op] += local_errors[op]
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        total = LatencyHistogram()
+        for histogram in latency.values():
+            total.merge(histogram)
+        return {
+            'config': {
+                'base_url': self.base_url,
+                'workload': self.workload.name,
+                'record_count': self.record_count,
+                'threads': self.threads,
+                'distribution': self.distribution,
+                'value_size': len(self.value),
+                'target_rate': self.target_rate,
+                'mode': 'open-loop' if self.target_rate else 'closed-loop'
+            },
+            'elapsed': elapsed,
+            'operations': total.count,
+            'throughput': total.count / elapsed if elapsed > 0 else 0.0,
+            'errors': sum(errors.values()),
+            'latency': total.summary(),
+            'per_operation': {
+                op: {'latency': latency[op].summary(),
+                     'service_time': service[op].summary(),
+                     'errors': errors[op],
+                     'histogram': latency[op].to_dict()}
+                for op in ops
+            }
+        }
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Relative change of throughput and latency percentiles between two runs"""
+    def change(old, new):
+        return (new - old) / old if old else None
+
+    result = {'throughput': change(baseline['throughput'], current['throughput'])}
+    for name in ('p50', 'p99', 'p999'):
+        result[name] = change(baseline['latency'][name], current['latency'][name])
+    return result
 
 class BenchmarkResults:
     def __init__(self):
         self.latencies: List[float] = []
+        self.histogram = LatencyHistogram()
         self.operations_per_second = 0
         self.success_rate = 0.0
         self.total_operations = 0
@@ -14,6 +356,7 @@ class BenchmarkResults:
 
     def add_latency(self, latency: float):
         self.latencies.append(latency)
+        self.histogram.record(latency)
 
     def calculate_statistics(self) -> Dict[str, Any]:
         return {
@@ -21,7 +364,9 @@ class BenchmarkResults:
             'max_latency': max(self.latencies) if self.latencies else 0,
             'avg_latency': statistics.mean(self.latencies) if self.latencies else 0,
             'median_latency': statistics.median(self.latencies) if self.latencies else 0,
-            'p95_latency': statistics.quantiles(self.latencies, n=20)[18] if self.latencies else 0,
+            'p95_latency': self.histogram.percentile(95),
+            'p99_latency': self.histogram.percentile(99),
+            'p999_latency': self.histogram.percentile(99.9),
             'operations_per_second': self.operations_per_second,
             'success_rate': self.success_rate,
             'total_operations': self.total_operations,
@@ -29,75 +374,109 @@ class BenchmarkResults:
         }
 
 class KeyValueStoreBenchmark:
+    """PUT/GET/DELETE round trips over per-thread keep-alive sessions"""
+
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url
         self.results = BenchmarkResults()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
 
     def run_single_operation(self, operation: str, key: str, value: str = None) -> float:
-        start_time = time.time()
+        start_time = time.perf_counter()
+        session = self._session()
         try:
             if operation == "PUT":
-                response = requests.put(
+                response = session.put(
                     f"{self.base_url}/kv/{key}",
                     json={"value": value}
                 )
             elif operation == "GET":
-                response = requests.get(f"{self.base_url}/kv/{key}")
+                response = session.get(f"{self.base_url}/kv/{key}")
             elif operation == "DELETE":
-                response = requests.delete(f"{self.base_url}/kv/{key}")
+                response = session.delete(f"{self.base_url}/kv/{key}")
             else:
                 raise ValueError(f"Unknown operation: {operation}")
 
             if response.status_code not in [200, 201]:
-                self.results.failed_operations += 1
+                with self._lock:
+                    self.results.failed_operations += 1
                 return 0
 
-            return time.time() - start_time
-        except Exception:
-            self.results.failed_operations += 1
+            return time.perf_counter() - start_time
+        except requests.RequestException:
+            with self._lock:
+                self.results.failed_operations += 1
             return 0
 
+    def run_key_lifecycle(self, key: str, value: str) -> List[float]:
+        # PUT, GET and DELETE of one key run in order so they cannot race
+        return [self.run_single_operation("PUT", key, value),
+                self.run_single_operation("GET", key),
+                self.run_single_operation("DELETE", key)]
+
     def run_concurrent_operations(self, num_operations: int, num_threads: int = 10):
-        start_time = time.time()
+        start_time = time.perf_counter()
         self.results = BenchmarkResults()
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
-            futures = []
-            for i in range(num_operations):
-                key = f"key_{i}"
-                value = f"value_{i}"
-                
-                # Create operations
-                futures.append(
-                    executor.submit(self.run_single_operation, "PUT", key, value)
-                )
-                # Read operations
-                futures.append(
-                    executor.submit(self.run_single_operation, "GET", key)
-                )
-                # Delete operations
-                futures.append(
-                    executor.submit(self.run_single_operation, "DELETE", key)
-                )
+            futures = [executor.submit(self.run_key_lifecycle, f"key_{i}", f"value_{i}")
+                       for i in range(num_operations)]
 
             for future in concurrent.futures.as_completed(futures):
-                latency = future.result()
-                if latency > 0:
-                    self.results.add_latency(latency)
+                for latency in future.result():
+                    if latency > 0:
+                        self.results.add_latency(latency)
 
-        total_time = time.time() - start_time
-        self.results.total_operations = num_operations * 3  
+        total_time = time.perf_counter() - start_time
+        self.results.total_operations = num_operations * 3
         self.results.operations_per_second = self.results.total_operations / total_time
         self.results.success_rate = (self.results.total_operations - self.results.failed_operations) / self.results.total_operations * 100
 
         return self.results.calculate_statistics()
 
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load generator for the key-value store")
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--workload', default='read-heavy', choices=sorted(WORKLOADS))
+    parser.add_argument('--distribution', default='zipfian', choices=sorted(KEY_DISTRIBUTIONS))
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--value-size', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--operations', type=int, help="stop after this many requests")
+    parser.add_argument('--rate', type=float, help="open-loop arrival rate in requests/s")
+    parser.add_argument('--skip-load', action='store_true', help="reuse records already loaded")
+    parser.add_argument('--output', help="write the JSON results to this file")
+    parser.add_argument('--compare', help="baseline JSON results to compare against")
+    parser.add_argument('--legacy', type=int, metavar='N',
+                        help="run the old PUT/GET/DELETE benchmark with N keys instead")
+    args = parser.parse_args(argv)
+
+    if args.legacy:
+        results = KeyValueStoreBenchmark(args.url).run_concurrent_operations(args.legacy,
+                                                                              args.threads)
+    else:
+        generator = LoadGenerator(args.url, args.workload, args.records, args.threads,
+                                  args.distribution, args.value_size, args.rate)
+        if not args.skip_load:
+            generator.load()
+        results = generator.run(args.duration, args.operations)
+        if args.compare:
+            with open(args.compare) as f:
+                results['comparison'] = compare_results(json.load(f), results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    summary = {key: value for key, value in results.items() if key != 'per_operation'}
+    print(json.dumps(summary, indent=2))
+
 if __name__ == "__main__":
-    benchmark = KeyValueStoreBenchmark()
-    results = benchmark.run_concurrent_operations(1000)  # Run 1000 sets operations
-    print("Benchmark Results:")
-    for key, value in results.items():
-        if 'latency' in key:
-            print(f"{key}: {value:.3f} seconds")
-        else:
-            print(f"{key}: {value:.2f}")
\ No newline at end of file
+    main()
@@ -1,7 +1,4 @@
-from src.app import create_app
-import os
+from src.app import main
 
 if __name__ == "__main__":
-    app = create_app()
-    port = int(os.getenv('PORT', '8000'))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    main()
@@ -1,8 +1,10 @@
 from src.api.routes import api
+from src.api.resp import RespServer
 from src.api.schemas import KeyValuePair, NodeInfo
 
 __all__ = [
     'api',
+    'RespServer',
     'KeyValuePair',
     'NodeInfo'
 ]
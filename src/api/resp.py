@@ -0,0 +1,475 @@
+# src/api/resp.py
+import asyncio
+import collections
+import json
+import threading
+import time
+from typing import Any, Deque, List, Optional, Tuple
+from urllib.parse import urlsplit
+import logging
+from src.store.codec import decode_value, to_wire
+
+logger = logging.getLogger(__name__)
+
+MAX_BULK_LENGTH = 64 * 1024 * 1024
+MAX_ARGUMENTS = 1024 * 1024
+MAX_INLINE_LENGTH = 64 * 1024
+
+class ProtocolError(Exception):
+    pass
+
+class CommandError(Exception):
+    pass
+
+def _decode(data: bytes) -> str:
+    # surrogateescape keeps arbitrary bytes round-trippable through str values
+    return data.decode('utf-8', 'surrogateescape')
+
+def _encode(text: str) -> bytes:
+    return text.encode('utf-8', 'surrogateescape')
+
+def _integer_arg(data: bytes) -> int:
+    try:
+        return int(data)
+    except ValueError:
+        raise CommandError('value is not an integer or out of range')
+
+def parse_command(buffer: bytearray, pos: int = 0) -> Optional[Tuple[List[bytes], int]]:
+    """Parse one command starting at ``pos``.
+
+    Returns the arguments and the offset just past them, or None when the
+    buffer does not hold a complete command yet. Both RESP arrays of bulk
+    strings and whitespace separated inline commands are accepted.
+    """
+    if pos >= len(buffer):
+        return None
+    if buffer[pos] != ord('*'):
+        end = buffer.find(b'\r\n', pos)
+        if end < 0:
+            if len(buffer) - pos > MAX_INLINE_LENGTH:
+                raise ProtocolError('inline command too long')
+            return None
+        return bytes(buffer[pos:end]).split(), end + 2
+
+    end = buffer.find(b'\r\n', pos)
+    if end < 0:
+        return None
+    try:
+        count = int(buffer[pos + 1:end])
+    except ValueError:
+        raise ProtocolError('invalid multibulk length')
+    if count > MAX_ARGUMENTS:
+        raise ProtocolError('invalid multibulk length')
+    pos = end + 2
+    args = []
+    for _ in range(max(count, 0)):
+        end = buffer.find(b'\r\n', pos)
+        if end < 0:
+            return None
+        if buffer[pos] != ord('$'):
+            raise ProtocolError(f"expected '$', got '{chr(buffer[pos])}'")
+        try:
+            length = int(buffer[pos + 1:end])
+        except ValueError:
+            raise ProtocolError('invalid bulk length')
+        if length < 0 or length > MAX_BULK_LENGTH:
+            raise ProtocolError('invalid bulk length')
+        start = end + 2
+        if len(buffer) < start + length + 2:
+            return None
+        args.append(bytes(buffer[start:start + length]))
+        pos = start + length + 2
+    return args, pos
+
+class SimpleString(str):
+    """A status reply such as ``+OK``, as opposed to a bulk string"""
+
+def encode_reply(value: Any) -> bytes:
+    """Serialize a command result as a RESP reply"""
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, bool):
+        return b':1\r\n' if value else b':0\r\n'
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, (bytes, bytearray)):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    if isinstance(value, SimpleString):
+        return b'+' + _encode(value) + b'\r\n'
+    if isinstance(value, str):
+        return encode_reply(_encode(value))
+    if isinstance(value, list):
+        return b'*%d\r\n' % len(value) + b''.join(encode_reply(item) for item in value)
+    # Values written through the REST API may be any JSON document
+    return encode_reply(json.dumps(value))
+
+def _bulk(value: Any) -> Any:
+    """Reply form of a stored value: GET always answers with a bulk string"""
+    if value is None or isinstance(value, (str, bytes, bytearray)):
+        return value
+    return json.dumps(value)
+
+def _error_reply(error: Exception) -> bytes:
+    message = str(error).replace('\r', ' ').replace('\n', ' ')
+    if not message.split(' ', 1)[0].isupper():
+        message = f"ERR {message}"
+    return b'-' + _encode(message) + b'\r\n'
+
+def _arity_error(name: str) -> CommandError:
+    return CommandError(f"wrong number of arguments for '{name.lower()}' command")
+
+OK = SimpleString('OK')
+PONG = SimpleString('PONG')
+
+class RespConnection(asyncio.Protocol):
+    """One client connection.
+
+    Commands are parsed as they arrive and executed in order. Every reply
+    produced by one read is written back with a single ``write`` call, so a
+    pipelined client pays one syscall per batch rather than per command.
+    Writes that may wait on the WAL run in the default executor; commands
+    behind them wait, which keeps replies in request order.
+    """
+
+    def __init__(self, server: 'RespServer'):
+        self.server = server
+        self.transport: Optional[asyncio.Transport] = None
+        self._buffer = bytearray()
+        self._commands: Deque[List[bytes]] = collections.deque()
+        self._blocked = False
+        self._closing = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections += 1
+
+    def connection_lost(self, exc):
+        self.server.connections -= 1
+        self._closing = True
+
+    def pause_writing(self):
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.transport.resume_reading()
+
+    def data_received(self, data: bytes):
+        self._buffer += data
+        pos = 0
+        try:
+            while True:
+                parsed = parse_command(self._buffer, pos)
+                if parsed is None:
+                    break
+                args, pos = parsed
+                if args:
+                    self._commands.append(args)
+        except ProtocolError as e:
+            self.transport.write(_error_reply(CommandError(f"Protocol error: {e}")))
+            self.transport.close()
+            self._closing = True
+            return
+        del self._buffer[:pos]
+        if not self._blocked:
+            self._process()
+
+    def _process(self):
+        replies = []
+        while self._commands and not self._closing:
+            args = self._commands.popleft()
+            name = _decode(args[0]).upper()
+            if name == 'QUIT':
+                replies.append(encode_reply(OK))
+                self._closing = True
+                break
+            if self.server.offload(name):
+                self._blocked = True
+                future = asyncio.get_running_loop().run_in_executor(
+                    None, self.server.execute, name, args[1:])
+                future.add_done_callback(self._resume)
+                break
+            replies.append(self.server.execute(name, args[1:]))
+        if replies:
+            self.transport.write(b''.join(replies))
+        if self._closing:
+            self.transport.close()
+
+    def _resume(self, future: asyncio.Future):
+        self._blocked = False
+        if self._closing:
+            return
+        try:
+            reply = future.result()
+        except Exception as e:
+            logger.exception("Offloaded RESP command failed")
+            reply = _error_reply(e)
+        self.transport.write(reply)
+        # Carry on with the commands pipelined behind it
+        self._process()
+
+class RespServer:
+    """Asyncio TCP front-end speaking a Redis-compatible subset of RESP.
+
+    It serves the same ``DistributedStore`` as the REST blueprint and runs its
+    own event loop in a background thread. Writes are replicated through the
+    cluster's asynchronous pipeline, i.e. with consistency ONE. When keys are
+    partitioned, commands on keys this node does not own fail with
+    ``MOVED <host>:<port>``: the owner's host from its node address and
+    ``peer_port``, the RESP port every node is expected to share.
+    """
+
+    WRITE_COMMANDS = frozenset(('SET', 'DEL', 'MSET', 'INCR', 'INCRBY', 'DECR', 'DECRBY'))
+
+    # Minimum and maximum argument counts; None for no maximum
+    ARITY = {
+        'PING': (0, 1), 'ECHO': (1, 1), 'COMMAND': (0, None), 'DBSIZE': (0, 0),
+        'INFO': (0, 0), 'GET': (1, 1), 'MGET': (1, None), 'EXISTS': (1, None),
+        'TTL': (1, 1), 'SET': (2, None), 'MSET': (2, None), 'INCR': (1, 1),
+        'DECR': (1, 1), 'INCRBY': (2, 2), 'DECRBY': (2, 2), 'DEL': (1, None)
+    }
+
+    def __init__(self, store, host: str = '0.0.0.0', port: int = 6380, cluster=None,
+                 peer_port: Optional[int] = None):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.peer_port = peer_port if peer_port is not None else port
+        self.cluster = cluster
+        self.connections = 0
+        self.commands = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def start(self):
+        """Start serving in a background thread, returning once listening"""
+        self._thread = threading.Thread(target=self._run, name='resp-server')
+        self._thread.daemon = True
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        """Close the listening socket and stop the event loop"""
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(self._loop.create_server(
+                lambda: RespConnection(self), self.host, self.port, reuse_address=True))
+            self.port = self._server.sockets[0].getsockname()[1]
+        except OSError as e:
+            self._error = e
+            self._ready.set()
+            return
+        logger.info(f"RESP server listening on {self.host}:{self.port}")
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+    def offload(self, name: str) -> bool:
+        """Whether a command may block on disk and must leave the event loop"""
+        return name in self.WRITE_COMMANDS and self.store.is_persistent
+
+    def execute(self, name: str, args: List[bytes]) -> bytes:
+        """Run one command and return its encoded reply"""
+        self.commands += 1
+        arity = self.ARITY.get(name)
+        if arity is None:
+            return _error_reply(CommandError(f"unknown command '{name}'"))
+        low, high = arity
+        if len(args) < low or (high is not None and len(args) > high):
+            return _error_reply(_arity_error(name))
+        try:
+            return encode_reply(getattr(self, f"_cmd_{name.lower()}")(*args))
+        except (CommandError, ValueError) as e:
+            return _error_reply(e)
+        except Exception as e:
+            logger.exception(f"RESP command {name} failed")
+            return _error_reply(e)
+
+    def resp_address(self, node: str) -> str:
+        """The RESP host:port of a node, given its HTTP node address"""
+        host = urlsplit(node).hostname or node
+        if ':' in host:
+            host = f"[{host}]"
+        return f"{host}:{self.peer_port}"
+
+    def _check_owner(self, keys: List[str]):
+        cluster = self.cluster
+        if cluster is None or not cluster.is_partitioned:
+            return
+        for key in keys:
+            if not cluster.is_owner(key):
+                raise CommandError(f"MOVED {self.resp_address(cluster.owners(key)[0])}")
+
+    def _replicate(self, keys: List[str], operation: str):
+        if self.cluster is None:
+            return
+        updates = []
+        now = time.time()
+        for key in keys:
+            if operation == 'delete':
+                # Versioned by the tombstone so replicas can order the delete
+                version, timestamp = self.store.get_tombstone(key) or (None, now)
+                updates.append({'key': key, 'value': None, 'operation': operation,
+                                'version': version, 'timestamp': timestamp,
+                                'expires_at': None})
+                continue
+            entry = self.store.get_entry(key)
+            updates.append({'key': key, 'value': to_wire(entry.value) if entry else None,
+                            'operation': operation,
+                            'version': entry.version if entry else None,
+                            'timestamp': entry.timestamp if entry else now,
+                            'expires_at': entry.expires_at if entry else None})
+        self.cluster.broadcast_updates(updates)
+
+    def _cmd_ping(self, message: Optional[bytes] = None):
+        return PONG if message is None else message
+
+    def _cmd_echo(self, message: bytes):
+        return message
+
+    def _cmd_command(self, *args):
+        return []
+
+    def _cmd_dbsize(self):
+        return len(self.store)
+
+    def _cmd_info(self):
+        stats = dict(self.store.stats(), connections=self.connections,
+                     commands_processed=self.commands)
+        return ''.join(f"{name}:{value}\r\n" for name, value in stats.items())
+
+    def _cmd_get(self, key: bytes):
+        key = _decode(key)
+        self._check_owner([key])
+        return _bulk(self.store.read(key))
+
+    def _cmd_mget(self, first: bytes, *rest: bytes):
+        keys = [_decode(key) for key in (first,) + rest]
+        self._check_owner(keys)
+        return [_bulk(value) for value in self.store.read_many(keys).values()]
+
+    def _cmd_exists(self, first: bytes, *rest: bytes):
+        keys = [_decode(key) for key in (first,) + rest]
+        self._check_owner(keys)
+        return sum(1 for key in keys if self.store.get_entry(key) is not None)
+
+    def _cmd_ttl(self, key: bytes):
+        key = _decode(key)
+        self._check_owner([key])
+        entry = self.store.get_entry(key)
+        if entry is None:
+            return -2
+        if entry.expires_at is None:
+            return -1
+        return max(0, round(entry.expires_at - time.time()))
+
+    def _cmd_set(self, key: bytes, value: bytes, *options: bytes):
+        key, value = _decode(key), _decode(value)
+        ttl, mode = None, None
+        options = [_decode(option).upper() for option in options]
+        index = 0
+        while index < len(options):
+            option = options[index]
+            if option in ('NX', 'XX') and mode is None:
+                mode = option
+            elif option in ('EX', 'PX') and ttl is None and index + 1 < len(options):
+                index += 1
+                try:
+                    ttl = int(options[index])
+                except ValueError:
+                    raise CommandError('value is not an integer or out of range')
+                if ttl <= 0:
+                    raise CommandError("invalid expire time in 'set' command")
+                if option == 'PX':
+                    ttl = ttl / 1000.0
+            else:
+                raise CommandError('syntax error')
+            index += 1
+        self._check_owner([key])
+
+        if mode == 'NX':
+            written, operation = self.store.create(key, value, ttl=ttl), 'create'
+        elif mode == 'XX':
+            written, operation = self.store.update(key, value, ttl=ttl), 'update'
+        else:
+            operation = 'update'
+            written = self.store.update(key, value, ttl=ttl)
+            if not written:
+                written, operation = self.store.create(key, value, ttl=ttl), 'create'
+            if not written:
+                # Created concurrently between the two calls
+                written = self.store.update(key, value, ttl=ttl)
+                operation = 'update'
+        if not written:
+            return None
+        self._replicate([key], operation)
+        return OK
+
+    def _cmd_mset(self, *args: bytes):
+        if len(args) % 2:
+            raise _arity_error('MSET')
+        items = {_decode(args[i]): _decode(args[i + 1]) for i in range(0, len(args), 2)}
+        self._check_owner(list(items))
+        self.store.put_many(items, overwrite=True)
+        self._replicate(list(items), 'update')
+        return OK
+
+    def _add(self, key: bytes, delta: int) -> int:
+        key = _decode(key)
+        self._check_owner([key])
+
+        # Counters are stored as integers, as REST /incr keeps them; a
+        # string SET through RESP is accepted if it parses as one
+        def transform(current):
+            if current is None:
+                return delta
+            if isinstance(current, int) and not isinstance(current, bool):
+                return current + delta
+            try:
+                return int(current) + delta
+            except (TypeError, ValueError):
+                raise CommandError('value is not an integer or out of range')
+        entry = self.store.modify(key, transform, create=True)
+        self._replicate([key], 'update')
+        return decode_value(entry.value)
+
+    def _cmd_incr(self, key: bytes):
+        return self._add(key, 1)
+
+    def _cmd_decr(self, key: bytes):
+        return self._add(key, -1)
+
+    def _cmd_incrby(self, key: bytes, delta: bytes):
+        return self._add(key, _integer_arg(delta))
+
+    def _cmd_decrby(self, key: bytes, delta: bytes):
+        return self._add(key, -_integer_arg(delta))
+
+    def _cmd_del(self, first: bytes, *rest: bytes):
+        keys = [_decode(key) for key in (first,) + rest]
+        self._check_owner(keys)
+        deleted = [key for key, removed in self.store.delete_many(keys).items() if removed]
+        self._replicate(deleted, 'delete')
+        return len(deleted)
+
+    def stats(self):
+        return {
+            'port': self.port,
+            'connections': self.connections,
+            'commands': self.commands
+        }
@@ -1,34 +1,906 @@
-from flask import Blueprint, request, jsonify, current_app
-from src.store.store import DistributedStore
+from flask import Blueprint, Response, request, jsonify, current_app, g
+from src.store.store import DistributedStore, make_etag
+from src.store.codec import decode_value, to_wire, from_wire
+from src.store.atomic import IncompatibleValueError, increment, append, merge_fields
+from src.metrics import REGISTRY, render_samples
+from src.profiling import TRACER, PROFILER, MAX_PROFILE_SECONDS
+from src.network.cluster import FORWARDED_HEADER
+from src.store.consistency import ConsistencyLevel, ReadResult, ConsistencyManager
+import json
+import time
+import base64
+from urllib.parse import quote
 
 api = Blueprint('api', __name__)
 store = DistributedStore()
 
+# Endpoints that need the in-process store or a cluster. A SharedStore
+# serves a standalone node, so its app is built without them.
+IN_PROCESS_ENDPOINTS = frozenset(f'api.{name}' for name in (
+    'scan', 'watch', 'snapshot', 'sync', 'read_replica', 'merkle_nodes', 'merkle_leaves',
+    'heartbeat', 'ping_req', 'cluster_members', 'ring_info', 'replication_stats',
+    'hint_stats'))
+
+def use_store(new_store):
+    """Serve ``new_store``, e.g. a SharedStore, instead of the in-process store"""
+    global store
+    store = new_store
+
+REQUEST_LATENCY = REGISTRY.histogram('kv_http_request_duration_seconds',
+                                     'Latency of HTTP requests by route', ['route', 'method'])
+REQUESTS = REGISTRY.counter('kv_http_requests_total',
+                            'HTTP requests by route and status', ['route', 'method', 'status'])
+
+@api.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+    TRACER.begin(request.url_rule.rule if request.url_rule else 'unmatched', request.method)
+
+@api.after_request
+def _record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.labels(route, request.method).observe(time.perf_counter() - start)
+        REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+    TRACER.finish(response.status_code)
+    return response
+
+@api.errorhandler(MemoryError)
+def _insufficient_storage(error):
+    return jsonify({'error': str(error) or 'Out of memory'}), 507
+
+def _consistency_level() -> ConsistencyLevel:
+    return ConsistencyLevel.parse(request.args.get('consistency'), ConsistencyLevel.ONE)
+
+MAX_BATCH_SIZE = 1000
+BINARY_MIMETYPE = 'application/octet-stream'
+DEFAULT_SCAN_LIMIT = 1000
+MAX_SCAN_LIMIT = 10000
+DEFAULT_SNAPSHOT_CHUNK = 1000
+MAX_SNAPSHOT_CHUNK = 10000
+DEFAULT_WATCH_TIMEOUT = 30.0
+MAX_WATCH_TIMEOUT = 300.0
+MAX_WATCH_EVENTS = 1000
+SSE_KEEPALIVE = 15.0
+
+def _replicate(key, value, operation, level, version=None, expires_at=None):
+    """Replicate a local write, returning an error response if acks fall short"""
+    return _replicate_batch([{'key': key, 'value': value, 'operation': operation,
+                              'version': version, 'expires_at': expires_at}], level)
+
+def _delete_update(key):
+    """Replication update for a deleted key, versioned by its tombstone if kept"""
+    version, timestamp = store.get_tombstone(key) or (None, None)
+    return {'key': key, 'value': None, 'operation': 'delete',
+            'version': version, 'timestamp': timestamp}
+
+def _client_value(value):
+    """Decode a stored value for a JSON response; raw bytes go as base64"""
+    value = decode_value(value)
+    if isinstance(value, (bytes, bytearray)):
+        return {'__b64__': base64.b64encode(value).decode('ascii')}
+    return value
+
+def _ttl_arg(payload):
+    """Return the optional ttl (seconds) from a request body"""
+    ttl = payload.get('ttl')
+    if ttl is not None and (isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl <= 0):
+        raise ValueError('ttl must be a positive number of seconds')
+    return ttl
+
+def _replicate_batch(updates, level):
+    cluster = current_app.cluster
+    if not cluster or not updates:
+        return None
+    required = cluster.consistency_manager().get_required_acks(level)
+    with TRACER.span('replicate'):
+        result = cluster.write_batch(updates, required,
+                                     timeout=request.args.get('timeout', type=float))
+    if not result.success:
+        return jsonify({'error': 'Consistency level not met',
+                        'acks': result.ack_count, 'required': required}), 504
+    return None
+
+_FORWARDED_REQUEST_HEADERS = ('Content-Type', 'If-Match', 'If-None-Match')
+
+def _precondition_failed():
+    return jsonify({'error': 'Precondition failed'}), 412
+
+def _expected_etag(key):
+    """Resolve If-Match to the current entry's ETag, or None if it cannot match.
+
+    The store re-checks the returned tag under the shard lock, so a write
+    that lands in between still fails the precondition.
+    """
+    entry = store.get_entry(key)
+    if entry is None:
+        return None
+    etag = entry.etag()
+    if request.if_match.star_tag or request.if_match.contains(etag):
+        return etag
+    return None
+
+def _forward_path():
+    """The request path and query, with the path re-quoted as sent"""
+    # request.path is decoded, so a key holding '?' or '%' would change meaning
+    query = request.query_string.decode('latin-1')
+    return quote(request.path, safe='/') + ('?' + query if query else '')
+
+def _forward_if_not_owner(key):
+    """Proxy the request to an owner when this node does not hold ``key``"""
+    cluster = current_app.cluster
+    if not cluster or request.headers.get(FORWARDED_HEADER) or cluster.is_owner(key):
+        return None
+    headers = {name: request.headers[name] for name in _FORWARDED_REQUEST_HEADERS
+               if name in request.headers}
+    response = cluster.forward(request.method, cluster.replica_peers(key),
+                               _forward_path(), request.get_data(), headers)
+    if response is None:
+        return jsonify({'error': 'No owner reachable'}), 503
+    forwarded = Response(response.content, status=response.status_code,
+                         content_type=response.headers.get('Content-Type'))
+    if 'ETag' in response.headers:
+        forwarded.headers['ETag'] = response.headers['ETag']
+    return forwarded
+
+def _split_by_owner(keys):
+    """Split batch keys into locally owned ones and groups per remote primary owner"""
+    cluster = current_app.cluster
+    if not cluster or request.headers.get(FORWARDED_HEADER) or not cluster.is_partitioned:
+        return list(keys), {}
+    local, remote = [], {}
+    for key in keys:
+        if cluster.is_owner(key):
+            local.append(key)
+        else:
+            remote.setdefault(cluster.owners(key)[0], []).append(key)
+    return local, remote
+
+def _forward_batch(remote, build_payload):
+    """Send each remote group to its owner and collect the per-key results"""
+    results = {}
+    for owner, keys in remote.items():
+        response = current_app.cluster.forward(
+            'POST', [owner], _forward_path(), json.dumps(build_payload(keys)),
+            {'Content-Type': 'application/json'})
+        if response is not None and response.status_code == 200:
+            results.update(response.json()['results'])
+        else:
+            results.update({key: {'status': 'unavailable'} for key in keys})
+    return results
+
 @api.route('/kv/<key>', methods=['PUT'])
 def create(key):
-    value = request.json.get('value')
+    forwarded = _forward_if_not_owner(key)
+    if forwarded is not None:
+        return forwarded
+    # Binary bodies are stored as raw bytes, with the TTL in the query string
+    with TRACER.span('parse'):
+        if request.mimetype == BINARY_MIMETYPE:
+            value = request.get_data()
+            options = {'ttl': request.args.get('ttl', type=float)}
+        else:
+            value = request.json.get('value')
+            options = request.json
     if value is None:
         return jsonify({'error': 'Value is required'}), 400
-    
-    success = store.create(key, value)
-    if success:
-        if current_app.cluster:
-            current_app.cluster.broadcast_update(key, value, 'create')
-        return jsonify({'status': 'created'}), 201
-    return jsonify({'error': 'Key already exists'}), 409
+    try:
+        level = _consistency_level()
+        ttl = _ttl_arg(options)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # If-Match turns the create into an update of that exact version
+    with TRACER.span('store'):
+        if request.if_match:
+            expected = _expected_etag(key)
+            written = expected is not None and \
+                store.update(key, value, ttl=ttl, if_match=expected)
+            operation, status, code = 'update', 'updated', 200
+        else:
+            written = store.create(key, value, ttl=ttl)
+            operation, status, code = 'create', 'created', 201
+        entry = store.get_entry(key) if written else None
+    if not written:
+        if request.if_match:
+            return _precondition_failed()
+        return jsonify({'error': 'Key already exists'}), 409
+
+    # Replicas get the value as stored, so it is not re-encoded at every hop.
+    # A write already deleted again has nothing left to send; the delete
+    # replicates itself.
+    if entry is not None:
+        error = _replicate(key, to_wire(entry.value), operation, level,
+                           version=entry.version, expires_at=entry.expires_at)
+        if error:
+            return error
+    with TRACER.span('serialize'):
+        response = jsonify({'status': status})
+        if entry is not None:
+            response.set_etag(entry.etag())
+    return response, code
 
 @api.route('/kv/<key>', methods=['GET'])
 def read(key):
-    value = store.read(key)
-    if value is None:
+    forwarded = _forward_if_not_owner(key)
+    if forwarded is not None:
+        return forwarded
+    try:
+        level = _consistency_level()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if level == ConsistencyLevel.ONE or not current_app.cluster:
+        with TRACER.span('store'):
+            entry = store.read_entry(key)
+        if entry is None:
+            return jsonify({'error': 'Key not found'}), 404
+        # The tag is checked before the value is touched or serialized
+        etag = entry.etag()
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+        with TRACER.span('serialize'):
+            response = _value_response(decode_value(entry.value))
+            response.set_etag(etag)
+        return response, 200
+
+    cluster = current_app.cluster
+    local = ReadResult()
+    local.node_id = cluster.node_address
+    entry = store.get_entry(key)
+    if entry is not None:
+        local.value, local.version, local.timestamp = entry.value, entry.version, entry.timestamp
+    required = cluster.consistency_manager().get_required_acks(level)
+    results = cluster.read(key, local, required, timeout=request.args.get('timeout', type=float))
+    if len(results) < required:
+        return jsonify({'error': 'Consistency level not met',
+                        'acks': len(results), 'required': required}), 504
+
+    latest = ConsistencyManager.select_latest(results)
+    if latest is None:
         return jsonify({'error': 'Key not found'}), 404
-    return jsonify({'value': value}), 200
+    etag = make_etag(latest.version, latest.timestamp)
+    if request.if_none_match.contains_weak(etag):
+        return _not_modified(etag)
+    response = _value_response(decode_value(latest.value), latest.version)
+    response.set_etag(etag)
+    return response, 200
+
+def _value_response(value, version=None):
+    if isinstance(value, (bytes, bytearray)):
+        return Response(bytes(value), mimetype=BINARY_MIMETYPE)
+    if version is None:
+        return jsonify({'value': value})
+    return jsonify({'value': value, 'version': version})
+
+def _not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
 
 @api.route('/kv/<key>', methods=['DELETE'])
 def delete(key):
-    success = store.delete(key)
+    forwarded = _forward_if_not_owner(key)
+    if forwarded is not None:
+        return forwarded
+    try:
+        level = _consistency_level()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    with TRACER.span('store'):
+        if request.if_match:
+            expected = _expected_etag(key)
+            success = expected is not None and store.delete(key, if_match=expected)
+        else:
+            success = store.delete(key)
+    if not success and request.if_match:
+        return _precondition_failed()
     if success:
-        if current_app.cluster:
-            current_app.cluster.broadcast_update(key, None, 'delete')
+        error = _replicate_batch([_delete_update(key)], level)
+        if error:
+            return error
         return jsonify({'status': 'deleted'}), 200
     return jsonify({'error': 'Key not found'}), 404
+
+def _atomic_payload():
+    """Parse the body of an atomic operation, returning (payload, level, ttl)"""
+    with TRACER.span('parse'):
+        payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        raise ValueError('A JSON object is required')
+    return payload, _consistency_level(), _ttl_arg(payload)
+
+def _atomic_response(key, entry, level, body):
+    """Replicate the entry an atomic operation wrote as one versioned update"""
+    error = _replicate(key, to_wire(entry.value), 'update', level,
+                       version=entry.version, expires_at=entry.expires_at)
+    if error:
+        return error
+    with TRACER.span('serialize'):
+        body['version'] = entry.version
+        response = jsonify(body)
+        response.set_etag(entry.etag())
+    return response, 200
+
+@api.route('/kv/<key>/cas', methods=['POST'])
+def compare_and_swap(key):
+    forwarded = _forward_if_not_owner(key)
+    if forwarded is not None:
+        return forwarded
+    try:
+        payload, level, ttl = _atomic_payload()
+        expected = payload.get('version')
+        if isinstance(expected, bool) or not isinstance(expected, int) or expected < 0:
+            raise ValueError('version must be a non-negative integer')
+        if payload.get('value') is None:
+            raise ValueError('Value is required')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    with TRACER.span('store'):
+        swapped, entry = store.compare_and_swap(key, expected, payload['value'], ttl=ttl)
+    if not swapped:
+        return jsonify({'error': 'Version mismatch',
+                        'version': entry.version if entry is not None else 0}), 412
+    return _atomic_response(key, entry, level, {'status': 'swapped'})
+
+def _modify(key, build_transform, respond):
+    """Apply an atomic transform, creating the key if needed"""
+    forwarded = _forward_if_not_owner(key)
+    if forwarded is not None:
+        return forwarded
+    try:
+        payload, level, ttl = _atomic_payload()
+        transform = build_transform(payload)
+        with TRACER.span('store'):
+            entry = store.modify(key, transform, create=True, ttl=ttl)
+    except IncompatibleValueError as e:
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return _atomic_response(key, entry, level, respond(decode_value(entry.value)))
+
+def _increment(payload, sign=1):
+    delta = payload.get('delta', 1)
+    if isinstance(delta, bool) or not isinstance(delta, int):
+        raise ValueError('delta must be an integer')
+    return increment(sign * delta, payload.get('initial', 0))
+
+def _append(payload):
+    values = payload.get('values')
+    if not isinstance(values, list):
+        raise ValueError('values must be a list')
+    return append(values)
+
+@api.route('/kv/<key>/incr', methods=['POST'])
+def incr(key):
+    return _modify(key, _increment, lambda value: {'value': value})
+
+@api.route('/kv/<key>/decr', methods=['POST'])
+def decr(key):
+    return _modify(key, lambda payload: _increment(payload, -1),
+                   lambda value: {'value': value})
+
+@api.route('/kv/<key>/append', methods=['POST'])
+def append_values(key):
+    return _modify(key, _append, lambda value: {'length': len(value)})
+
+@api.route('/kv/<key>/merge', methods=['POST'])
+def merge_values(key):
+    return _modify(key, lambda payload: merge_fields(payload.get('fields')),
+                   lambda value: {'value': value})
+
+def _batch_payload(field, expected_type):
+    with TRACER.span('parse'):
+        payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get(field), expected_type):
+        return None, (jsonify({'error': f'{field} is required'}), 400)
+    if len(payload[field]) > MAX_BATCH_SIZE:
+        return None, (jsonify({'error': f'Batch exceeds {MAX_BATCH_SIZE} keys'}), 413)
+    return payload, None
+
+@api.route('/mget', methods=['POST'])
+def mget():
+    payload, error = _batch_payload('keys', list)
+    if error:
+        return error
+    keys, remote = _split_by_owner(payload['keys'])
+    results = _forward_batch(remote, lambda keys: {'keys': keys})
+    with TRACER.span('store'):
+        values = store.read_many(keys)
+    with TRACER.span('serialize'):
+        for key, value in values.items():
+            if value is None:
+                results[key] = {'status': 'not_found'}
+            else:
+                results[key] = {'status': 'ok', 'value': _client_value(value)}
+        response = jsonify({'results': results})
+    return response, 200
+
+@api.route('/mput', methods=['POST'])
+def mput():
+    payload, error = _batch_payload('items', dict)
+    if error:
+        return error
+    try:
+        level = _consistency_level()
+        ttl = _ttl_arg(payload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    overwrite = bool(payload.get('overwrite'))
+    keys, remote = _split_by_owner(payload['items'])
+    results = _forward_batch(remote, lambda keys: {
+        'items': {key: payload['items'][key] for key in keys}, 'overwrite': overwrite,
+        'ttl': ttl})
+    items = {key: payload['items'][key] for key in keys if payload['items'][key] is not None}
+    with TRACER.span('store'):
+        statuses = store.put_many(items, overwrite=overwrite, ttl=ttl)
+    results.update({key: {'status': 'invalid'} for key in keys if key not in items})
+    updates = []
+    for key, status in statuses.items():
+        results[key] = {'status': status}
+        entry = store.get_entry(key)
+        if status != 'exists' and entry is not None:
+            updates.append({'key': key, 'value': to_wire(entry.value),
+                            'operation': 'create' if status == 'created' else 'update',
+                            'version': entry.version, 'expires_at': entry.expires_at})
+    error = _replicate_batch(updates, level)
+    if error:
+        return error
+    return jsonify({'results': results}), 200
+
+@api.route('/mdelete', methods=['POST'])
+def mdelete():
+    payload, error = _batch_payload('keys', list)
+    if error:
+        return error
+    try:
+        level = _consistency_level()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    keys, remote = _split_by_owner(payload['keys'])
+    results = _forward_batch(remote, lambda keys: {'keys': keys})
+    updates = []
+    with TRACER.span('store'):
+        deleted_keys = store.delete_many(keys)
+    for key, deleted in deleted_keys.items():
+        results[key] = {'status': 'deleted' if deleted else 'not_found'}
+        if deleted:
+            updates.append(_delete_update(key))
+    error = _replicate_batch(updates, level)
+    if error:
+        return error
+    return jsonify({'results': results}), 200
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    try:
+        return base64.b64decode(cursor.encode('ascii'), altchars=b'-_',
+                                validate=True).decode('utf-8')
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+@api.route('/scan', methods=['GET'])
+def scan():
+    """Stream keys in order as chunked JSON, with a cursor for the next page"""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_SCAN_LIMIT))
+        if not 0 < limit <= MAX_SCAN_LIMIT:
+            raise ValueError(f'limit must be between 1 and {MAX_SCAN_LIMIT}')
+        cursor = request.args.get('cursor')
+        after = _decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    keys_only = request.args.get('keys_only', '').lower() in ('1', 'true')
+    bounds = {'prefix': request.args.get('prefix'), 'start': request.args.get('start'),
+              'end': request.args.get('end'), 'after': after, 'limit': limit + 1}
+
+    # Each page is read from one snapshot, closed once the body is done
+    snapshot = store.snapshot()
+
+    def generate():
+        yield '{"items":['
+        last = None
+        count = 0
+        with snapshot:
+            for key, entry in snapshot.scan(**bounds):
+                if count == limit:
+                    break
+                item = {'key': key} if keys_only else \
+                    {'key': key, 'value': _client_value(entry.value), 'version': entry.version}
+                yield (',' if count else '') + json.dumps(item)
+                last = key
+                count += 1
+            else:
+                last = None
+        yield '],"cursor":' + json.dumps(_encode_cursor(last) if last is not None else None) + '}'
+
+    response = Response(generate(), mimetype='application/json')
+    response.call_on_close(snapshot.close)
+    return response
+
+class _HistoryLost(Exception):
+    """The change feed no longer holds the events a watcher asked for"""
+
+def _watch_filter():
+    key, prefix = request.args.get('key'), request.args.get('prefix')
+    if key is not None:
+        return lambda event: event.key == key
+    if prefix:
+        return lambda event: event.key.startswith(prefix)
+    return lambda event: True
+
+def _event_json(event):
+    data = {'version': event.version, 'key': event.key, 'operation': event.operation,
+            'key_version': event.key_version or event.version}
+    if event.operation in ('create', 'update'):
+        data['value'] = _client_value(event.value)
+    return data
+
+def _next_events(since, matches, limit):
+    """Scan the shared feed past ``since`` for up to ``limit`` matching events.
+
+    Returns the matches and the version to resume from, which moves past
+    non-matching events too so they are not scanned again.
+    """
+    if since > store.changes.last_version:
+        # A version this node never reached, e.g. from before a restart
+        raise _HistoryLost()
+    matched = []
+    while len(matched) < limit:
+        events, complete = store.changes.read(since, MAX_WATCH_EVENTS)
+        if not complete:
+            raise _HistoryLost()
+        for event in events:
+            if matches(event):
+                matched.append(event)
+                if len(matched) == limit:
+                    return matched, event.version
+        if not events:
+            break
+        since = events[-1].version
+    return matched, since
+
+@api.route('/watch', methods=['GET'])
+def watch():
+    """Change feed for a key or prefix, as a long-poll or Server-Sent Events.
+
+    ``since`` (or an SSE ``Last-Event-ID``) resumes after a version. Without
+    it only changes from now on are returned. 410 means the feed has moved
+    past ``since`` and the watcher must re-read the keys it follows.
+    """
+    last_version = store.changes.last_version
+    try:
+        since = request.args.get('since', request.headers.get('Last-Event-ID'))
+        since = int(since) if since is not None else last_version
+        timeout = float(request.args.get('timeout', DEFAULT_WATCH_TIMEOUT))
+        limit = int(request.args.get('limit', 100))
+        if not 0 <= timeout <= MAX_WATCH_TIMEOUT:
+            raise ValueError(f'timeout must be between 0 and {MAX_WATCH_TIMEOUT:.0f}')
+        if not 0 < limit <= MAX_WATCH_EVENTS:
+            raise ValueError(f'limit must be between 1 and {MAX_WATCH_EVENTS}')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    matches = _watch_filter()
+
+    if request.accept_mimetypes.best == 'text/event-stream' or request.args.get('stream') == 'sse':
+        return Response(_sse_stream(since, matches, limit), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    deadline = time.time() + timeout
+    while True:
+        try:
+            events, since = _next_events(since, matches, limit)
+        except _HistoryLost:
+            return jsonify({'error': 'Requested version is no longer in the change feed',
+                            'version': store.changes.last_version}), 410
+        remaining = deadline - time.time()
+        if events or remaining <= 0:
+            return jsonify({'events': [_event_json(event) for event in events],
+                            'version': since}), 200
+        store.changes.wait(since, remaining)
+
+def _sse_stream(since, matches, limit):
+    yield 'retry: 1000\n\n'
+    while True:
+        try:
+            events, since = _next_events(since, matches, limit)
+        except _HistoryLost:
+            since = store.changes.last_version
+            yield f'event: reset\ndata: {json.dumps({"version": since})}\n\n'
+            continue
+        for event in events:
+            yield (f'id: {event.version}\nevent: {event.operation}\n'
+                   f'data: {json.dumps(_event_json(event))}\n\n')
+        if not events and not store.changes.wait(since, SSE_KEEPALIVE):
+            yield ': keepalive\n\n'
+
+@api.route('/replica/<path:key>', methods=['GET'])
+def read_replica(key):
+    entry = store.get_entry(key)
+    if entry is None:
+        return jsonify({'error': 'Key not found'}), 404
+    return jsonify({'value': to_wire(entry.value), 'version': entry.version,
+                    'timestamp': entry.timestamp}), 200
+
+def _apply_sync_update(update):
+    key = update.get('key')
+    if key is None:
+        return False
+    operation = update.get('operation')
+    version = update.get('version')
+    if operation == 'delete':
+        if version is None:
+            return store.delete(key)
+        store.merge_tombstones({key: (version, update.get('timestamp') or time.time())})
+        return True
+    expires_at = update.get('expires_at')
+    value = from_wire(update.get('value'))
+    if version is None:
+        ttl = None
+        if expires_at is not None:
+            ttl = expires_at - time.time()
+            if ttl <= 0:
+                return False
+        return store.create(key, value, ttl) or store.update(key, value, ttl)
+    store.merge({key: (value, version, update.get('timestamp') or time.time(), expires_at)})
+    return True
+
+def apply_sync_updates(updates):
+    """Apply replicated updates to the local store, returning how many took effect"""
+    return sum(1 for update in updates if _apply_sync_update(update))
+
+@api.route('/sync', methods=['POST'])
+def sync():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Invalid sync payload'}), 400
+    # Accept both a batch of updates and a single legacy update
+    updates = payload.get('updates', [payload])
+    bootstrap = getattr(current_app, 'bootstrap', None)
+    if bootstrap is not None and bootstrap.buffer(updates):
+        return jsonify({'status': 'buffered', 'applied': 0}), 200
+    return jsonify({'status': 'ok', 'applied': apply_sync_updates(updates)}), 200
+
+@api.route('/snapshot', methods=['GET'])
+def snapshot():
+    """Stream every entry in key order as newline-delimited JSON chunks.
+
+    The first line carries the store version, each following line a chunk
+    of [key, value, version, timestamp, expires_at] entries and the last
+    line the entry count. ``after`` resumes past a key; ``for_node`` limits
+    the stream to the keys that node will own once it joins the ring.
+    """
+    try:
+        chunk_size = int(request.args.get('chunk_size', DEFAULT_SNAPSHOT_CHUNK))
+        if not 0 < chunk_size <= MAX_SNAPSHOT_CHUNK:
+            raise ValueError(f'chunk_size must be between 1 and {MAX_SNAPSHOT_CHUNK}')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cluster = current_app.cluster
+    key_filter = None
+    for_node = request.args.get('for_node')
+    if for_node and cluster and cluster.replication_factor is not None:
+        ring = cluster.ring.copy()
+        ring.add_node(for_node)
+        key_filter = lambda key: for_node in ring.owners(key, cluster.replication_factor)
+    after = request.args.get('after')
+    # The whole stream reads one snapshot, so the store is sent as it was
+    # at the version in the header
+    snapshot = store.snapshot()
+
+    def generate():
+        with snapshot:
+            yield json.dumps({'version': snapshot.version,
+                              'node': cluster.node_address if cluster else None}) + '\n'
+            count = 0
+            for chunk in store.snapshot_chunks(chunk_size, after, key_filter, snapshot):
+                count += len(chunk)
+                entries = [(key, to_wire(value), *rest) for key, value, *rest in chunk]
+                yield json.dumps({'entries': entries}) + '\n'
+        yield json.dumps({'done': True, 'count': count}) + '\n'
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.call_on_close(snapshot.close)
+    return response
+
+@api.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe; fails while the node is still bootstrapping"""
+    bootstrap = getattr(current_app, 'bootstrap', None)
+    if bootstrap is None:
+        return jsonify({'ready': True}), 200
+    return jsonify({'ready': bootstrap.is_ready, 'bootstrap': bootstrap.stats()}), \
+        200 if bootstrap.is_ready else 503
+
+@api.route('/merkle/nodes', methods=['POST'])
+def merkle_nodes():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('nodes'), list):
+        return jsonify({'error': 'nodes is required'}), 400
+    hashes = store.merkle.node_hashes(payload['nodes'])
+    return jsonify({'depth': store.merkle.depth,
+                    'hashes': {str(node): format(value, 'x') for node, value in hashes.items()}}), 200
+
+@api.route('/merkle/leaves', methods=['POST'])
+def merkle_leaves():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('leaves'), list):
+        return jsonify({'error': 'leaves is required'}), 400
+    if not all(isinstance(leaf, int) and not isinstance(leaf, bool) for leaf in payload['leaves']):
+        return jsonify({'error': 'leaves must be a list of integers'}), 400
+    leaves = [leaf for leaf in payload['leaves'] if 0 <= leaf < store.merkle.leaf_count]
+    # Only keys both nodes replicate are reconciled, so a node never
+    # picks up ranges it does not own
+    cluster = current_app.cluster
+    for_node = payload.get('for_node')
+    shared = (lambda key: cluster.shares(key, for_node)) if cluster and for_node else \
+        (lambda key: True)
+    entries = {key: (to_wire(value), *rest)
+               for key, (value, *rest) in store.get_leaf_entries(leaves).items() if shared(key)}
+    tombstones = {key: tombstone
+                  for key, tombstone in store.get_leaf_tombstones(leaves).items() if shared(key)}
+    return jsonify({'entries': entries, 'tombstones': tombstones}), 200
+
+@api.route('/stats', methods=['GET'])
+def stats():
+    return jsonify(store.stats()), 200
+
+@api.route('/stats/memory', methods=['GET'])
+def memory_stats():
+    key = request.args.get('key')
+    if key is None:
+        return jsonify(store.memory_usage()), 200
+    size = store.entry_size(key)
+    if size is None:
+        return jsonify({'error': 'Key not found'}), 404
+    return jsonify({'key': key, 'bytes': size}), 200
+
+@api.route('/admin/profile/start', methods=['POST'])
+def start_profile():
+    """Sample every thread's stack for ``seconds`` in the background"""
+    try:
+        seconds = float(request.args.get('seconds', 30))
+        interval = float(request.args.get('interval', 0.005))
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            raise ValueError(f'seconds must be between 0 and {MAX_PROFILE_SECONDS:.0f}')
+        if not 0.001 <= interval <= 1:
+            raise ValueError('interval must be between 0.001 and 1')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not PROFILER.start(seconds, interval):
+        return jsonify({'error': 'A profile is already running'}), 409
+    return jsonify({'status': 'started', 'seconds': seconds, 'interval': interval}), 202
+
+@api.route('/admin/profile/stop', methods=['POST'])
+def stop_profile():
+    PROFILER.stop()
+    return profile()
+
+@api.route('/admin/profile', methods=['GET'])
+def profile():
+    """Stacks of the current or last profile in collapsed (flame graph) format"""
+    if PROFILER.started_at is None:
+        return jsonify({'error': 'No profile has been taken'}), 404
+    response = Response(PROFILER.collapsed(), mimetype='text/plain')
+    response.headers['X-Profile-Samples'] = str(PROFILER.samples)
+    response.headers['X-Profile-Running'] = str(PROFILER.running).lower()
+    return response
+
+@api.route('/admin/traces', methods=['GET'])
+def traces():
+    """The slowest recent sampled requests with their spans"""
+    limit = request.args.get('limit', type=int)
+    return jsonify(dict(TRACER.stats(), traces=TRACER.slowest(limit))), 200
+
+@api.route('/admin/tracing', methods=['PUT'])
+def configure_tracing():
+    """Change the trace sample rate, slow threshold or buffer size at runtime"""
+    payload = request.get_json(silent=True) or {}
+    try:
+        slow_ms = payload.get('slow_ms')
+        TRACER.configure(sample_rate=payload.get('sample_rate'),
+                         slow_threshold=slow_ms / 1000 if slow_ms is not None else None,
+                         capacity=payload.get('capacity'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(TRACER.stats()), 200
+
+@api.route('/heartbeat', methods=['POST'])
+def heartbeat():
+    payload = request.get_json(silent=True) or {}
+    discovery = getattr(current_app, 'discovery', None)
+    if not discovery:
+        return jsonify({'status': 'ok'}), 200
+    return jsonify(discovery.handle_ping(payload)), 200
+
+@api.route('/ping-req', methods=['POST'])
+def ping_req():
+    payload = request.get_json(silent=True) or {}
+    discovery = getattr(current_app, 'discovery', None)
+    if not discovery:
+        return jsonify({'error': 'Membership is not enabled'}), 503
+    if not payload.get('target'):
+        return jsonify({'error': 'target is required'}), 400
+    return jsonify(discovery.handle_ping_req(payload)), 200
+
+@api.route('/cluster/members', methods=['GET'])
+def cluster_members():
+    discovery = getattr(current_app, 'discovery', None)
+    if not discovery:
+        return jsonify({'members': []}), 200
+    return jsonify({'node': discovery.node_address, 'incarnation': discovery.incarnation,
+                    'members': discovery.get_members()}), 200
+
+@api.route('/cluster/ring', methods=['GET'])
+def ring_info():
+    cluster = current_app.cluster
+    if not cluster:
+        return jsonify({'nodes': [], 'replication_factor': None}), 200
+    return jsonify({'nodes': cluster.ring.nodes,
+                    'replication_factor': cluster.replication_factor,
+                    'rebalance': cluster.rebalance_stats()}), 200
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of the node's metrics"""
+    memory = store.memory_usage()
+    stats = store.stats()
+    locks = store.lock_stats()
+    parts = [
+        REGISTRY.render(),
+        render_samples('kv_keys', 'Live keys stored on this node', [({}, memory['entries'])]),
+        render_samples('kv_memory_bytes', 'Estimated bytes held by stored entries',
+                       [({}, memory['total_bytes'])]),
+        render_samples('kv_evictions_total', 'Keys evicted to stay within the memory budget',
+                       [({}, stats['evictions'])], 'counter'),
+        render_samples('kv_expired_total', 'Keys removed after their TTL passed',
+                       [({}, stats['expired'])], 'counter'),
+        render_samples('kv_store_lock_acquisitions_total', 'Acquisitions of a store lock',
+                       [({'lock': name}, lock['acquisitions'])
+                        for name, lock in locks.items()], 'counter'),
+        render_samples('kv_store_lock_contended_total',
+                       'Acquisitions of a store lock that had to wait',
+                       [({'lock': name}, lock['contended'])
+                        for name, lock in locks.items()], 'counter'),
+    ]
+    cluster = current_app.cluster
+    if cluster:
+        peers = cluster.replication_stats()
+        parts.append(render_samples('kv_replication_queue_depth',
+                                    'Updates waiting to be sent to a peer',
+                                    [({'peer': peer['peer']}, peer['queue_depth']) for peer in peers]))
+        parts.append(render_samples('kv_replication_lag_seconds',
+                                    'Age of the oldest update queued for a peer',
+                                    [({'peer': peer['peer']}, peer['lag_seconds']) for peer in peers]))
+        parts.append(render_samples('kv_replication_failed_total',
+                                    'Updates that could not be sent to a peer',
+                                    [({'peer': peer['peer']}, peer['failed']) for peer in peers],
+                                    'counter'))
+        hints = cluster.handoff.stats()
+        parts.append(render_samples('kv_hints_pending',
+                                    'Updates held for an unreachable peer',
+                                    [({'peer': peer['peer']}, peer['pending'])
+                                     for peer in hints['peers']]))
+        parts.append(render_samples('kv_hints_replayed_total',
+                                    'Held updates delivered after a peer returned',
+                                    [({}, hints['replayed'])], 'counter'))
+    return Response(''.join(parts), mimetype='text/plain; version=0.0.4')
+
+@api.route('/cluster/replication', methods=['GET'])
+def replication_stats():
+    if not current_app.cluster:
+        return jsonify({'peers': []}), 200
+    return jsonify({'peers': current_app.cluster.replication_stats()}), 200
+
+@api.route('/cluster/hints', methods=['GET'])
+def hint_stats():
+    if not current_app.cluster:
+        return jsonify({'peers': []}), 200
+    return jsonify(current_app.cluster.handoff.stats()), 200
@@ -1,25 +1,139 @@
 from flask import Flask
-from src.api.routes import api
+from src.api import routes
+from src.api.routes import api, apply_sync_updates, IN_PROCESS_ENDPOINTS
+from src.api.resp import RespServer
 from src.network.cluster import ClusterManager
+from src.network.anti_entropy import AntiEntropy
+from src.network.bootstrap import Bootstrapper
+from src.network.handoff import HintedHandoff
+from src.network.discovery import NodeDiscovery
+from src.store.persistence import PersistenceManager
+from src.store.shared import SharedStore
+from src.server import PreforkServer
+from src.profiling import TRACER
 import os
 
-def create_app():
+# Settings that need the in-process store or background threads, which
+# forked workers cannot share; WORKERS > 1 serves a standalone node only
+SINGLE_PROCESS_SETTINGS = ('NODE_ADDRESS', 'SEED_NODES', 'DATA_DIR', 'RESP_PORT',
+                           'MAX_ENTRIES', 'MAX_BYTES')
+
+# Settings that start listeners, threads or on-disk state in create_app;
+# the debug reloader would start them twice, once in its watching parent
+BACKGROUND_SETTINGS = ('NODE_ADDRESS', 'RESP_PORT', 'DATA_DIR')
+
+def create_app(standalone: bool = False):
+    """Build the app; ``standalone`` leaves out cluster and in-process-store routes"""
     app = Flask(__name__)
-    
+    store = routes.store
+
     # Initialize cluster manager
     node_address = os.getenv('NODE_ADDRESS')
     seed_nodes = os.getenv('SEED_NODES', '').split(',') if os.getenv('SEED_NODES') else []
-    app.cluster = ClusterManager(node_address, seed_nodes) if node_address else None
-    
+    replication_factor = int(os.getenv('REPLICATION_FACTOR')) if os.getenv('REPLICATION_FACTOR') else None
+    # Writes missed by an unreachable replica are kept under DATA_DIR/hints
+    data_dir = os.getenv('DATA_DIR')
+    handoff = HintedHandoff(
+        directory=os.path.join(data_dir, 'hints') if data_dir else None,
+        max_hints=int(os.getenv('MAX_HINTS_PER_PEER', '100000')),
+        rate=float(os.getenv('HINT_REPLAY_RATE', '1000')),
+        max_window=float(os.getenv('HINT_WINDOW', '10800'))
+    ) if node_address else None
+    app.cluster = ClusterManager(node_address, seed_nodes,
+                                 replication_factor=replication_factor,
+                                 store=store, handoff=handoff) if node_address else None
+
+    # Membership changes move only the affected ring ranges
+    app.discovery = None
+    if app.cluster:
+        app.discovery = NodeDiscovery(node_address, seed_nodes,
+                                      heartbeat_interval=float(os.getenv('HEARTBEAT_INTERVAL', '5')))
+        app.discovery.add_listener(app.cluster.add_node, app.cluster.remove_node)
+        app.discovery.start()
+
+    # Optional memory budget, turning the node into a bounded cache tier
+    max_entries = os.getenv('MAX_ENTRIES')
+    max_bytes = os.getenv('MAX_BYTES')
+    if max_entries or max_bytes:
+        store.configure_eviction(os.getenv('EVICTION_POLICY', 'lru'),
+                                 max_entries=int(max_entries) if max_entries else None,
+                                 max_bytes=int(max_bytes) if max_bytes else None)
+
+    # Large values are kept compressed; VALUE_CODEC=none turns this off
+    store.configure_codec(os.getenv('VALUE_CODEC', 'zlib'),
+                          threshold=int(os.getenv('COMPRESS_THRESHOLD', '4096')))
+
+    # Optional durability: WAL plus periodic snapshots under DATA_DIR
+    if data_dir and not store.is_persistent:
+        store.enable_persistence(PersistenceManager(
+            data_dir,
+            fsync=os.getenv('WAL_FSYNC', 'batch'),
+            snapshot_interval=float(os.getenv('SNAPSHOT_INTERVAL', '300'))
+        ))
+
+    # A node joining with no local data streams a snapshot from a seed
+    app.bootstrap = None
+    if app.cluster and seed_nodes and len(store) == 0 and \
+            os.getenv('BOOTSTRAP', 'auto').lower() != 'off':
+        app.bootstrap = Bootstrapper(store, seed_nodes, apply_sync_updates,
+                                     node_address=node_address,
+                                     chunk_size=int(os.getenv('BOOTSTRAP_CHUNK_SIZE', '1000')))
+        app.bootstrap.start()
+
+    # Periodic Merkle-tree reconciliation with peers
+    app.anti_entropy = None
+    if app.cluster:
+        # Deletes leave tombstones so reconciliation cannot restore them
+        store.configure_tombstones(float(os.getenv('TOMBSTONE_GRACE', '86400')))
+        app.anti_entropy = AntiEntropy(store, app.cluster,
+                                       interval=float(os.getenv('ANTI_ENTROPY_INTERVAL', '30')))
+        app.anti_entropy.start()
+
+    # Optional RESP (Redis protocol) front-end for low-latency clients
+    app.resp_server = None
+    if os.getenv('RESP_PORT'):
+        app.resp_server = RespServer(store, port=int(os.getenv('RESP_PORT')),
+                                     cluster=app.cluster)
+        app.resp_server.start()
+
+    # Sampled request tracing; TRACE_SAMPLE_RATE=0 leaves it off
+    TRACER.configure(sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', '0')),
+                     slow_threshold=float(os.getenv('TRACE_SLOW_MS', '100')) / 1000,
+                     capacity=int(os.getenv('TRACE_BUFFER', '100')))
+
     # Register blueprint
     app.register_blueprint(api)
+    if standalone:
+        rules = [rule.empty() for rule in app.url_map.iter_rules()
+                 if rule.endpoint not in IN_PROCESS_ENDPOINTS]
+        app.url_map = app.url_map_class(rules)
+        for endpoint in IN_PROCESS_ENDPOINTS:
+            app.view_functions.pop(endpoint, None)
     
     return app
 
+def serve_prefork(port: int, workers: int):
+    """Run a standalone node in pre-forked workers sharing one SharedStore"""
+    conflicting = [name for name in SINGLE_PROCESS_SETTINGS if os.getenv(name)]
+    if conflicting:
+        raise SystemExit(f"WORKERS > 1 runs a standalone node; unset {', '.join(conflicting)}")
+    # The table must exist before the workers are forked
+    routes.use_store(SharedStore(
+        capacity=int(os.getenv('SHARED_CAPACITY', '100000')),
+        key_size=int(os.getenv('SHARED_KEY_SIZE', '256')),
+        value_size=int(os.getenv('SHARED_VALUE_SIZE', '2048'))
+    ))
+    PreforkServer(create_app(standalone=True), port=port, workers=workers).serve_forever()
+
 def main():
-    app = create_app()
     port = int(os.getenv('PORT', '8000'))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    workers = int(os.getenv('WORKERS', '1'))
+    if workers > 1:
+        serve_prefork(port, workers)
+        return
+    app = create_app()
+    reload = not any(os.getenv(name) for name in BACKGROUND_SETTINGS)
+    app.run(host='0.0.0.0', port=port, debug=True, use_reloader=reload)
 
 if __name__ == '__main__':
     main()
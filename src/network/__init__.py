@@ -1,7 +1,13 @@
 from .cluster import ClusterManager
 from .discovery import NodeDiscovery
+from .anti_entropy import AntiEntropy
+from .bootstrap import Bootstrapper
+from .handoff import HintedHandoff
 
 __all__ = [
     'ClusterManager',
-    'NodeDiscovery'
+    'NodeDiscovery',
+    'AntiEntropy',
+    'Bootstrapper',
+    'HintedHandoff'
 ]
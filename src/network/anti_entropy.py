@@ -0,0 +1,148 @@
+# src/network/anti_entropy.py
+import time
+import threading
+import requests
+from typing import Any, Dict, List, Optional
+import logging
+from src.store.codec import to_wire, from_wire
+
+logger = logging.getLogger(__name__)
+
+class AntiEntropy:
+    """Background Merkle-tree reconciliation with peers.
+
+    Each round compares the local tree root with a peer's and walks down only
+    the subtrees whose hashes differ, one level per request. The entries of
+    the differing leaves are then pulled into the local store through
+    ``merge`` and the local versions are pushed back through ``/sync``, so the
+    work done is proportional to the divergence, not the dataset size.
+
+    With a replication factor only the keys both nodes replicate are
+    exchanged, in either direction. The trees still cover every local key,
+    so leaves holding keys the nodes do not share keep differing and are
+    filtered on every round; the transfer stays proportional to the
+    divergence of the shared ranges.
+
+    Deletion tombstones are in the tree too and travel the same way, so a
+    key deleted on one node is deleted on the peer rather than restored.
+    Each round also drops the tombstones past the store's grace period.
+    """
+
+    def __init__(self, store, cluster, interval: float = 30.0, timeout: float = 5.0):
+        self.store = store
+        self.cluster = cluster
+        self.interval = interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.is_running = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.rounds = 0
+        self.nodes_compared = 0
+        self.keys_pulled = 0
+        self.keys_pushed = 0
+        self.last_round: Optional[float] = None
+
+    def start(self):
+        """Start the background anti-entropy thread"""
+        self.is_running = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='anti-entropy')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background anti-entropy thread"""
+        self.is_running = False
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.store.purge_tombstones()
+            for peer in self.cluster.peers():
+                try:
+                    self.sync_with(peer)
+                except (requests.RequestException, ValueError) as e:
+                    logger.warning(f"Anti-entropy with {peer} failed: {e}")
+            self.rounds += 1
+            self.last_round = time.time()
+
+    def find_differing_leaves(self, peer: str) -> List[int]:
+        """Walk both trees top-down and return the leaves whose hashes differ"""
+        tree = self.store.merkle
+        frontier = [1]
+        leaves = []
+        while frontier:
+            remote = self._fetch_hashes(peer, frontier)
+            self.nodes_compared += len(frontier)
+            next_frontier = []
+            for node in frontier:
+                if remote.get(node) == tree.node_hash(node):
+                    continue
+                if tree.is_leaf(node):
+                    leaves.append(tree.leaf_index(node))
+                else:
+                    next_frontier.extend(tree.children(node))
+            frontier = next_frontier
+        return leaves
+
+    def sync_with(self, peer: str) -> int:
+        """Reconcile with ``peer``, returning the number of keys transferred"""
+        leaves = self.find_differing_leaves(peer)
+        if not leaves:
+            return 0
+
+        response = self.session.post(f"{peer}/merkle/leaves",
+                                     json={'leaves': leaves,
+                                           'for_node': self.cluster.node_address},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        shares = self.cluster.shares
+        remote = {key: (from_wire(item[0]), *item[1:])
+                  for key, item in data['entries'].items() if shares(key, peer)}
+        remote_tombstones = {key: tuple(item) for key, item in data.get('tombstones', {}).items()
+                             if shares(key, peer)}
+        self.store.merge(remote)
+        self.store.merge_tombstones(remote_tombstones)
+
+        local = self.store.get_leaf_entries(leaves)
+        updates = [{'key': key, 'value': to_wire(value), 'operation': 'update',
+                    'version': version, 'timestamp': timestamp, 'expires_at': expires_at}
+                   for key, (value, version, timestamp, expires_at) in local.items()
+                   if shares(key, peer) and
+                   (key not in remote or remote[key][1:3] != (version, timestamp))]
+        updates.extend({'key': key, 'value': None, 'operation': 'delete',
+                        'version': version, 'timestamp': timestamp, 'expires_at': None}
+                       for key, (version, timestamp)
+                       in self.store.get_leaf_tombstones(leaves).items()
+                       if shares(key, peer) and remote_tombstones.get(key) != (version, timestamp))
+        if updates:
+            self.session.post(f"{peer}/sync", json={'updates': updates},
+                              timeout=self.timeout).raise_for_status()
+
+        pulled = len(remote) + len(remote_tombstones)
+        self.keys_pulled += pulled
+        self.keys_pushed += len(updates)
+        return pulled + len(updates)
+
+    def _fetch_hashes(self, peer: str, nodes: List[int]) -> Dict[int, int]:
+        response = self.session.post(f"{peer}/merkle/nodes", json={'nodes': nodes},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('depth') != self.store.merkle.depth:
+            raise ValueError(f"Merkle depth mismatch with {peer}")
+        return {int(node): int(value, 16) for node, value in data['hashes'].items()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'rounds': self.rounds,
+            'nodes_compared': self.nodes_compared,
+            'keys_pulled': self.keys_pulled,
+            'keys_pushed': self.keys_pushed,
+            'last_round': self.last_round
+        }
@@ -0,0 +1,179 @@
+# src/network/bootstrap.py
+import json
+import time
+import threading
+import requests
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+import logging
+from src.store.codec import from_wire
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+BOOTSTRAPPING = 'bootstrapping'
+READY = 'ready'
+FAILED = 'failed'
+
+class Bootstrapper:
+    """Fills an empty node by streaming a snapshot from a peer.
+
+    The peer serves ``/snapshot`` as newline-delimited JSON in key order,
+    one chunk of entries per line, so neither side holds more than a chunk
+    at a time. Each chunk is merged as it arrives. If a peer drops out the
+    transfer resumes from the last key received on the next peer.
+
+    Replicated writes that arrive meanwhile are buffered, coalesced per key,
+    and replayed once the stream is complete, so a delete made during the
+    transfer is not undone by an older copy still to come in the snapshot.
+    The node only reports ready after the replay.
+    """
+
+    def __init__(self, store, peers: List[str],
+                 apply_updates: Callable[[List[Dict[str, Any]]], Any],
+                 node_address: Optional[str] = None, chunk_size: int = 1000,
+                 timeout: float = 30.0, attempts: int = 3, retry_delay: float = 1.0):
+        self.store = store
+        self.peers = [peer for peer in peers if peer and peer != node_address]
+        self.apply_updates = apply_updates
+        self.node_address = node_address
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self.session = requests.Session()
+        self.state = PENDING
+        self._lock = threading.Lock()
+        self._buffer: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+
+        self.source: Optional[str] = None
+        self.last_key: Optional[str] = None
+        self.entries_received = 0
+        self.chunks_received = 0
+        self.updates_buffered = 0
+        self.updates_replayed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state in (READY, FAILED)
+
+    def start(self):
+        """Run the bootstrap in a background thread"""
+        with self._lock:
+            self.state = BOOTSTRAPPING
+        self._thread = threading.Thread(target=self.run, name='bootstrap')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def buffer(self, updates: List[Dict[str, Any]]) -> bool:
+        """Hold replicated updates until the snapshot is in.
+
+        Returns False once the node is ready, in which case the caller
+        applies the updates itself.
+        """
+        with self._lock:
+            if self.state != BOOTSTRAPPING:
+                return False
+            for update in updates:
+                key = update.get('key')
+                if key is None:
+                    continue
+                # Only the latest update per key matters after the snapshot
+                self._buffer.pop(key, None)
+                self._buffer[key] = update
+                self.updates_buffered += 1
+            return True
+
+    def run(self) -> bool:
+        """Stream a snapshot from the first reachable peer, then replay"""
+        with self._lock:
+            self.state = BOOTSTRAPPING
+        self.started_at = time.time()
+        complete = False
+        for attempt in range(self.attempts):
+            for peer in self.peers:
+                try:
+                    complete = self._transfer(peer)
+                except (requests.RequestException, ValueError) as e:
+                    logger.warning(f"Snapshot transfer from {peer} failed after "
+                                   f"{self.entries_received} entries: {e}")
+                    continue
+                if complete:
+                    break
+            if complete or not self.peers:
+                break
+            time.sleep(self.retry_delay * (attempt + 1))
+        if not complete:
+            # Anti-entropy fills in whatever the snapshot did not deliver
+            logger.warning(f"Bootstrap incomplete after {self.entries_received} entries; "
+                           f"serving with partial data")
+        self._replay(READY if complete else FAILED)
+        self.finished_at = time.time()
+        logger.info(f"Bootstrap {self.state}: {self.entries_received} entries from "
+                    f"{self.source}, {self.updates_replayed} updates replayed in "
+                    f"{self.finished_at - self.started_at:.2f}s")
+        return complete
+
+    def _transfer(self, peer: str) -> bool:
+        params = {'chunk_size': self.chunk_size}
+        if self.last_key is not None:
+            params['after'] = self.last_key
+        if self.node_address:
+            params['for_node'] = self.node_address
+        response = self.session.get(f"{peer}/snapshot", params=params,
+                                    stream=True, timeout=self.timeout)
+        try:
+            if response.status_code != 200:
+                raise ValueError(f"status {response.status_code}")
+            self.source = peer
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                record = json.loads(line)
+                entries = record.get('entries')
+                if entries:
+                    self.store.merge({key: (from_wire(value), version, timestamp, expires_at)
+                                      for key, value, version, timestamp, expires_at in entries})
+                    self.last_key = entries[-1][0]
+                    self.entries_received += len(entries)
+                    self.chunks_received += 1
+                elif record.get('done'):
+                    return True
+            raise ValueError("snapshot stream ended early")
+        finally:
+            response.close()
+
+    def _replay(self, final_state: str):
+        # Drain in rounds so updates arriving during a replay are applied
+        # after it; the state flips under the lock once nothing is left
+        while True:
+            with self._lock:
+                if not self._buffer:
+                    self.state = final_state
+                    return
+                updates = list(self._buffer.values())
+                self._buffer = OrderedDict()
+            self.apply_updates(updates)
+            self.updates_replayed += len(updates)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            'state': self.state,
+            'source': self.source,
+            'entries_received': self.entries_received,
+            'chunks_received': self.chunks_received,
+            'updates_buffered': self.updates_buffered,
+            'updates_pending': buffered,
+            'updates_replayed': self.updates_replayed,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
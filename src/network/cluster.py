@@ -1,27 +1,307 @@
-from typing import List, Set, Any
+from typing import List, Set, Any, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+import threading
+import time
 import requests
+from urllib.parse import quote
+from src.store.consistency import ConsistencyManager, WriteResult, ReadResult
+from src.store.codec import from_wire
+from .replication import PeerReplicator, SYNC_LATENCY
+from .ring import HashRing, DEFAULT_VIRTUAL_NODES
+from .rebalance import Rebalancer
+from .handoff import HintedHandoff
+
+FORWARDED_HEADER = 'X-Forwarded-By'
 
 class ClusterManager:
-    def __init__(self, node_address: str, seed_nodes: List[str]):
+    def __init__(self, node_address: str, seed_nodes: List[str],
+                 replication_timeout: float = 2.0, max_pending: int = 10000,
+                 batch_size: int = 100, fanout_workers: int = 32,
+                 replication_factor: Optional[int] = None, store=None,
+                 vnodes: int = DEFAULT_VIRTUAL_NODES,
+                 handoff: Optional[HintedHandoff] = None):
         self.node_address = node_address
         self.nodes: Set[str] = set(seed_nodes)
-        
-    def broadcast_update(self, key: str, value: Any, operation: str):
-        for node in self.nodes:
-            if node != self.node_address:
-                try:
-                    requests.post(f"{node}/sync", 
-                                json={
-                                    'key': key,
-                                    'value': value,
-                                    'operation': operation
-                                })
-                except requests.RequestException:
-                    # Handle node failure
-                    pass
+        # None keeps every key on every node; otherwise each key has R owners
+        self.replication_factor = replication_factor
+        self.store = store
+        self.ring = HashRing([node_address, *seed_nodes], vnodes)
+        self.rebalancer = Rebalancer(self)
+        self.replication_timeout = replication_timeout
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.replicators: Dict[str, PeerReplicator] = {}
+        # Writes a replica missed are kept and replayed when it returns
+        self.handoff = handoff or HintedHandoff(batch_size=batch_size,
+                                                timeout=replication_timeout)
+        # Ring including peers that are down, to find the keys they would own
+        self._hint_ring: Optional[HashRing] = None
+        self._lock = threading.Lock()
+        # Shared keep-alive session and pool for synchronous quorum fan-out
+        self._session = requests.Session()
+        self._executor = ThreadPoolExecutor(max_workers=fanout_workers,
+                                            thread_name_prefix='fanout')
+
+    def peers(self) -> List[str]:
+        """Return every known node except this one"""
+        return [node for node in list(self.nodes) if node != self.node_address]
+
+    @property
+    def is_partitioned(self) -> bool:
+        return self.replication_factor is not None and self.replication_factor < len(self.ring)
+
+    def owners(self, key: str) -> List[str]:
+        """Return the nodes responsible for ``key``, primary first"""
+        if not self.is_partitioned:
+            return [self.node_address] + self.peers()
+        return self.ring.owners(key, self.replication_factor)
+
+    def is_owner(self, key: str) -> bool:
+        return not self.is_partitioned or self.node_address in self.owners(key)
+
+    def shares(self, key: str, peer: str) -> bool:
+        """Whether this node and ``peer`` both replicate ``key``"""
+        if not self.is_partitioned:
+            return True
+        owners = self.owners(key)
+        return self.node_address in owners and peer in owners
+
+    def replica_peers(self, key: str) -> List[str]:
+        """Return the other nodes that hold a copy of ``key``"""
+        return [node for node in self.owners(key) if node != self.node_address]
+
+    def replica_count(self) -> int:
+        if not self.is_partitioned:
+            return len(self.peers()) + 1
+        return self.replication_factor
+
+    def consistency_manager(self) -> ConsistencyManager:
+        """Return a consistency manager sized to the replicas of a key"""
+        return ConsistencyManager(self.replica_count())
+
+    def _targets(self, updates: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        targets: Dict[str, List[Dict[str, Any]]] = {}
+        if not self.is_partitioned:
+            return {peer: updates for peer in self.peers()}
+        for update in updates:
+            for peer in self.replica_peers(update['key']):
+                targets.setdefault(peer, []).append(update)
+        return targets
+
+    def _hint_targets(self, updates: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Group updates by the down peers that would have received them"""
+        down = self.handoff.hinting_peers()
+        if not down:
+            return {}
+        if not self.is_partitioned or self._hint_ring is None:
+            return {peer: updates for peer in down}
+        targets: Dict[str, List[Dict[str, Any]]] = {}
+        for update in updates:
+            for peer in self._hint_ring.owners(update['key'], self.replication_factor):
+                if peer in down:
+                    targets.setdefault(peer, []).append(update)
+        return targets
+
+    def _hint_down_peers(self, updates: List[Dict[str, Any]]):
+        for peer, peer_updates in self._hint_targets(updates).items():
+            self.handoff.hint(peer, peer_updates)
+
+    def forward(self, method: str, nodes: List[str], path: str, data: bytes = b'',
+                headers: Optional[Dict[str, str]] = None) -> Optional[requests.Response]:
+        """Send a request to the first reachable node in ``nodes``"""
+        headers = dict(headers or {}, **{FORWARDED_HEADER: self.node_address})
+        for owner in nodes:
+            try:
+                return self._session.request(method, f"{owner}{path}", data=data,
+                                             headers=headers,
+                                             timeout=self.replication_timeout)
+            except requests.RequestException:
+                continue
+        return None
+
+    def _replicator(self, node: str) -> PeerReplicator:
+        replicator = self.replicators.get(node)
+        if replicator is None:
+            with self._lock:
+                replicator = self.replicators.get(node)
+                if replicator is None:
+                    replicator = PeerReplicator(node,
+                                                max_pending=self.max_pending,
+                                                batch_size=self.batch_size,
+                                                timeout=self.replication_timeout,
+                                                on_failure=self.handoff.hint)
+                    replicator.start()
+                    self.replicators[node] = replicator
+        return replicator
+
+    def broadcast_update(self, key: str, value: Any, operation: str,
+                         version: Optional[int] = None, timestamp: Optional[float] = None,
+                         expires_at: Optional[float] = None):
+        """Queue an update for asynchronous replication to every peer"""
+        update = {
+            'key': key,
+            'value': value,
+            'operation': operation,
+            'version': version,
+            'timestamp': timestamp if timestamp is not None else time.time(),
+            'expires_at': expires_at
+        }
+        self.broadcast_updates([update])
+
+    def broadcast_updates(self, updates: List[Dict[str, Any]]):
+        """Queue a group of updates; peers receive them as one batched /sync"""
+        for node, node_updates in self._targets(updates).items():
+            self._replicator(node).enqueue_many(node_updates)
+        self._hint_down_peers(updates)
+
+    def write(self, update: Dict[str, Any], required_acks: int,
+              timeout: Optional[float] = None) -> WriteResult:
+        """Replicate a locally applied write, returning once enough peers ack.
+
+        The local node counts as the first ack. With a single required ack the
+        update goes through the asynchronous pipeline; otherwise it is sent to
+        every peer in parallel and the call returns as soon as ``required_acks``
+        is reached or the deadline passes.
+        """
+        return self.write_batch([update], required_acks, timeout)
+
+    def write_batch(self, updates: List[Dict[str, Any]], required_acks: int,
+                    timeout: Optional[float] = None) -> WriteResult:
+        """Replicate several locally applied writes as one /sync call per peer"""
+        result = WriteResult()
+        result.add_ack(self.node_address)
+        now = time.time()
+        updates = [dict(update, timestamp=update.get('timestamp') or now)
+                   for update in updates]
+        if required_acks <= 1:
+            self.broadcast_updates(updates)
+            result.success = True
+            return result
+
+        self._hint_down_peers(updates)
+        futures = {self._executor.submit(self._post_sync, peer, peer_updates): peer
+                   for peer, peer_updates in self._targets(updates).items()}
+        try:
+            for future in as_completed(futures, timeout=timeout or self.replication_timeout):
+                if future.result():
+                    result.add_ack(futures[future])
+                if result.ack_count >= required_acks:
+                    break
+        except FutureTimeout:
+            pass
+        result.success = result.ack_count >= required_acks
+        return result
+
+    def read(self, key: str, local: ReadResult, required_acks: int,
+             timeout: Optional[float] = None) -> List[ReadResult]:
+        """Collect read results from peers in parallel until enough respond"""
+        results = [local]
+        if required_acks <= 1:
+            return results
+
+        futures = [self._executor.submit(self._fetch_replica, peer, key)
+                   for peer in self.replica_peers(key)]
+        try:
+            for future in as_completed(futures, timeout=timeout or self.replication_timeout):
+                replica = future.result()
+                if replica is not None:
+                    results.append(replica)
+                if len(results) >= required_acks:
+                    break
+        except FutureTimeout:
+            pass
+        return results
+
+    def _post_sync(self, peer: str, updates: List[Dict[str, Any]]) -> bool:
+        start = time.perf_counter()
+        try:
+            response = self._session.post(f"{peer}/sync",
+                                          json={'updates': updates},
+                                          timeout=self.replication_timeout)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        SYNC_LATENCY.labels(peer, 'sync').observe(time.perf_counter() - start)
+        if not ok:
+            self.handoff.hint(peer, updates)
+        return ok
+
+    def _fetch_replica(self, peer: str, key: str) -> Optional[ReadResult]:
+        try:
+            response = self._session.get(f"{peer}/replica/{quote(key, safe='')}",
+                                         timeout=self.replication_timeout)
+        except requests.RequestException:
+            return None
+        result = ReadResult()
+        result.node_id = peer
+        if response.status_code == 404:
+            return result
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        result.value = from_wire(data.get('value'))
+        result.version = data.get('version', 0)
+        result.timestamp = data.get('timestamp', 0.0)
+        return result
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until all queued updates have been handed to peers"""
+        return all([replicator.flush(timeout)
+                    for replicator in list(self.replicators.values())])
+
+    def replication_stats(self) -> List[Dict[str, Any]]:
+        """Return queue depth and lag for every peer"""
+        return [replicator.stats() for replicator in list(self.replicators.values())]
+
+    def stop(self):
+        """Drain and stop all replication threads"""
+        with self._lock:
+            replicators = list(self.replicators.values())
+            self.replicators.clear()
+        for replicator in replicators:
+            replicator.stop()
+        self.rebalancer.stop()
+        self.handoff.stop()
+        self._executor.shutdown(wait=False)
+        self._session.close()
 
     def add_node(self, node_address: str):
         self.nodes.add(node_address)
+        self._change_ring(lambda ring: ring.add_node(node_address))
+        self.handoff.peer_up(node_address)
+        self._update_hint_ring()
 
     def remove_node(self, node_address: str):
-        self.nodes.remove(node_address)
+        self.nodes.discard(node_address)
+        # Mark the peer down first so nothing sent from here on is lost
+        self.handoff.peer_down(node_address)
+        self._update_hint_ring()
+        with self._lock:
+            replicator = self.replicators.pop(node_address, None)
+        if replicator is not None:
+            replicator.stop(timeout=0)
+        self._change_ring(lambda ring: ring.remove_node(node_address))
+
+    def _update_hint_ring(self):
+        down = self.handoff.hinting_peers()
+        if not down or self.replication_factor is None:
+            self._hint_ring = None
+            return
+        ring = self.ring.copy()
+        for peer in down:
+            ring.add_node(peer)
+        self._hint_ring = ring
+
+    def _change_ring(self, change):
+        with self._lock:
+            old_ring = self.ring
+            new_ring = old_ring.copy()
+            if not change(new_ring):
+                return
+            # Swap in a new ring so readers never see one mid-update
+            self.ring = new_ring
+        if self.replication_factor is not None and self.store is not None:
+            self.rebalancer.schedule(old_ring, new_ring)
+
+    def rebalance_stats(self) -> Dict[str, Any]:
+        return self.rebalancer.stats()
@@ -1,24 +1,92 @@
 # src/network/discovery.py
+import math
 import time
+import random
 import threading
 import requests
-from typing import Set, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Set, List, Callable, Optional, Tuple
 import logging
+from src.metrics import REGISTRY
+from src.store.node import NodeState
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+HEARTBEAT_RTT = REGISTRY.histogram('kv_heartbeat_rtt_seconds',
+                                   'Round trip of heartbeats to a peer', ['peer'])
+
+class Member:
+    """What this node believes about one peer"""
+    __slots__ = ('address', 'state', 'incarnation', 'changed_at')
+
+    def __init__(self, address: str, state: NodeState, incarnation: int):
+        self.address = address
+        self.state = state
+        self.incarnation = incarnation
+        self.changed_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'address': self.address, 'state': self.state.value,
+                'incarnation': self.incarnation, 'changed_at': self.changed_at}
+
 class NodeDiscovery:
-    def __init__(self, node_address: str, seed_nodes: List[str], heartbeat_interval: int = 5):
+    """SWIM-style membership and failure detection.
+
+    Every ``heartbeat_interval`` the node pings one member, taken in a
+    shuffled round-robin order so each member is probed within one pass.
+    If the ping times out, up to ``indirect_probes`` other members are asked
+    to ping it on our behalf through ``/ping-req``. Only if none of them
+    gets an answer is the member marked SUSPECT. A suspect that does not
+    refute the suspicion, by announcing a higher incarnation, within the
+    suspicion timeout is declared INACTIVE and removed.
+
+    Membership changes are not sent as separate messages. Each ping and ack
+    piggybacks a few recent updates, and each update is retransmitted
+    ``retransmit_mult * log(N)`` times. The load per node stays constant
+    and dissemination time grows with log N as the cluster grows.
+    """
+
+    def __init__(self, node_address: str, seed_nodes: List[str], heartbeat_interval: float = 5,
+                 ack_timeout: float = 1.0, indirect_probes: int = 3, suspicion_mult: int = 4,
+                 retransmit_mult: int = 3, max_piggyback: int = 8):
         self.node_address = node_address
-        self.nodes: Set[str] = set(seed_nodes)
         self.heartbeat_interval = heartbeat_interval
+        self.ack_timeout = ack_timeout
+        self.indirect_probes = indirect_probes
+        self.suspicion_mult = suspicion_mult
+        self.retransmit_mult = retransmit_mult
+        self.max_piggyback = max_piggyback
+        # Time based, so a restarted node always announces a newer incarnation
+        self.incarnation = int(time.time())
+        self.members: Dict[str, Member] = {
+            node: Member(node, NodeState.ACTIVE, 0) for node in seed_nodes if node != node_address
+        }
+        self.nodes: Set[str] = set(self.members)
         self.is_running = False
         self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._listeners: List[Tuple[Callable[[str], None], Callable[[str], None]]] = []
+        self._broadcasts: Dict[str, List[Any]] = {}
+        self._probe_order: List[str] = []
+        self._executor = ThreadPoolExecutor(max_workers=max(1, indirect_probes),
+                                            thread_name_prefix='ping-req')
+
+    def add_listener(self, on_join: Callable[[str], None], on_leave: Callable[[str], None]):
+        """Call ``on_join``/``on_leave`` with a node address on membership changes"""
+        self._listeners.append((on_join, on_leave))
+
+    def _notify(self, joined: Set[str], left: Set[str]):
+        for on_join, on_leave in self._listeners:
+            for node in joined:
+                on_join(node)
+            for node in left:
+                on_leave(node)
 
     def start(self):
         """Start the node discovery service"""
         self.is_running = True
+        self._stop.clear()
         self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop)
         self._heartbeat_thread.daemon = True
         self._heartbeat_thread.start()
@@ -26,56 +94,274 @@ class NodeDiscovery:
     def stop(self):
         """Stop the node discovery service"""
         self.is_running = False
+        self._stop.set()
         if hasattr(self, '_heartbeat_thread'):
             self._heartbeat_thread.join()
+        self._executor.shutdown(wait=False)
 
     def _heartbeat_loop(self):
-        """Continuously send heartbeats to other nodes"""
+        """Run one protocol period per heartbeat interval"""
         while self.is_running:
-            self._send_heartbeats()
-            time.sleep(self.heartbeat_interval)
-
-    def _send_heartbeats(self):
-        """Send heartbeat to all known nodes"""
-        dead_nodes = set()
-        for node in self.nodes:
-            if node != self.node_address:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Failure detector round failed: {e}")
+            self._stop.wait(self.heartbeat_interval)
+
+    def run_once(self):
+        """Probe the next member and expire suspicions that were not refuted"""
+        target = self._next_target()
+        if target is not None:
+            self._probe(target)
+        self._expire_suspects()
+
+    # Probing
+
+    def _alive_members(self) -> List[str]:
+        return [address for address, member in self.members.items()
+                if member.state != NodeState.INACTIVE]
+
+    def _next_target(self) -> Optional[str]:
+        with self._lock:
+            while self._probe_order:
+                target = self._probe_order.pop()
+                member = self.members.get(target)
+                if member is not None and member.state != NodeState.INACTIVE:
+                    return target
+            self._probe_order = self._alive_members()
+            random.shuffle(self._probe_order)
+            return self._probe_order.pop() if self._probe_order else None
+
+    def _probe(self, target: str):
+        if self._ping(target):
+            return
+        with self._lock:
+            helpers = [node for node in self._alive_members() if node != target]
+        helpers = random.sample(helpers, min(self.indirect_probes, len(helpers)))
+        if helpers and self._ping_indirect(target, helpers):
+            return
+        with self._lock:
+            member = self.members.get(target)
+            if member is not None and member.state == NodeState.ACTIVE:
+                self._apply(target, NodeState.SUSPECT, member.incarnation, set(), set())
+                logger.info(f"Suspecting node {target}")
+
+    def _message(self) -> Dict[str, Any]:
+        return {'sender': self.node_address, 'incarnation': self.incarnation,
+                'updates': self._take_broadcasts()}
+
+    def _ping(self, target: str) -> bool:
+        """Ping ``target`` directly, merging the updates piggybacked on its ack"""
+        start = time.perf_counter()
+        try:
+            response = requests.post(f"{target}/heartbeat", json=self._message(),
+                                     timeout=self.ack_timeout)
+        except requests.RequestException:
+            return False
+        if response.status_code != 200:
+            return False
+        HEARTBEAT_RTT.labels(target).observe(time.perf_counter() - start)
+        self._merge_response(response)
+        return True
+
+    def _ping_indirect(self, target: str, helpers: List[str]) -> bool:
+        def ask(helper: str) -> bool:
+            payload = dict(self._message(), target=target)
+            try:
+                response = requests.post(f"{helper}/ping-req", json=payload,
+                                         timeout=self.ack_timeout * 2)
+            except requests.RequestException:
+                return False
+            if response.status_code != 200:
+                return False
+            data = self._merge_response(response)
+            return bool(data.get('ack'))
+
+        futures = [self._executor.submit(ask, helper) for helper in helpers]
+        return any(future.result() for future in as_completed(futures))
+
+    def _merge_response(self, response) -> Dict[str, Any]:
+        try:
+            data = response.json()
+        except ValueError:
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        updates = data.get('updates')
+        if isinstance(updates, list):
+            self.apply_updates(updates)
+        return data
+
+    # Message handling
+
+    def handle_ping(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer a ping, learning about its sender and piggybacked updates"""
+        sender = payload.get('sender')
+        incarnation = payload.get('incarnation')
+        if sender and incarnation is None:
+            self.register_node(sender)
+        elif sender:
+            self.apply_updates([{'node': sender, 'state': NodeState.ACTIVE.value,
+                                 'incarnation': incarnation}])
+        self.apply_updates(payload.get('updates') or [])
+        updates = self._take_broadcasts()
+        if sender:
+            # A sender we still hold suspect or dead pinged with a stale
+            # incarnation; tell it directly so it refutes, even after the
+            # rumour has stopped being piggybacked
+            with self._lock:
+                member = self.members.get(sender)
+                if member is not None and member.state != NodeState.ACTIVE:
+                    updates = [update for update in updates if update['node'] != sender]
+                    updates.insert(0, {'node': sender, 'state': member.state.value,
+                                       'incarnation': member.incarnation})
+        return {'status': 'ok', 'incarnation': self.incarnation, 'updates': updates}
+
+    def handle_ping_req(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Ping ``target`` on behalf of the sender and report whether it answered"""
+        response = self.handle_ping(payload)
+        target = payload.get('target')
+        response['ack'] = bool(target) and self._ping(target)
+        return response
+
+    def apply_updates(self, updates: List[Dict[str, Any]]):
+        """Merge membership updates received from another node"""
+        joined, left = set(), set()
+        with self._lock:
+            for update in updates:
                 try:
-                    response = requests.post(
-                        f"{node}/heartbeat",
-                        json={"sender": self.node_address},
-                        timeout=2
-                    )
-                    if response.status_code != 200:
-                        dead_nodes.add(node)
-                except requests.RequestException:
-                    dead_nodes.add(node)
-
-        # Remove dead nodes
+                    node = update['node']
+                    state = NodeState(update['state'])
+                    incarnation = int(update['incarnation'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                self._apply(node, state, incarnation, joined, left)
+        self._notify(joined, left)
+
+    def _apply(self, node: str, state: NodeState, incarnation: int,
+               joined: Set[str], left: Set[str]):
+        """Apply one update under the SWIM precedence rules; caller holds the lock"""
+        if node == self.node_address:
+            if state != NodeState.ACTIVE and incarnation >= self.incarnation:
+                # Refute: we are alive, with a newer incarnation than the rumour
+                self.incarnation = incarnation + 1
+                self._queue_broadcast(node, NodeState.ACTIVE, self.incarnation)
+            return
+
+        member = self.members.get(node)
+        if state == NodeState.ACTIVE:
+            if member is not None and incarnation <= member.incarnation:
+                return
+            was_alive = member is not None and member.state != NodeState.INACTIVE
+            self._set_state(node, state, incarnation)
+            if not was_alive:
+                self.nodes.add(node)
+                joined.add(node)
+                logger.info(f"Registered new node: {node}")
+        elif state == NodeState.SUSPECT:
+            if member is None:
+                # The suspicion may have overtaken the join it replaced in the
+                # broadcast queue, so learn the member from it
+                self._set_state(node, state, incarnation)
+                self.nodes.add(node)
+                joined.add(node)
+                logger.info(f"Registered new node: {node} (suspect)")
+                return
+            if member.state == NodeState.INACTIVE:
+                return
+            if incarnation < member.incarnation or (
+                    incarnation == member.incarnation and member.state == NodeState.SUSPECT):
+                return
+            self._set_state(node, state, incarnation)
+        else:
+            if member is None or member.state == NodeState.INACTIVE:
+                return
+            if incarnation < member.incarnation:
+                return
+            self._set_state(node, state, incarnation)
+            self.nodes.discard(node)
+            left.add(node)
+            logger.info(f"Removed dead node: {node}")
+
+    def _set_state(self, node: str, state: NodeState, incarnation: int):
+        member = self.members.get(node)
+        if member is None:
+            member = self.members[node] = Member(node, state, incarnation)
+        member.state = state
+        member.incarnation = incarnation
+        member.changed_at = time.time()
+        self._queue_broadcast(node, state, incarnation)
+
+    def suspicion_timeout(self) -> float:
+        """Time a suspect has to refute, growing with log N like dissemination"""
+        return self.suspicion_mult * max(1.0, math.log10(len(self.members) + 1)) \
+            * self.heartbeat_interval
+
+    def _expire_suspects(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        timeout = self.suspicion_timeout()
+        joined, left = set(), set()
         with self._lock:
-            self.nodes -= dead_nodes
-            if dead_nodes:
-                logger.info(f"Removed dead nodes: {dead_nodes}")
+            for member in list(self.members.values()):
+                if member.state == NodeState.SUSPECT and now - member.changed_at >= timeout:
+                    self._apply(member.address, NodeState.INACTIVE, member.incarnation,
+                                joined, left)
+        self._notify(joined, left)
+
+    # Dissemination
+
+    def _queue_broadcast(self, node: str, state: NodeState, incarnation: int):
+        # A newer update about a node replaces the queued one
+        self._broadcasts[node] = [{'node': node, 'state': state.value,
+                                   'incarnation': incarnation}, 0]
+
+    def _take_broadcasts(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            limit = self.retransmit_mult * max(1, math.ceil(math.log10(len(self.members) + 2)))
+            chosen = sorted(self._broadcasts.items(), key=lambda item: item[1][1])
+            updates = []
+            for node, entry in chosen[:self.max_piggyback]:
+                updates.append(entry[0])
+                entry[1] += 1
+                if entry[1] >= limit:
+                    del self._broadcasts[node]
+            return updates
+
+    # Membership API
 
     def register_node(self, node_address: str):
         """Register a new node"""
+        if node_address == self.node_address:
+            return False
         with self._lock:
-            if node_address not in self.nodes:
-                self.nodes.add(node_address)
-                logger.info(f"Registered new node: {node_address}")
-                return True
-        return False
+            member = self.members.get(node_address)
+            if member is not None and member.state != NodeState.INACTIVE:
+                return False
+            incarnation = member.incarnation if member is not None else 0
+            self._set_state(node_address, NodeState.ACTIVE, incarnation)
+            self.nodes.add(node_address)
+            logger.info(f"Registered new node: {node_address}")
+        self._notify({node_address}, set())
+        return True
 
     def get_nodes(self) -> List[str]:
         """Get list of all known nodes"""
         with self._lock:
             return list(self.nodes)
 
+    def get_members(self) -> List[Dict[str, Any]]:
+        """Return every known member with its state and incarnation"""
+        with self._lock:
+            return [member.to_dict() for member in self.members.values()]
+
     def remove_node(self, node_address: str):
         """Remove a node"""
         with self._lock:
-            if node_address in self.nodes:
-                self.nodes.remove(node_address)
-                logger.info(f"Removed node: {node_address}")
-                return True
-        return False
\ No newline at end of file
+            member = self.members.get(node_address)
+            if member is None or member.state == NodeState.INACTIVE:
+                return False
+            self._set_state(node_address, NodeState.INACTIVE, member.incarnation)
+            self.nodes.discard(node_address)
+            logger.info(f"Removed node: {node_address}")
+        self._notify(set(), {node_address})
+        return True
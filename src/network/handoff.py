@@ -0,0 +1,347 @@
+# src/network/handoff.py
+import os
+import re
+import json
+import time
+import threading
+import requests
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+HINT_SUFFIX = '.hints'
+
+class HintQueue:
+    """Updates one peer missed, coalesced per key, oldest first.
+
+    With a ``path`` every hint and every acknowledgement is appended to a
+    log, so hints survive a restart. Acknowledgements name the sequence
+    number they cover, so a key re-hinted while its older hint was in
+    flight is not lost. Records are buffered and written by ``flush``,
+    which HintedHandoff calls from its own thread, so the client write
+    that misses a peer never waits on the file. The log is rewritten once
+    it is mostly stale.
+    """
+
+    def __init__(self, peer: str, max_hints: int = 100000, path: Optional[str] = None):
+        self.peer = peer
+        self.max_hints = max_hints
+        self.path = path
+        self._hints: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        self._seq = 0
+        self._lock = threading.Lock()
+        # Serializes writes to the file; taken before _lock
+        self._io_lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        self._file = None
+        self._log_records = 0
+        self.dropped = 0
+        if path is not None:
+            self._load()
+            self._file = open(path, 'a', encoding='utf-8')
+
+    def __len__(self) -> int:
+        return len(self._hints)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring truncated hint record in {self.path}")
+                    break
+                self._log_records += 1
+                if 'ack' in record:
+                    for key, seq in record['ack']:
+                        current = self._hints.get(key)
+                        if current is not None and current[0] == seq:
+                            del self._hints[key]
+                elif 'update' in record:
+                    self._seq = max(self._seq, record['seq'])
+                    self._hints.pop(record['update']['key'], None)
+                    self._hints[record['update']['key']] = (record['seq'], record['update'])
+
+    def _append(self, records: List[Dict[str, Any]]):
+        # Caller holds _lock
+        if self._file is not None:
+            self._pending.extend(records)
+
+    def flush(self):
+        """Write buffered records to the log, compacting it when mostly stale"""
+        with self._io_lock:
+            with self._lock:
+                records, self._pending = self._pending, []
+                if self._file is None or not records:
+                    return
+                if self._log_records + len(records) > 2 * len(self._hints) + 1024:
+                    # The rewritten log already reflects every buffered record
+                    self._compact()
+                    return
+                self._log_records += len(records)
+            self._file.write(''.join(json.dumps(record, separators=(',', ':')) + '\n'
+                                     for record in records))
+            self._file.flush()
+
+    def _compact(self):
+        # Caller holds _io_lock and _lock
+        temp = self.path + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'peer': self.peer}) + '\n')
+            for seq, update in self._hints.values():
+                f.write(json.dumps({'seq': seq, 'update': update}, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(temp, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._log_records = len(self._hints) + 1
+
+    def add(self, updates: List[Dict[str, Any]]) -> int:
+        """Record updates, replacing older hints for the same key"""
+        records = []
+        with self._lock:
+            for update in updates:
+                key = update['key']
+                if key in self._hints:
+                    del self._hints[key]
+                elif len(self._hints) >= self.max_hints:
+                    self.dropped += 1
+                    continue
+                self._seq += 1
+                self._hints[key] = (self._seq, update)
+                records.append({'seq': self._seq, 'update': update})
+            self._append(records)
+        return len(records)
+
+    def peek(self, count: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """Return up to ``count`` of the oldest hints without removing them"""
+        with self._lock:
+            batch = []
+            for key in self._hints:
+                if len(batch) >= count:
+                    break
+                batch.append(self._hints[key])
+            return batch
+
+    def ack(self, batch: List[Tuple[int, Dict[str, Any]]]):
+        """Remove delivered hints unless a newer hint for the key arrived since"""
+        acked = []
+        with self._lock:
+            for seq, update in batch:
+                current = self._hints.get(update['key'])
+                if current is not None and current[0] == seq:
+                    del self._hints[update['key']]
+                    acked.append([update['key'], seq])
+            if acked:
+                self._append([{'ack': acked}])
+
+    def clear(self):
+        with self._io_lock, self._lock:
+            self._hints.clear()
+            self._pending = []
+            if self._file is not None:
+                self._compact()
+
+    def close(self):
+        self.flush()
+        with self._io_lock, self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class HintedHandoff:
+    """Holds writes for unreachable replicas and replays them on return.
+
+    Updates a peer could not receive, whether a send failed or the peer was
+    marked down, are kept in a bounded ``HintQueue`` per peer. When the peer
+    comes back they are replayed through ``/sync`` in batches, at no more
+    than ``rate`` updates per second so a recovering node is not flooded.
+    A peer down for longer than ``max_window`` seconds stops collecting
+    hints; anti-entropy reconciles it once it returns. The replay thread
+    also writes the hint logs, every ``flush_interval`` seconds.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_hints: int = 100000,
+                 batch_size: int = 100, rate: float = 1000.0, max_window: float = 3 * 3600,
+                 timeout: float = 2.0, retry_interval: float = 10.0,
+                 flush_interval: float = 0.05):
+        self.directory = directory
+        self.max_hints = max_hints
+        self.batch_size = batch_size
+        self.rate = rate
+        self.max_window = max_window
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.flush_interval = flush_interval
+        self.session = requests.Session()
+        self.queues: Dict[str, HintQueue] = {}
+        self._down: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.is_running = False
+
+        self.hinted = 0
+        self.replayed = 0
+        self.expired = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+        # Hints recovered from disk are replayed without waiting for new ones
+        if any(len(queue) for queue in self.queues.values()):
+            self._wake.set()
+            self.start()
+
+    def _load(self):
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(HINT_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            with open(path, encoding='utf-8') as f:
+                try:
+                    peer = json.loads(f.readline()).get('peer')
+                except ValueError:
+                    peer = None
+            if peer:
+                self.queues[peer] = HintQueue(peer, self.max_hints, path)
+                logger.info(f"Loaded {len(self.queues[peer])} hints for {peer}")
+
+    def _queue(self, peer: str) -> HintQueue:
+        queue = self.queues.get(peer)
+        if queue is None:
+            with self._lock:
+                queue = self.queues.get(peer)
+                if queue is None:
+                    path = None
+                    if self.directory is not None:
+                        name = re.sub(r'[^A-Za-z0-9._-]', '_', peer) + HINT_SUFFIX
+                        path = os.path.join(self.directory, name)
+                        with open(path, 'w', encoding='utf-8') as f:
+                            f.write(json.dumps({'peer': peer}) + '\n')
+                    queue = self.queues[peer] = HintQueue(peer, self.max_hints, path)
+        return queue
+
+    def start(self):
+        """Start the background replay thread"""
+        with self._lock:
+            if self.is_running:
+                return
+            self.is_running = True
+        self._thread = threading.Thread(target=self._run, name='hinted-handoff')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.is_running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        for queue in list(self.queues.values()):
+            queue.close()
+        self.session.close()
+
+    def hint(self, peer: str, updates: List[Dict[str, Any]]) -> int:
+        """Keep updates for a peer that did not receive them"""
+        down_since = self._down.get(peer)
+        if down_since is not None and time.time() - down_since > self.max_window:
+            return 0
+        added = self._queue(peer).add(updates)
+        self.hinted += added
+        self.start()
+        return added
+
+    def peer_down(self, peer: str):
+        with self._lock:
+            self._down.setdefault(peer, time.time())
+        self.start()
+
+    def peer_up(self, peer: str):
+        with self._lock:
+            self._down.pop(peer, None)
+        self._wake.set()
+
+    def is_down(self, peer: str) -> bool:
+        return peer in self._down
+
+    def hinting_peers(self) -> List[str]:
+        """Peers that are down but still within the hint window"""
+        now = time.time()
+        return [peer for peer, since in list(self._down.items())
+                if now - since <= self.max_window]
+
+    def pending(self, peer: str) -> int:
+        queue = self.queues.get(peer)
+        return len(queue) if queue is not None else 0
+
+    def replay(self, peer: str) -> int:
+        """Deliver a peer's hints, stopping at the first failed batch"""
+        queue = self.queues.get(peer)
+        delivered = 0
+        while queue is not None and len(queue) and not self.is_down(peer):
+            batch = queue.peek(self.batch_size)
+            start = time.monotonic()
+            try:
+                response = self.session.post(f"{peer}/sync",
+                                             json={'updates': [update for _, update in batch]},
+                                             timeout=self.timeout)
+                if response.status_code != 200:
+                    break
+            except requests.RequestException:
+                break
+            queue.ack(batch)
+            delivered += len(batch)
+            self.replayed += len(batch)
+            if self.rate:
+                pause = len(batch) / self.rate - (time.monotonic() - start)
+                if pause > 0:
+                    time.sleep(pause)
+        if delivered:
+            logger.info(f"Replayed {delivered} hinted updates to {peer}, "
+                        f"{self.pending(peer)} left")
+        return delivered
+
+    def _expire(self):
+        now = time.time()
+        for peer, since in list(self._down.items()):
+            queue = self.queues.get(peer)
+            if queue is not None and len(queue) and now - since > self.max_window:
+                logger.warning(f"{peer} down for over {self.max_window:.0f}s; "
+                               f"dropping {len(queue)} hints")
+                self.expired += len(queue)
+                queue.clear()
+
+    def _flush(self):
+        for queue in list(self.queues.values()):
+            queue.flush()
+
+    def _run(self):
+        next_replay = time.monotonic() + self.retry_interval
+        while self.is_running:
+            woken = self._wake.wait(self.flush_interval)
+            self._flush()
+            if not self.is_running:
+                return
+            if not woken and time.monotonic() < next_replay:
+                continue
+            self._wake.clear()
+            next_replay = time.monotonic() + self.retry_interval
+            self._expire()
+            for peer in list(self.queues):
+                if not self.is_down(peer) and len(self.queues[peer]):
+                    self.replay(peer)
+                    self._flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'hinted': self.hinted,
+            'replayed': self.replayed,
+            'expired': self.expired,
+            'peers': [{'peer': peer, 'pending': len(queue), 'dropped': queue.dropped,
+                       'down': self.is_down(peer)}
+                      for peer, queue in sorted(self.queues.items())]
+        }
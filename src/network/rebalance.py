@@ -0,0 +1,124 @@
+# src/network/rebalance.py
+import queue
+import threading
+import requests
+from typing import Any, Dict, List, Optional
+import logging
+from .ring import HashRing
+from src.store.codec import to_wire
+
+logger = logging.getLogger(__name__)
+
+class Rebalancer:
+    """Streams key ranges to their new owners after a ring change.
+
+    Only keys whose owner set changed are sent, in ``/sync`` batches of at
+    most ``batch_size`` entries. Keys this node no longer owns are dropped
+    locally once every new owner has accepted them.
+    """
+
+    def __init__(self, cluster, batch_size: int = 500, timeout: float = 10.0):
+        self.cluster = cluster
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.keys_moved = 0
+        self.keys_dropped = 0
+        self.failures = 0
+
+    def schedule(self, old_ring: HashRing, new_ring: HashRing):
+        """Queue a ring change for background rebalancing"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='rebalancer')
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put((old_ring, new_ring))
+
+    def stop(self):
+        """Stop after finishing the rebalances already queued"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def wait(self):
+        """Block until every queued rebalance has finished"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self.rebalance(*item)
+            except Exception as e:
+                logger.error(f"Rebalance failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def rebalance(self, old_ring: HashRing, new_ring: HashRing) -> int:
+        """Send keys whose ownership changed between two rings"""
+        store = self.cluster.store
+        me = self.cluster.node_address
+        rf = self.cluster.replication_factor
+        outgoing: Dict[str, List[Dict[str, Any]]] = {}
+        drop: List[str] = []
+        failed_peers = set()
+        moved = 0
+
+        for key, entry in store.iter_entries():
+            old_owners = old_ring.owners(key, rf)
+            new_owners = new_ring.owners(key, rf)
+            if set(old_owners) == set(new_owners):
+                continue
+            update = {'key': key, 'value': to_wire(entry.value), 'operation': 'update',
+                      'version': entry.version, 'timestamp': entry.timestamp,
+                      'expires_at': entry.expires_at}
+            for peer in new_owners:
+                if peer == me or peer in old_owners:
+                    continue
+                batch = outgoing.setdefault(peer, [])
+                batch.append(update)
+                if len(batch) >= self.batch_size:
+                    moved += self._send(peer, batch, failed_peers)
+                    outgoing[peer] = []
+            if me not in new_owners:
+                drop.append(key)
+
+        for peer, batch in outgoing.items():
+            if batch:
+                moved += self._send(peer, batch, failed_peers)
+
+        if failed_peers:
+            logger.warning(f"Keeping moved keys locally, transfer to {failed_peers} failed")
+        elif drop:
+            # Other owners still hold these keys, so they are not deleted
+            self.keys_dropped += store.drop_many(drop)
+        self.keys_moved += moved
+        return moved
+
+    def _send(self, peer: str, batch: List[Dict[str, Any]], failed_peers: set) -> int:
+        try:
+            response = self.session.post(f"{peer}/sync", json={'updates': batch},
+                                         timeout=self.timeout)
+            if response.status_code == 200:
+                return len(batch)
+        except requests.RequestException:
+            pass
+        self.failures += 1
+        failed_peers.add(peer)
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'pending': self._queue.qsize(),
+            'keys_moved': self.keys_moved,
+            'keys_dropped': self.keys_dropped,
+            'failures': self.failures
+        }
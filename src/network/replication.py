@@ -0,0 +1,185 @@
+# src/network/replication.py
+import time
+import threading
+import requests
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+import logging
+from src.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SYNC_LATENCY = REGISTRY.histogram('kv_replication_request_seconds',
+                                  'Round trip of /sync calls to a peer', ['peer', 'mode'])
+
+class PeerReplicator:
+    """Background replication stage for a single peer.
+
+    Updates are queued per key, so repeated writes to the same key collapse
+    into the latest one before they are sent. Pending updates are shipped in
+    batches as a single ``/sync`` call over a keep-alive session. Updates
+    that fail to send or do not fit in the queue go to ``on_failure``
+    instead of being lost.
+    """
+
+    def __init__(self, peer: str, max_pending: int = 10000, batch_size: int = 100,
+                 timeout: float = 2.0,
+                 on_failure: Optional[Callable[[str, List[Dict[str, Any]]], Any]] = None):
+        self.peer = peer
+        self.on_failure = on_failure
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._latency = SYNC_LATENCY.labels(peer, 'async')
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._enqueued_at: Dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._thread: Optional[threading.Thread] = None
+        self.is_running = False
+
+        self.sent = 0
+        self.batches = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.last_success: Optional[float] = None
+        self.last_batch_latency = 0.0
+
+    def start(self):
+        """Start the background sender thread"""
+        with self._cond:
+            if self.is_running:
+                return
+            self.is_running = True
+        self._thread = threading.Thread(target=self._run, name=f"replicator-{self.peer}")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the sender thread after draining what is already queued"""
+        with self._cond:
+            self.is_running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.session.close()
+
+    def enqueue(self, update: Dict[str, Any]) -> bool:
+        """Queue an update, replacing any pending update for the same key"""
+        return self.enqueue_many([update]) == 1
+
+    def enqueue_many(self, updates: List[Dict[str, Any]]) -> int:
+        """Queue a group of updates atomically, returning how many were accepted"""
+        accepted = 0
+        overflow = []
+        now = time.time()
+        with self._cond:
+            for update in updates:
+                key = update['key']
+                if key in self._pending:
+                    self._pending[key] = update
+                    self.coalesced += 1
+                elif len(self._pending) >= self.max_pending:
+                    self.dropped += 1
+                    overflow.append(update)
+                    continue
+                else:
+                    self._pending[key] = update
+                    self._enqueued_at[key] = now
+                accepted += 1
+            if accepted:
+                self._cond.notify()
+        if overflow and self.on_failure is not None:
+            self.on_failure(self.peer, overflow)
+        return accepted
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every queued update has been sent or failed"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._pending or self._in_flight:
+                if not self.is_running:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        if self._pending:
+            self.drain()
+        return not self._pending
+
+    def drain(self):
+        """Send every pending update from the calling thread"""
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._send(batch)
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                key, update = self._pending.popitem(last=False)
+                update = dict(update, enqueued_at=self._enqueued_at.pop(key, time.time()))
+                batch.append(update)
+            self._in_flight += len(batch)
+            return batch
+
+    def _send(self, batch: List[Dict[str, Any]]):
+        oldest = min(update.pop('enqueued_at') for update in batch)
+        start = time.perf_counter()
+        try:
+            response = self.session.post(f"{self.peer}/sync",
+                                         json={'updates': batch},
+                                         timeout=self.timeout)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        self._latency.observe(time.perf_counter() - start)
+        # Hand failures over before the batch stops counting as in flight
+        if not ok and self.on_failure is not None:
+            self.on_failure(self.peer, batch)
+
+        with self._cond:
+            self._in_flight -= len(batch)
+            if ok:
+                self.sent += len(batch)
+                self.batches += 1
+                self.last_success = time.time()
+                self.last_batch_latency = self.last_success - oldest
+            else:
+                self.failed += len(batch)
+                logger.warning(f"Replication of {len(batch)} updates to {self.peer} failed")
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.is_running and not self._pending:
+                    self._cond.wait()
+                if not self.is_running and not self._pending:
+                    return
+            batch = self._take_batch()
+            if batch:
+                self._send(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, lag and counters for this peer"""
+        with self._cond:
+            oldest = min(self._enqueued_at.values()) if self._enqueued_at else None
+            return {
+                'peer': self.peer,
+                'queue_depth': len(self._pending),
+                'in_flight': self._in_flight,
+                'lag_seconds': time.time() - oldest if oldest is not None else 0.0,
+                'last_batch_latency': self.last_batch_latency,
+                'last_success': self.last_success,
+                'sent': self.sent,
+                'batches': self.batches,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced
+            }
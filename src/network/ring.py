@@ -0,0 +1,78 @@
+# src/network/ring.py
+import bisect
+import hashlib
+from typing import Dict, Iterable, List
+
+DEFAULT_VIRTUAL_NODES = 128
+
+def _position(label: str) -> int:
+    return int.from_bytes(hashlib.md5(label.encode('utf-8')).digest()[:8], 'big')
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes.
+
+    Every node is placed on the ring ``vnodes`` times. A key is owned by the
+    first ``n`` distinct nodes found walking clockwise from its position, so
+    adding or removing a node only moves the ranges next to its points.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = DEFAULT_VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self._nodes: Dict[str, List[int]] = {}
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(self._nodes)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def add_node(self, node: str) -> bool:
+        if node in self._nodes:
+            return False
+        points = [_position(f"{node}#{i}") for i in range(self.vnodes)]
+        self._nodes[node] = points
+        for point in points:
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+        return True
+
+    def remove_node(self, node: str) -> bool:
+        if node not in self._nodes:
+            return False
+        del self._nodes[node]
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners)
+                if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+        return True
+
+    def owners(self, key: str, count: int) -> List[str]:
+        """Return the ``count`` distinct nodes responsible for ``key``"""
+        if not self._points:
+            return []
+        count = min(count, len(self._nodes))
+        result: List[str] = []
+        index = bisect.bisect(self._points, _position(key))
+        for step in range(len(self._points)):
+            owner = self._owners[(index + step) % len(self._points)]
+            if owner not in result:
+                result.append(owner)
+                if len(result) == count:
+                    break
+        return result
+
+    def copy(self) -> 'HashRing':
+        ring = HashRing(vnodes=self.vnodes)
+        ring._points = list(self._points)
+        ring._owners = list(self._owners)
+        ring._nodes = {node: list(points) for node, points in self._nodes.items()}
+        return ring
@@ -0,0 +1,263 @@
+# src/profiling.py
+import os
+import sys
+import time
+import random
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+from src.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_INTERVAL = 0.005
+MAX_PROFILE_SECONDS = 300.0
+DEFAULT_SLOW_THRESHOLD = 0.1
+DEFAULT_TRACE_CAPACITY = 100
+
+TRACE_SPANS = REGISTRY.histogram('kv_trace_span_seconds',
+                                 'Time spent in each phase of sampled requests', ['span'])
+
+class SamplingProfiler:
+    """Samples the stack of every thread at a fixed interval.
+
+    Identical stacks are counted and reported in collapsed format, one
+    ``frame;frame;frame count`` line per stack, root first, which flame
+    graph tools read directly. Nothing runs between profiles.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._labels: Dict[Any, str] = {}
+        self.counts: Dict[str, int] = {}
+        self.samples = 0
+        self.interval = DEFAULT_PROFILE_INTERVAL
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval: float = DEFAULT_PROFILE_INTERVAL) -> bool:
+        """Profile for ``seconds`` in the background; False if already running"""
+        with self._lock:
+            if self.running:
+                return False
+            self.counts = {}
+            self.samples = 0
+            self.interval = interval
+            self.started_at = time.time()
+            self.finished_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(seconds,),
+                                            name='profiler')
+            self._thread.daemon = True
+            self._thread.start()
+        return True
+
+    def stop(self) -> bool:
+        """Stop a running profile and wait for it; False if none was running"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return False
+        self._stop.set()
+        thread.join()
+        return True
+
+    def _run(self, seconds: float):
+        me = threading.get_ident()
+        deadline = time.perf_counter() + seconds
+        while not self._stop.is_set() and time.perf_counter() < deadline:
+            self._sample(me)
+            self._stop.wait(self.interval)
+        self.finished_at = time.time()
+        logger.info(f"Profile finished: {self.samples} samples, {len(self.counts)} stacks")
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = \
+                f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _sample(self, me: int):
+        frames = sys._current_frames()
+        counts = {}
+        for ident, frame in frames.items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            counts[key] = counts.get(key, 0) + 1
+        with self._lock:
+            for key, count in counts.items():
+                self.counts[key] = self.counts.get(key, 0) + count
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """Return the counted stacks, most frequent first"""
+        with self._lock:
+            counts = sorted(self.counts.items(), key=lambda item: -item[1])
+        return ''.join(f"{stack} {count}\n" for stack, count in counts)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'running': self.running,
+            'samples': self.samples,
+            'stacks': len(self.counts),
+            'interval': self.interval,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+class Trace:
+    """Timed phases of one request"""
+    __slots__ = ('route', 'method', 'started_at', 'start', 'spans', 'duration', 'status')
+
+    def __init__(self, route: str, method: str):
+        self.route = route
+        self.method = method
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        # (name, offset from the start, duration)
+        self.spans: List[Tuple[str, float, float]] = []
+        self.duration = 0.0
+        self.status = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'route': self.route,
+            'method': self.method,
+            'status': self.status,
+            'started_at': self.started_at,
+            'duration_ms': self.duration * 1000,
+            'spans': [{'name': name, 'offset_ms': offset * 1000, 'duration_ms': duration * 1000}
+                      for name, offset, duration in self.spans]
+        }
+
+class _Span:
+    __slots__ = ('trace', 'name', 'start')
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        self.trace.spans.append((self.name, self.start - self.trace.start, end - self.start))
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+class Tracer:
+    """Per-request spans for a sampled fraction of requests.
+
+    A sampled request carries a Trace in a thread-local; ``span`` times a
+    phase of it and is a shared no-op object for every other request, so
+    with a sample rate of 0 tracing costs one attribute lookup per span.
+    Requests slower than ``slow_threshold`` seconds are kept in a ring of
+    the most recent ``capacity`` ones.
+    """
+
+    def __init__(self, sample_rate: float = 0.0,
+                 slow_threshold: float = DEFAULT_SLOW_THRESHOLD,
+                 capacity: int = DEFAULT_TRACE_CAPACITY):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.sample_rate = 0.0
+        self.slow_threshold = slow_threshold
+        self._slow: deque = deque(maxlen=capacity)
+        self.sampled = 0
+        self.configure(sample_rate)
+
+    def configure(self, sample_rate: Optional[float] = None,
+                  slow_threshold: Optional[float] = None, capacity: Optional[int] = None):
+        if sample_rate is not None:
+            if not 0 <= sample_rate <= 1:
+                raise ValueError("sample_rate must be between 0 and 1")
+            self.sample_rate = sample_rate
+        if slow_threshold is not None:
+            if slow_threshold < 0:
+                raise ValueError("slow_threshold must not be negative")
+            self.slow_threshold = slow_threshold
+        if capacity is not None:
+            if capacity < 1:
+                raise ValueError("capacity must be at least 1")
+            with self._lock:
+                self._slow = deque(self._slow, maxlen=capacity)
+
+    def begin(self, route: str, method: str) -> Optional[Trace]:
+        """Start tracing the current request if it is sampled"""
+        rate = self.sample_rate
+        trace = Trace(route, method) if rate and random.random() < rate else None
+        self._local.trace = trace
+        return trace
+
+    def finish(self, status: int) -> Optional[Trace]:
+        """Close the current request's trace, keeping it if it was slow"""
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            return None
+        self._local.trace = None
+        trace.duration = time.perf_counter() - trace.start
+        trace.status = status
+        for name, _, duration in trace.spans:
+            TRACE_SPANS.labels(name).observe(duration)
+        with self._lock:
+            self.sampled += 1
+            if trace.duration >= self.slow_threshold:
+                self._slow.append(trace)
+        return trace
+
+    def span(self, name: str):
+        """Context manager timing one phase of the current request"""
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            return _NO_SPAN
+        return _Span(trace, name)
+
+    def record(self, name: str, duration: float):
+        """Add a phase timed elsewhere, such as a lock wait, ending now"""
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.spans.append((name, time.perf_counter() - duration - trace.start, duration))
+
+    def slowest(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the kept slow requests, slowest first"""
+        with self._lock:
+            traces = sorted(self._slow, key=lambda trace: -trace.duration)
+        return [trace.to_dict() for trace in traces[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'sample_rate': self.sample_rate,
+            'slow_threshold_ms': self.slow_threshold * 1000,
+            'capacity': self._slow.maxlen,
+            'sampled': self.sampled,
+            'slow': len(self._slow)
+        }
+
+TRACER = Tracer()
+PROFILER = SamplingProfiler()
+
+def record_lock_wait(duration: float):
+    TRACER.record('lock_wait', duration)
@@ -0,0 +1,123 @@
+# src/server.py
+import os
+import time
+import signal
+import socket
+import logging
+from typing import Dict, Optional
+from werkzeug.serving import make_server
+
+logger = logging.getLogger(__name__)
+
+class PreforkServer:
+    """Serves a WSGI app from several forked worker processes on one port.
+
+    With SO_REUSEPORT every worker listens on a socket of its own bound to
+    the same port, and the kernel spreads new connections across them, so
+    no worker accepts on behalf of another. Without it the workers share
+    one listening socket. Each worker handles requests in threads.
+
+    The parent only supervises: it restarts workers that exit and stops
+    them all on SIGTERM or SIGINT. Anything the workers must share, such
+    as a SharedStore, has to exist before ``serve_forever`` forks them,
+    and the parent should not have started threads by then.
+    """
+
+    def __init__(self, app, host: str = '0.0.0.0', port: int = 8000, workers: int = 2,
+                 backlog: int = 1024, restart_delay: float = 1.0):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.backlog = backlog
+        self.restart_delay = restart_delay
+        self.reuse_port = hasattr(socket, 'SO_REUSEPORT')
+        self._socket: Optional[socket.socket] = None
+        self._children: Dict[int, float] = {}
+        self._stopping = False
+
+    def _new_socket(self) -> socket.socket:
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        return sock
+
+    def bind(self) -> int:
+        """Claim the port before forking and return it, resolving port 0.
+
+        With SO_REUSEPORT the parent's socket never listens, so it gets no
+        connections; it only keeps the port while workers come and go.
+        """
+        if self._socket is None:
+            self._socket = self._new_socket()
+            self.port = self._socket.getsockname()[1]
+            if not self.reuse_port:
+                self._socket.listen(self.backlog)
+        return self.port
+
+    def serve_forever(self):
+        self.bind()
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        for _ in range(self.workers):
+            self._spawn()
+        logger.info(f"Serving on {self.host}:{self.port} with {self.workers} workers "
+                    f"({'SO_REUSEPORT' if self.reuse_port else 'shared socket'})")
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self._children.pop(pid, None)
+            if started is None or self._stopping:
+                continue
+            logger.warning(f"Worker {pid} exited with status {status}; restarting")
+            # Back off so a worker that fails at startup does not spin
+            if time.time() - started < self.restart_delay:
+                time.sleep(self.restart_delay)
+            self._spawn()
+        self._socket.close()
+
+    def stop(self):
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _handle_stop(self, signum, frame):
+        self.stop()
+
+    def _spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker()
+        self._children[pid] = time.time()
+        return pid
+
+    def _run_worker(self):
+        # Terminal interrupts reach the whole process group; the parent
+        # decides when workers stop
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        code = 0
+        try:
+            if self.reuse_port:
+                listener = self._new_socket()
+                listener.listen(self.backlog)
+            else:
+                listener = self._socket
+            server = make_server(self.host, self.port, self.app, threaded=True,
+                                 fd=listener.fileno())
+            server.serve_forever()
+        except Exception as e:
+            logger.error(f"Worker {os.getpid()} failed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
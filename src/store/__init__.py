@@ -1,6 +1,14 @@
 from .store import DistributedStore, StorageEntry
 from .node import Node, NodeState, NodeMetadata
 from .consistency import ConsistencyLevel, ConsistencyManager, WriteResult, ReadResult
+from .merkle import MerkleTree
+from .eviction import EvictionPolicy, LRUPolicy, LFUPolicy, SampledLRUPolicy
+from .persistence import PersistenceManager, WriteAheadLog, FsyncPolicy
+from .codec import Codec, ValueCodec, EncodedValue, register_codec
+from .changes import ChangeFeed, ChangeEvent
+from .snapshot import Snapshot
+from .shared import SharedStore, SharedHashTable
+from .atomic import IncompatibleValueError
 
 __all__ = [
     'DistributedStore',
@@ -11,5 +19,23 @@ __all__ = [
     'ConsistencyLevel',
     'ConsistencyManager',
     'WriteResult',
-    'ReadResult'
+    'ReadResult',
+    'PersistenceManager',
+    'WriteAheadLog',
+    'FsyncPolicy',
+    'MerkleTree',
+    'EvictionPolicy',
+    'LRUPolicy',
+    'LFUPolicy',
+    'SampledLRUPolicy',
+    'Codec',
+    'ValueCodec',
+    'EncodedValue',
+    'register_codec',
+    'ChangeFeed',
+    'ChangeEvent',
+    'Snapshot',
+    'SharedStore',
+    'SharedHashTable',
+    'IncompatibleValueError'
 ]
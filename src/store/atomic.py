@@ -0,0 +1,64 @@
+# src/store/atomic.py
+from typing import Any, Callable, Dict, List
+
+class IncompatibleValueError(ValueError):
+    """The stored value has the wrong type for an atomic operation"""
+
+# Transforms for DistributedStore.modify. They get the current value, or
+# None for a missing key, and must return a new object: the current one
+# may still be read by lock-free readers and open snapshots.
+
+def _is_integer(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def increment(delta: int, initial: int = 0) -> Callable[[Any], int]:
+    """Add ``delta`` to an integer; a missing key starts from ``initial``"""
+    if not _is_integer(delta) or not _is_integer(initial):
+        raise ValueError("delta and initial must be integers")
+
+    def transform(current: Any) -> int:
+        if current is None:
+            return initial + delta
+        if not _is_integer(current):
+            raise IncompatibleValueError("Value is not an integer")
+        return current + delta
+    return transform
+
+def append(items: List[Any]) -> Callable[[Any], List[Any]]:
+    """Append ``items`` to a list; a missing key starts empty"""
+    if not isinstance(items, list):
+        raise ValueError("items must be a list")
+
+    def transform(current: Any) -> List[Any]:
+        if current is None:
+            return list(items)
+        if not isinstance(current, list):
+            raise IncompatibleValueError("Value is not a list")
+        return current + items
+    return transform
+
+def _merge_patch(target: Any, patch: Any) -> Any:
+    if not isinstance(patch, dict):
+        return patch
+    merged = dict(target) if isinstance(target, dict) else {}
+    for field, value in patch.items():
+        if value is None:
+            merged.pop(field, None)
+        else:
+            merged[field] = _merge_patch(merged.get(field), value)
+    return merged
+
+def merge_fields(patch: Dict[str, Any]) -> Callable[[Any], Dict[str, Any]]:
+    """Apply a JSON merge patch (RFC 7386) to an object.
+
+    Fields set to null are removed and nested objects are merged; a
+    missing key starts as an empty object.
+    """
+    if not isinstance(patch, dict):
+        raise ValueError("fields must be an object")
+
+    def transform(current: Any) -> Dict[str, Any]:
+        if current is not None and not isinstance(current, dict):
+            raise IncompatibleValueError("Value is not an object")
+        return _merge_patch(current, patch)
+    return transform
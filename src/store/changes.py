@@ -0,0 +1,118 @@
+# src/store/changes.py
+import threading
+from typing import Any, List, Optional, Tuple
+
+DEFAULT_CAPACITY = 10000
+
+class ChangeEvent:
+    __slots__ = ('version', 'key', 'operation', 'value', 'key_version')
+
+    def __init__(self, version: int, key: str, operation: str, value: Any,
+                 key_version: Optional[int]):
+        self.version = version
+        self.key = key
+        self.operation = operation
+        self.value = value
+        self.key_version = key_version
+
+class ChangeFeed:
+    """The most recent store changes in one fixed-size ring.
+
+    Events are appended in global version order by the store while it holds
+    its version lock, so every watcher reads the same ring and keeps only
+    its own position: a version. Reads take no lock; a reader that falls
+    more than ``capacity`` events behind is told its history is gone.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._events: List[Optional[ChangeEvent]] = [None] * capacity
+        self._count = 0
+        self.last_version = 0
+        # Version of the newest event overwritten so far
+        self.evicted_version = 0
+        self._cond = threading.Condition()
+        self._waiters = 0
+
+    def append(self, version: int, key: str, operation: str, value: Any = None,
+               key_version: Optional[int] = None):
+        """Record a change; the caller serializes appends in version order"""
+        slot = self._count % self.capacity
+        old = self._events[slot]
+        if old is not None:
+            self.evicted_version = old.version
+        self._events[slot] = ChangeEvent(version, key, operation, value, key_version)
+        self._count += 1
+        self.last_version = version
+        # Waking waiters needs the condition lock, so skip it when nobody waits
+        if self._waiters:
+            with self._cond:
+                self._cond.notify_all()
+
+    def reset(self, version: int):
+        """Start an empty feed at ``version``, e.g. after recovery from disk.
+
+        Watchers resuming from an older version are told they missed events.
+        """
+        self._events = [None] * self.capacity
+        self._count = 0
+        self.last_version = self.evicted_version = version
+
+    def oldest_version(self) -> Optional[int]:
+        """Version of the oldest event still held, None while empty"""
+        count = self._count
+        if not count:
+            return None
+        event = self._events[max(0, count - self.capacity) % self.capacity]
+        return event.version
+
+    def _first_after(self, version: int, lower: int, upper: int) -> int:
+        # Versions increase with position, so bisect over positions
+        while lower < upper:
+            middle = (lower + upper) // 2
+            if self._events[middle % self.capacity].version <= version:
+                lower = middle + 1
+            else:
+                upper = middle
+        return lower
+
+    def read(self, after: int, limit: int = 1000) -> Tuple[List[ChangeEvent], bool]:
+        """Return up to ``limit`` events newer than ``after``, oldest first.
+
+        The flag is False when events after ``after`` have already been
+        overwritten, meaning the caller missed changes and must resync.
+        """
+        while True:
+            count = self._count
+            start = max(0, count - self.capacity)
+            position = self._first_after(after, start, count)
+            events = [self._events[i % self.capacity]
+                      for i in range(position, min(count, position + limit))]
+            if after < self.evicted_version:
+                return [], False
+            # Appends may have lapped slots during the search; the answer
+            # stands if its boundary and the copied slots are still intact
+            anchor = position - 1 if position > start else position
+            if self._count - self.capacity > anchor:
+                continue
+            if position > start and self._events[anchor % self.capacity].version > after:
+                continue
+            if events and events[0].version <= after:
+                continue
+            return events, True
+
+    def wait(self, after: int, timeout: float) -> bool:
+        """Block until an event newer than ``after`` exists or ``timeout`` passes"""
+        if self.last_version > after:
+            return True
+        with self._cond:
+            self._waiters += 1
+            try:
+                return self._cond.wait_for(lambda: self.last_version > after, timeout)
+            finally:
+                self._waiters -= 1
+
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
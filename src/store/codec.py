@@ -0,0 +1,148 @@
+# src/store/codec.py
+import sys
+import json
+import zlib
+import base64
+from typing import Any, Dict, Optional
+from .eviction import estimate_size
+
+DEFAULT_THRESHOLD = 4096
+
+# Kinds of payload an EncodedValue restores on decode
+JSON, TEXT, BINARY = 'json', 'text', 'binary'
+
+# Marker keys used when values travel as JSON, between nodes or to disk
+B64_MARKER = '__b64__'
+CODEC_MARKER = '__codec__'
+ESCAPE_MARKER = '__json__'
+_MARKERS = (B64_MARKER, CODEC_MARKER, ESCAPE_MARKER)
+
+class Codec:
+    """A byte-level compression scheme for stored values"""
+    name = 'none'
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+class ZlibCodec(Codec):
+    name = 'zlib'
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+CODECS: Dict[str, Codec] = {}
+
+def register_codec(codec: Codec):
+    """Make a codec available for encoding and for decoding values from peers"""
+    CODECS[codec.name] = codec
+
+register_codec(ZlibCodec())
+
+class EncodedValue:
+    """A stored value kept in compressed form and decoded on each read"""
+    __slots__ = ('codec', 'kind', 'data')
+
+    def __init__(self, codec: str, kind: str, data: bytes):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown value codec: {codec}")
+        self.codec = codec
+        self.kind = kind
+        self.data = data
+
+    def decode(self) -> Any:
+        payload = CODECS[self.codec].decompress(self.data)
+        if self.kind == BINARY:
+            return payload
+        if self.kind == TEXT:
+            return payload.decode('utf-8', 'surrogatepass')
+        return json.loads(payload)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, EncodedValue) and (self.codec, self.kind, self.data) == \
+            (other.codec, other.kind, other.data)
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sys.getsizeof(self.data)
+
+class ValueCodec:
+    """Compresses values whose serialized size reaches ``threshold`` bytes.
+
+    Smaller values, and values that do not shrink by at least an eighth,
+    are kept as they are, so the common small-value path costs one type
+    check and a size estimate.
+    """
+
+    def __init__(self, codec: str = 'zlib', threshold: int = DEFAULT_THRESHOLD):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown value codec: {codec}")
+        if threshold < 1:
+            raise ValueError("threshold must be positive")
+        self.codec = CODECS[codec]
+        self.threshold = threshold
+
+    def encode(self, value: Any) -> Any:
+        if isinstance(value, (bytes, bytearray)):
+            if len(value) < self.threshold:
+                return value
+            kind, payload = BINARY, bytes(value)
+        elif isinstance(value, str):
+            if len(value) < self.threshold:
+                return value
+            kind, payload = TEXT, value.encode('utf-8', 'surrogatepass')
+        elif isinstance(value, (dict, list)):
+            if estimate_size(value) < self.threshold:
+                return value
+            kind, payload = JSON, json.dumps(value, separators=(',', ':')).encode('utf-8')
+        else:
+            return value
+        if len(payload) < self.threshold:
+            return value
+        data = self.codec.compress(payload)
+        if len(data) > len(payload) - len(payload) // 8:
+            return value
+        return EncodedValue(self.codec.name, kind, data)
+
+def decode_value(value: Any) -> Any:
+    """Return the value a client stored, decoding it if it is encoded"""
+    return value.decode() if isinstance(value, EncodedValue) else value
+
+def to_wire(value: Any) -> Any:
+    """Make a stored value JSON-safe without decoding it"""
+    if isinstance(value, EncodedValue):
+        return {CODEC_MARKER: value.codec, 'kind': value.kind,
+                'data': base64.b64encode(value.data).decode('ascii')}
+    if isinstance(value, (bytes, bytearray)):
+        return {B64_MARKER: base64.b64encode(value).decode('ascii')}
+    if isinstance(value, dict) and any(marker in value for marker in _MARKERS):
+        # A client document that merely looks like a marker
+        return {ESCAPE_MARKER: value}
+    return value
+
+def from_wire(value: Any) -> Any:
+    """Undo ``to_wire``; other values are returned unchanged"""
+    if not isinstance(value, dict):
+        return value
+    if CODEC_MARKER in value:
+        return EncodedValue(value[CODEC_MARKER], value['kind'], base64.b64decode(value['data']))
+    if len(value) == 1:
+        if isinstance(value.get(B64_MARKER), str):
+            return base64.b64decode(value[B64_MARKER])
+        if ESCAPE_MARKER in value:
+            return value[ESCAPE_MARKER]
+    return value
+
+def create_value_codec(codec: Optional[str], threshold: int = DEFAULT_THRESHOLD
+                       ) -> Optional[ValueCodec]:
+    """Build a ValueCodec, or None when compression is turned off"""
+    if codec is None or codec.lower() in ('', 'none', 'off'):
+        return None
+    return ValueCodec(codec.lower(), threshold)
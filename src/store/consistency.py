@@ -7,6 +7,16 @@ class ConsistencyLevel(Enum):
     QUORUM = 2
     ALL = 3
 
+    @classmethod
+    def parse(cls, name: Optional[str], default: 'ConsistencyLevel') -> 'ConsistencyLevel':
+        """Parse a level name such as 'quorum', raising ValueError if unknown"""
+        if not name:
+            return default
+        try:
+            return cls[name.upper()]
+        except KeyError:
+            raise ValueError(f"Unknown consistency level: {name}")
+
 class ConsistencyManager:
     def __init__(self, node_count: int):
         self.node_count = node_count
@@ -21,6 +31,14 @@ class ConsistencyManager:
             return self.node_count
         return self.quorum  # default to QUORUM
 
+    @staticmethod
+    def select_latest(results: List['ReadResult']) -> Optional['ReadResult']:
+        """Pick the result with the highest version, newest timestamp first on ties"""
+        found = [result for result in results if result.version > 0]
+        if not found:
+            return None
+        return max(found, key=lambda result: (result.version, result.timestamp))
+
 class WriteResult:
     def __init__(self):
         self.success = False
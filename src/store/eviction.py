@@ -0,0 +1,185 @@
+# src/store/eviction.py
+import sys
+import random
+import itertools
+from threading import Lock
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+def estimate_size(value: Any) -> int:
+    """Cheap approximation of the memory held by a JSON-like value"""
+    if isinstance(value, str):
+        return 49 + len(value)
+    if isinstance(value, (bytes, bytearray)):
+        return 33 + len(value)
+    if isinstance(value, dict):
+        return 64 + 16 * len(value) + sum(estimate_size(k) + estimate_size(v)
+                                          for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + 8 * len(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+class EvictionPolicy:
+    """Tracks key usage for one shard and picks keys to evict.
+
+    ``record_insert``, ``record_remove`` and ``choose_victim`` run under the
+    shard lock. ``record_access`` runs on the lock-free read path, so it must
+    be safe without it.
+    """
+    name = 'none'
+
+    def record_insert(self, key: str):
+        raise NotImplementedError
+
+    def record_access(self, key: str):
+        raise NotImplementedError
+
+    def record_remove(self, key: str):
+        raise NotImplementedError
+
+    def choose_victim(self, exclude: Optional[str] = None) -> Optional[str]:
+        raise NotImplementedError
+
+class LRUPolicy(EvictionPolicy):
+    """Exact least-recently-used order kept in an OrderedDict"""
+    name = 'lru'
+
+    def __init__(self):
+        self._order: "OrderedDict[str, None]" = OrderedDict()
+
+    def record_insert(self, key: str):
+        self._order[key] = None
+        self._order.move_to_end(key)
+
+    def record_access(self, key: str):
+        # move_to_end is a single C call, so it is atomic under the GIL
+        try:
+            self._order.move_to_end(key)
+        except KeyError:
+            pass
+
+    def record_remove(self, key: str):
+        self._order.pop(key, None)
+
+    def choose_victim(self, exclude: Optional[str] = None) -> Optional[str]:
+        for key in self._order:
+            if key != exclude:
+                return key
+        return None
+
+class LFUPolicy(EvictionPolicy):
+    """Least-frequently-used with O(1) frequency buckets.
+
+    Ties within a frequency are broken by least recent use. Bookkeeping spans
+    several structures, so it uses a lock private to the shard's policy.
+    """
+    name = 'lfu'
+
+    def __init__(self):
+        self._freq: Dict[str, int] = {}
+        self._buckets: Dict[int, "OrderedDict[str, None]"] = {}
+        self._min_freq = 0
+        self._lock = Lock()
+
+    def _bump(self, key: str, freq: int):
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+            if self._min_freq == freq:
+                self._min_freq = freq + 1
+        self._freq[key] = freq + 1
+        self._buckets.setdefault(freq + 1, OrderedDict())[key] = None
+
+    def record_insert(self, key: str):
+        with self._lock:
+            freq = self._freq.get(key)
+            if freq is not None:
+                self._bump(key, freq)
+                return
+            self._freq[key] = 1
+            self._buckets.setdefault(1, OrderedDict())[key] = None
+            self._min_freq = 1
+
+    def record_access(self, key: str):
+        with self._lock:
+            freq = self._freq.get(key)
+            if freq is not None:
+                self._bump(key, freq)
+
+    def record_remove(self, key: str):
+        with self._lock:
+            freq = self._freq.pop(key, None)
+            if freq is None:
+                return
+            bucket = self._buckets[freq]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[freq]
+
+    def choose_victim(self, exclude: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            if not self._freq:
+                return None
+            if self._min_freq not in self._buckets:
+                self._min_freq = min(self._buckets)
+            for freq in [self._min_freq] + sorted(self._buckets):
+                for key in self._buckets[freq]:
+                    if key != exclude:
+                        return key
+            return None
+
+class SampledLRUPolicy(EvictionPolicy):
+    """Approximate LRU in the style of Redis: evict the oldest of a few random keys.
+
+    Access only stores a clock value in a dict, which keeps the read path to
+    a single atomic assignment.
+    """
+    name = 'sampled'
+
+    def __init__(self, samples: int = 5):
+        self.samples = samples
+        self._clock = itertools.count()
+        self._last_access: Dict[str, int] = {}
+        self._keys: List[str] = []
+        self._positions: Dict[str, int] = {}
+
+    def record_insert(self, key: str):
+        if key not in self._positions:
+            self._positions[key] = len(self._keys)
+            self._keys.append(key)
+        self._last_access[key] = next(self._clock)
+
+    def record_access(self, key: str):
+        if key in self._positions:
+            self._last_access[key] = next(self._clock)
+
+    def record_remove(self, key: str):
+        position = self._positions.pop(key, None)
+        if position is None:
+            return
+        last = self._keys.pop()
+        if last != key:
+            self._keys[position] = last
+            self._positions[last] = position
+        self._last_access.pop(key, None)
+
+    def choose_victim(self, exclude: Optional[str] = None) -> Optional[str]:
+        candidates = [key for key in
+                      (random.choice(self._keys) for _ in range(self.samples) if self._keys)
+                      if key != exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda key: self._last_access.get(key, 0))
+
+EVICTION_POLICIES = {
+    LRUPolicy.name: LRUPolicy,
+    LFUPolicy.name: LFUPolicy,
+    SampledLRUPolicy.name: SampledLRUPolicy
+}
+
+def create_policy(name: str) -> EvictionPolicy:
+    try:
+        return EVICTION_POLICIES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown eviction policy: {name}")
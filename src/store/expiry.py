@@ -0,0 +1,81 @@
+# src/store/expiry.py
+import time
+import heapq
+import threading
+from typing import List, Optional, Tuple
+
+class ExpiryScheduler:
+    """Min-heap of key deadlines drained by a background thread.
+
+    Expired keys are removed in batches of at most ``batch_size``, each batch
+    grouped by shard so a shard lock is only held for a handful of deletes.
+    Heap items are hints: a key rewritten with another TTL (or none) leaves a
+    stale item behind, which the store ignores when it comes due.
+    """
+
+    def __init__(self, store, batch_size: int = 100, max_sleep: float = 1.0):
+        self.store = store
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self._heap: List[Tuple[float, str]] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.is_running = False
+        self.expired = 0
+
+    def schedule(self, key: str, expires_at: float):
+        """Register a deadline, starting the expirer thread on first use"""
+        with self._cond:
+            heapq.heappush(self._heap, (expires_at, key))
+            if self._heap[0][1] == key:
+                self._cond.notify()
+            if self._thread is None:
+                self.is_running = True
+                self._thread = threading.Thread(target=self._run, name='expirer')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self):
+        """Stop the expirer thread"""
+        with self._cond:
+            self.is_running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def _due(self, now: float) -> List[str]:
+        with self._cond:
+            keys = []
+            while self._heap and self._heap[0][0] <= now and len(keys) < self.batch_size:
+                keys.append(heapq.heappop(self._heap)[1])
+            return keys
+
+    def run_once(self, now: Optional[float] = None) -> int:
+        """Remove every key due by ``now`` one bounded batch at a time"""
+        now = time.time() if now is None else now
+        removed = 0
+        while True:
+            keys = self._due(now)
+            if not keys:
+                break
+            removed += self.store.expire_keys(keys, now)
+        self.expired += removed
+        return removed
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self.is_running:
+                    return
+                delay = self.max_sleep
+                if self._heap:
+                    delay = min(delay, max(0.0, self._heap[0][0] - time.time()))
+                if delay > 0:
+                    self._cond.wait(delay)
+                if not self.is_running:
+                    return
+            self.run_once()
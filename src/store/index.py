@@ -0,0 +1,151 @@
+# src/store/index.py
+import bisect
+import heapq
+import threading
+from typing import Iterator, List, Optional, Sequence
+
+DEFAULT_BLOCK_SIZE = 512
+
+class SortedKeyIndex:
+    """Ordered set of keys kept as a list of sorted blocks.
+
+    ``_maxes`` holds the last key of every block, so finding a key is a
+    bisect over the blocks followed by a bisect inside one block: O(log n).
+    Blocks split when they reach twice ``block_size`` and are dropped when
+    empty, so inserts and removals only shift one block's worth of items.
+
+    Range iteration copies at most ``batch`` keys at a time under the lock
+    and re-seeks after the last key it returned, so a long scan never holds
+    the lock for longer than one small copy and sees keys added behind its
+    position as they land.
+    """
+
+    def __init__(self, block_size: int = DEFAULT_BLOCK_SIZE):
+        self.block_size = block_size
+        self._blocks: List[List[str]] = []
+        self._maxes: List[str] = []
+        self._len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            index = bisect.bisect_left(self._maxes, key)
+            if index == len(self._maxes):
+                return False
+            block = self._blocks[index]
+            position = bisect.bisect_left(block, key)
+            return position < len(block) and block[position] == key
+
+    def add(self, key: str) -> bool:
+        with self._lock:
+            if not self._blocks:
+                self._blocks.append([key])
+                self._maxes.append(key)
+                self._len = 1
+                return True
+            index = bisect.bisect_left(self._maxes, key)
+            if index == len(self._maxes):
+                index -= 1
+                self._blocks[index].append(key)
+                self._maxes[index] = key
+            else:
+                block = self._blocks[index]
+                position = bisect.bisect_left(block, key)
+                if block[position] == key:
+                    return False
+                block.insert(position, key)
+            self._len += 1
+            block = self._blocks[index]
+            if len(block) >= 2 * self.block_size:
+                half = block[self.block_size:]
+                del block[self.block_size:]
+                self._blocks.insert(index + 1, half)
+                self._maxes[index] = block[-1]
+                self._maxes.insert(index + 1, half[-1])
+            return True
+
+    def remove(self, key: str) -> bool:
+        with self._lock:
+            index = bisect.bisect_left(self._maxes, key)
+            if index == len(self._maxes):
+                return False
+            block = self._blocks[index]
+            position = bisect.bisect_left(block, key)
+            if position == len(block) or block[position] != key:
+                return False
+            del block[position]
+            self._len -= 1
+            if not block:
+                del self._blocks[index]
+                del self._maxes[index]
+            elif position == len(block):
+                self._maxes[index] = block[-1]
+            return True
+
+    def _copy_from(self, key: Optional[str], inclusive: bool, count: int) -> List[str]:
+        with self._lock:
+            if key is None:
+                index, position = 0, 0
+            else:
+                find = bisect.bisect_left if inclusive else bisect.bisect_right
+                index = find(self._maxes, key)
+                if index == len(self._maxes):
+                    return []
+                position = find(self._blocks[index], key)
+            keys: List[str] = []
+            while index < len(self._blocks) and len(keys) < count:
+                block = self._blocks[index]
+                keys.extend(block[position:position + count - len(keys)])
+                index += 1
+                position = 0
+            return keys
+
+    def irange(self, start: Optional[str] = None, end: Optional[str] = None,
+               inclusive_start: bool = True, batch: int = 256) -> Iterator[str]:
+        """Yield keys in order from ``start`` up to, but excluding, ``end``"""
+        key, inclusive = start, inclusive_start
+        while True:
+            keys = self._copy_from(key, inclusive, batch)
+            for item in keys:
+                if end is not None and item >= end:
+                    return
+                yield item
+            if len(keys) < batch:
+                return
+            key, inclusive = keys[-1], False
+
+    def clear(self):
+        with self._lock:
+            self._blocks = []
+            self._maxes = []
+            self._len = 0
+
+class MergedKeyIndex:
+    """Read-only ordered view over several disjoint SortedKeyIndexes.
+
+    The store keeps one index per shard, maintained under that shard's
+    lock, so writers to different shards never meet on an index lock.
+    Range iteration merges the per-shard ranges.
+    """
+
+    def __init__(self, indexes: Sequence[SortedKeyIndex]):
+        self._indexes = list(indexes)
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self._indexes)
+
+    def __contains__(self, key: str) -> bool:
+        return any(key in index for index in self._indexes)
+
+    def irange(self, start: Optional[str] = None, end: Optional[str] = None,
+               inclusive_start: bool = True, batch: int = 256) -> Iterator[str]:
+        """Yield keys in order from ``start`` up to, but excluding, ``end``"""
+        if len(self._indexes) == 1:
+            return self._indexes[0].irange(start, end, inclusive_start, batch)
+        # Each part copies a smaller batch, so a short scan stays cheap
+        batch = max(16, batch // len(self._indexes))
+        return heapq.merge(*(index.irange(start, end, inclusive_start, batch)
+                             for index in self._indexes))
@@ -0,0 +1,122 @@
+# src/store/merkle.py
+import zlib
+import hashlib
+from functools import reduce
+from operator import xor
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+DEFAULT_MERKLE_DEPTH = 10
+
+class MerkleTree:
+    """Hash tree over key-hash ranges, updated incrementally on every write.
+
+    Keys map to one of ``2 ** depth`` leaves by a stable hash. Each leaf hash
+    is the XOR of a digest of (key, version, timestamp) for the keys it holds,
+    and each inner node is the XOR of its children, so a write only changes
+    one leaf and its ancestors. Nodes are numbered heap-style: the root is 1
+    and the children of ``n`` are ``2n`` and ``2n + 1``.
+
+    A key's state is (version, timestamp), with a third ``True`` element
+    for a deletion tombstone, which hashes differently from a live entry.
+    The tree has no lock of its own: the store keeps one tree per shard
+    and updates it under that shard's lock.
+    """
+
+    def __init__(self, depth: int = DEFAULT_MERKLE_DEPTH):
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        self.depth = depth
+        self.leaf_count = 1 << depth
+        self._nodes = [0] * (2 * self.leaf_count)
+        # Only non-empty leaves have a key set
+        self._leaf_keys: Dict[int, Set[str]] = {}
+
+    def leaf_for(self, key: str) -> int:
+        return zlib.crc32(key.encode('utf-8')) & (self.leaf_count - 1)
+
+    @staticmethod
+    def digest(key: str, version: int, timestamp: float, deleted: bool = False) -> int:
+        data = f"{key}\0{version}\0{timestamp!r}{chr(0) + 'deleted' if deleted else ''}"\
+            .encode('utf-8')
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+    def update(self, key: str, old: Optional[Tuple], new: Optional[Tuple]):
+        """Replace the state recorded for ``key``; None means absent"""
+        delta = 0
+        if old is not None:
+            delta ^= self.digest(key, *old)
+        if new is not None:
+            delta ^= self.digest(key, *new)
+        leaf = self.leaf_for(key)
+        if new is None:
+            keys = self._leaf_keys.get(leaf)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._leaf_keys[leaf]
+        else:
+            self._leaf_keys.setdefault(leaf, set()).add(key)
+        node = self.leaf_count + leaf
+        while node:
+            self._nodes[node] ^= delta
+            node >>= 1
+
+    def root(self) -> int:
+        return self._nodes[1]
+
+    def node_hash(self, node: int) -> int:
+        return self._nodes[node]
+
+    def node_hashes(self, nodes: Iterable[int]) -> Dict[int, int]:
+        """Return the hash of each requested node, skipping invalid ids"""
+        return {node: self._nodes[node] for node in nodes
+                if 0 < node < len(self._nodes)}
+
+    def is_leaf(self, node: int) -> bool:
+        return node >= self.leaf_count
+
+    def leaf_index(self, node: int) -> int:
+        return node - self.leaf_count
+
+    @staticmethod
+    def children(node: int) -> List[int]:
+        return [2 * node, 2 * node + 1]
+
+    def leaf_keys(self, leaf: int) -> List[str]:
+        """Return the keys currently hashed into ``leaf``"""
+        return list(self._leaf_keys.get(leaf, ()))
+
+class MergedMerkleTree:
+    """Read-only view of several trees over disjoint keys as one tree.
+
+    Node hashes are XORs of key digests, so the hash of a node over all
+    keys is the XOR of that node in every tree. The result does not depend
+    on how keys are split, so it matches a peer with other shard counts.
+    """
+
+    def __init__(self, trees: Sequence[MerkleTree]):
+        self._trees = list(trees)
+        self.depth = self._trees[0].depth
+        self.leaf_count = self._trees[0].leaf_count
+        self._size = 2 * self.leaf_count
+
+    def leaf_for(self, key: str) -> int:
+        return self._trees[0].leaf_for(key)
+
+    def root(self) -> int:
+        return self.node_hash(1)
+
+    def node_hash(self, node: int) -> int:
+        return reduce(xor, (tree._nodes[node] for tree in self._trees), 0)
+
+    def node_hashes(self, nodes: Iterable[int]) -> Dict[int, int]:
+        """Return the hash of each requested node, skipping invalid ids"""
+        return {node: self.node_hash(node) for node in nodes if 0 < node < self._size}
+
+    def is_leaf(self, node: int) -> bool:
+        return node >= self.leaf_count
+
+    def leaf_index(self, node: int) -> int:
+        return node - self.leaf_count
+
+    children = staticmethod(MerkleTree.children)
@@ -0,0 +1,630 @@
+# src/store/shared.py
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import logging
+import multiprocessing
+from typing import Any, Dict, List, Optional, Tuple
+from .store import StorageEntry, make_etag, _expires_at
+from .codec import ValueCodec, decode_value, create_value_codec, to_wire, from_wire, \
+    DEFAULT_THRESHOLD
+
+DEFAULT_CAPACITY = 100000
+DEFAULT_SEGMENTS = 64
+DEFAULT_KEY_SIZE = 256
+DEFAULT_VALUE_SIZE = 2048
+# Probe sequences grow long as a segment fills, so part of it stays empty
+MAX_LOAD = 0.8
+
+# How long a waiter blocks before checking whether the lock holder died
+LOCK_TIMEOUT = 1.0
+
+EMPTY, USED, DELETED = 0, 1, 2
+
+logger = logging.getLogger(__name__)
+
+# Slot header: state, key length, value length, version, timestamp, expiry
+# time (0 for none) and a CRC of key and value, followed by their bytes
+_SLOT = struct.Struct('<BxHIQddI')
+# Segment header: used slots, deleted slots, key and value bytes, expired
+_SEGMENT = struct.Struct('<QQQQ')
+_COUNTER = struct.Struct('<Q')
+_OWNER = struct.Struct('<Q')
+_REGION = struct.Struct('<Q')
+_KEY_LENGTH = struct.Struct('<H')
+
+class CapacityError(MemoryError):
+    """The shared table has no room for a key or value"""
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class _OwnedLock:
+    """Process-shared lock that records its holder's PID in shared memory.
+
+    A worker killed while holding a plain lock would block every other
+    worker for good. Here a waiter that times out looks up the holder and,
+    if that process is gone, takes the lock over in its place. Takeovers
+    are serialized by ``recovery``, itself held only for a lookup.
+    """
+
+    def __init__(self, memory: mmap.mmap, offset: int, recovery, timeout: float):
+        self._lock = multiprocessing.Lock()
+        self._memory = memory
+        self._offset = offset
+        self._recovery = recovery
+        self.timeout = timeout
+
+    def _own(self):
+        _OWNER.pack_into(self._memory, self._offset, os.getpid())
+
+    def try_acquire(self) -> bool:
+        if not self._lock.acquire(False):
+            return False
+        self._own()
+        return True
+
+    def acquire(self) -> bool:
+        """Block until the lock is held; True if it was taken from a dead holder"""
+        while True:
+            if self._lock.acquire(timeout=self.timeout):
+                self._own()
+                return False
+            if self._take_over():
+                return True
+
+    def _take_over(self) -> bool:
+        if not self._recovery.acquire(timeout=self.timeout):
+            return False
+        try:
+            owner = _OWNER.unpack_from(self._memory, self._offset)[0]
+            # 0 means the lock is between holders; the next round retries
+            if not owner or _alive(owner):
+                return False
+            logger.warning(f"Process {owner} died holding a shared table lock; taking it over")
+            self._own()
+            return True
+        finally:
+            self._recovery.release()
+
+    def release(self):
+        _OWNER.pack_into(self._memory, self._offset, 0)
+        self._lock.release()
+
+class SharedHashTable:
+    """Fixed-size open-addressing hash table in shared memory.
+
+    The table lives in an anonymous shared mapping, so every process forked
+    after it is built reads and writes the same slots with no IPC hop. Keys
+    hash to one of ``segments`` independent tables, each probed linearly and
+    guarded by its own process-shared lock, so writers only contend when
+    they land in the same segment. Slots have a fixed size: keys and values
+    longer than ``key_size`` and ``value_size`` bytes are refused.
+
+    Callers hold a segment's lock around ``get``, ``put`` and ``remove``.
+    The locks record their holder, so a worker that dies holding one does
+    not deadlock the others: the next waiter takes the lock over and
+    repairs the segment, dropping any slot the dead worker left half
+    written (each slot carries a CRC of its key and value). Compaction
+    rebuilds a segment in a spare region and switches the segment to it
+    with one write to a region map, so it never leaves a segment partly
+    rewritten.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, key_size: int = DEFAULT_KEY_SIZE,
+                 value_size: int = DEFAULT_VALUE_SIZE, segments: int = DEFAULT_SEGMENTS,
+                 lock_timeout: float = LOCK_TIMEOUT):
+        if segments < 1 or capacity < segments:
+            raise ValueError("capacity must be at least the number of segments")
+        if not 0 < key_size <= 0xffff or value_size < 1:
+            raise ValueError("key_size and value_size must be positive")
+        self.key_size = key_size
+        self.value_size = value_size
+        self.segments = segments
+        self.slots_per_segment = -(-capacity // segments)
+        self.capacity = self.slots_per_segment * segments
+        self.slot_size = _SLOT.size + key_size + value_size
+        self._segment_size = _SEGMENT.size + self.slots_per_segment * self.slot_size
+        self._max_used = max(1, int(self.slots_per_segment * MAX_LOAD))
+        # The version counter and lock holders come first: one PID per
+        # segment lock, then the version and compaction locks'. Then the
+        # region each segment lives in; one region more than segments is
+        # kept spare for compaction.
+        self._regions = _COUNTER.size + (segments + 2) * _OWNER.size
+        self._header_size = self._regions + segments * _REGION.size
+        # Pages are only backed by memory once written to
+        self._memory = mmap.mmap(-1, self._header_size + (segments + 1) * self._segment_size)
+        for segment in range(segments):
+            _REGION.pack_into(self._memory, self._regions + segment * _REGION.size, segment)
+        owners = _COUNTER.size
+        recovery = multiprocessing.Lock()
+        self._locks = [_OwnedLock(self._memory, owners + segment * _OWNER.size,
+                                  recovery, lock_timeout)
+                       for segment in range(segments)]
+        self._version_lock = _OwnedLock(self._memory, owners + segments * _OWNER.size,
+                                        recovery, lock_timeout)
+        self._compact_lock = _OwnedLock(self._memory, owners + (segments + 1) * _OWNER.size,
+                                        recovery, lock_timeout)
+        # Per-process lock counters, reported by lock_stats
+        self.acquisitions = 0
+        self.contended = 0
+
+    @property
+    def size(self) -> int:
+        """Bytes of shared memory reserved for the table"""
+        return len(self._memory)
+
+    def segment_of(self, key: bytes) -> int:
+        return zlib.crc32(key) % self.segments
+
+    def acquire(self, segment: int):
+        lock = self._locks[segment]
+        if not lock.try_acquire():
+            self.contended += 1
+            if lock.acquire():
+                self._repair(segment)
+        self.acquisitions += 1
+
+    def release(self, segment: int):
+        self._locks[segment].release()
+
+    def next_version(self) -> int:
+        """Take the next table-wide version"""
+        # The counter is written in one store, so a takeover needs no repair
+        if not self._version_lock.try_acquire():
+            self._version_lock.acquire()
+        try:
+            version = _COUNTER.unpack_from(self._memory, 0)[0] + 1
+            _COUNTER.pack_into(self._memory, 0, version)
+            return version
+        finally:
+            self._version_lock.release()
+
+    @property
+    def version(self) -> int:
+        return _COUNTER.unpack_from(self._memory, 0)[0]
+
+    def _region(self, segment: int) -> int:
+        return _REGION.unpack_from(self._memory, self._regions + segment * _REGION.size)[0]
+
+    def _base(self, segment: int) -> int:
+        return self._header_size + self._region(segment) * self._segment_size
+
+    def _meta(self, segment: int) -> List[int]:
+        return list(_SEGMENT.unpack_from(self._memory, self._base(segment)))
+
+    def _set_meta(self, segment: int, meta: List[int]):
+        _SEGMENT.pack_into(self._memory, self._base(segment), *meta)
+
+    def _probe(self, segment: int, key: bytes) -> Tuple[int, int]:
+        """Return the offset of ``key``'s slot (or -1) and of a free slot to use"""
+        memory = self._memory
+        slots = self.slots_per_segment
+        first = self._base(segment) + _SEGMENT.size
+        home = (zlib.crc32(key) // self.segments) % slots
+        length = _KEY_LENGTH.pack(len(key))
+        free = -1
+        for step in range(slots):
+            offset = first + ((home + step) % slots) * self.slot_size
+            state = memory[offset]
+            if state == EMPTY:
+                return -1, free if free >= 0 else offset
+            if state == DELETED:
+                if free < 0:
+                    free = offset
+                continue
+            start = offset + _SLOT.size
+            if memory[offset + 2:offset + 4] == length and \
+                    memory[start:start + len(key)] == key:
+                return offset, free
+        return -1, free
+
+    def _read(self, offset: int) -> Tuple[bytes, bytes, int, float, Optional[float]]:
+        _, key_len, value_len, version, timestamp, expires_at, _ = \
+            _SLOT.unpack_from(self._memory, offset)
+        start = offset + _SLOT.size + self.key_size
+        key = self._memory[offset + _SLOT.size:offset + _SLOT.size + key_len]
+        return key, self._memory[start:start + value_len], version, timestamp, expires_at or None
+
+    def get(self, key: bytes, now: Optional[float] = None
+            ) -> Optional[Tuple[bytes, int, float, Optional[float]]]:
+        """Return (value, version, timestamp, expires_at), dropping it if expired"""
+        segment = self.segment_of(key)
+        offset, _ = self._probe(segment, key)
+        if offset < 0:
+            return None
+        _, value, version, timestamp, expires_at = self._read(offset)
+        if expires_at is not None and expires_at <= (now or time.time()):
+            self._drop(segment, offset, expired=True)
+            return None
+        return value, version, timestamp, expires_at
+
+    def put(self, key: bytes, value: bytes, version: int, timestamp: float,
+            expires_at: Optional[float] = None):
+        """Insert or replace ``key``; raises CapacityError if it cannot fit"""
+        if len(key) > self.key_size:
+            raise CapacityError(f"Key exceeds {self.key_size} bytes")
+        if len(value) > self.value_size:
+            raise CapacityError(f"Value exceeds {self.value_size} bytes")
+        segment = self.segment_of(key)
+        offset, free = self._probe(segment, key)
+        meta = self._meta(segment)
+        if offset >= 0:
+            old_len = _SLOT.unpack_from(self._memory, offset)[2]
+            meta[2] += len(value) - old_len
+        else:
+            if meta[0] + 1 > self._max_used:
+                raise CapacityError("Shared table is full")
+            if self._memory[free] == EMPTY and meta[0] + meta[1] + 1 > self._max_used:
+                # Too few empty slots left to end probes quickly: rebuild
+                meta = self._compact(segment)
+                offset, free = self._probe(segment, key)
+            if self._memory[free] == DELETED:
+                meta[1] -= 1
+            offset = free
+            meta[0] += 1
+            meta[2] += len(key) + len(value)
+        # Data before header, so a slot is only marked used once filled
+        start = offset + _SLOT.size
+        self._memory[start:start + len(key)] = key
+        self._memory[start + self.key_size:start + self.key_size + len(value)] = value
+        _SLOT.pack_into(self._memory, offset, USED, len(key), len(value), version,
+                        timestamp, expires_at or 0.0, zlib.crc32(value, zlib.crc32(key)))
+        self._set_meta(segment, meta)
+
+    def remove(self, key: bytes) -> bool:
+        segment = self.segment_of(key)
+        offset, _ = self._probe(segment, key)
+        if offset < 0:
+            return False
+        self._drop(segment, offset)
+        return True
+
+    def _drop(self, segment: int, offset: int, expired: bool = False):
+        _, key_len, value_len = _SLOT.unpack_from(self._memory, offset)[:3]
+        self._memory[offset] = DELETED
+        meta = self._meta(segment)
+        meta[0] -= 1
+        meta[1] += 1
+        meta[2] -= key_len + value_len
+        if expired:
+            meta[3] += 1
+        self._set_meta(segment, meta)
+
+    def _repair(self, segment: int):
+        """Drop torn slots and recount a segment taken over from a dead worker"""
+        first = self._base(segment) + _SEGMENT.size
+        end = first + self.slots_per_segment * self.slot_size
+        used = deleted = data_bytes = torn = 0
+        for offset in range(first, end, self.slot_size):
+            state, key_len, value_len, *_, crc = _SLOT.unpack_from(self._memory, offset)
+            if state == USED:
+                start = offset + _SLOT.size
+                if key_len <= self.key_size and value_len <= self.value_size and \
+                        zlib.crc32(self._memory[start + self.key_size:
+                                                start + self.key_size + value_len],
+                                   zlib.crc32(self._memory[start:start + key_len])) == crc:
+                    used += 1
+                    data_bytes += key_len + value_len
+                    continue
+                self._memory[offset] = state = DELETED
+                torn += 1
+            if state == DELETED:
+                deleted += 1
+        self._set_meta(segment, [used, deleted, data_bytes, self._meta(segment)[3]])
+        if torn:
+            logger.warning(f"Dropped {torn} half-written slots from segment {segment}")
+
+    def _compact(self, segment: int) -> List[int]:
+        """Rebuild a segment without deleted or expired slots in the spare region"""
+        memory = self._memory
+        slots = self.slots_per_segment
+        # The spare is rebuilt from scratch, so a takeover needs no repair
+        if not self._compact_lock.try_acquire():
+            self._compact_lock.acquire()
+        try:
+            in_use = {self._region(other) for other in range(self.segments)}
+            spare = next(region for region in range(self.segments + 1) if region not in in_use)
+            base = self._header_size + spare * self._segment_size
+            first = base + _SEGMENT.size
+            memory[first:first + slots * self.slot_size] = bytes(slots * self.slot_size)
+            source = self._base(segment) + _SEGMENT.size
+            now = time.time()
+            used = data_bytes = expired = 0
+            for offset in range(source, source + slots * self.slot_size, self.slot_size):
+                if memory[offset] != USED:
+                    continue
+                _, key_len, value_len, _, _, expires_at, _ = _SLOT.unpack_from(memory, offset)
+                if expires_at and expires_at <= now:
+                    expired += 1
+                    continue
+                key = memory[offset + _SLOT.size:offset + _SLOT.size + key_len]
+                home = (zlib.crc32(key) // self.segments) % slots
+                for step in range(slots):
+                    target = first + ((home + step) % slots) * self.slot_size
+                    if memory[target] == EMPTY:
+                        break
+                memory[target:target + self.slot_size] = memory[offset:offset + self.slot_size]
+                used += 1
+                data_bytes += key_len + value_len
+            meta = [used, 0, data_bytes, self._meta(segment)[3] + expired]
+            _SEGMENT.pack_into(memory, base, *meta)
+            # Readers hold the segment lock, so they see the old region or
+            # the new one; the old region becomes the spare
+            _REGION.pack_into(memory, self._regions + segment * _REGION.size, spare)
+        finally:
+            self._compact_lock.release()
+        return meta
+
+    def items(self, segment: int) -> List[Tuple[bytes, bytes, int, float, Optional[float]]]:
+        """Return the live slots of one segment; the caller holds its lock"""
+        first = self._base(segment) + _SEGMENT.size
+        end = first + self.slots_per_segment * self.slot_size
+        now = time.time()
+        return [record for record in (self._read(offset)
+                                      for offset in range(first, end, self.slot_size)
+                                      if self._memory[offset] == USED)
+                if record[4] is None or record[4] > now]
+
+    def stats(self) -> Dict[str, int]:
+        totals = [0, 0, 0, 0]
+        for segment in range(self.segments):
+            totals = [total + value for total, value in zip(totals, self._meta(segment))]
+        used, deleted, data_bytes, expired = totals
+        return {'used': used, 'deleted': deleted, 'bytes': data_bytes, 'expired': expired,
+                'capacity': self.capacity, 'segments': self.segments,
+                'table_bytes': self.size}
+
+    def __len__(self) -> int:
+        return sum(self._meta(segment)[0] for segment in range(self.segments))
+
+def _key_bytes(key: str) -> bytes:
+    return key.encode('utf-8', 'surrogatepass')
+
+class SharedStore:
+    """The store's point operations over a SharedHashTable.
+
+    Build it before forking worker processes and every worker serves the
+    same data. Values are kept in their wire form, compressed first when a
+    codec is configured, so large documents still fit in a slot. It only
+    serves a standalone node: ordered scans, snapshots, the change feed,
+    Merkle trees and replication rely on in-process structures, and the
+    app built over it leaves out their routes.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, key_size: int = DEFAULT_KEY_SIZE,
+                 value_size: int = DEFAULT_VALUE_SIZE, segments: int = DEFAULT_SEGMENTS):
+        self.table = SharedHashTable(capacity, key_size, value_size, segments)
+        self.codec: Optional[ValueCodec] = None
+        self.is_persistent = False
+
+    def configure_codec(self, codec: Optional[str] = 'zlib',
+                        threshold: int = DEFAULT_THRESHOLD):
+        self.codec = create_value_codec(codec, threshold)
+
+    def _pack(self, value: Any) -> bytes:
+        if self.codec is not None:
+            value = self.codec.encode(value)
+        return json.dumps(to_wire(value), separators=(',', ':')).encode('utf-8')
+
+    def _entry(self, record) -> StorageEntry:
+        value, version, timestamp, expires_at = record
+        entry = StorageEntry(from_wire(json.loads(value)), version, timestamp, expires_at)
+        entry.size = _SLOT.size + len(value)
+        return entry
+
+    def create(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        expires_at = _expires_at(ttl)
+        data, name = self._pack(value), _key_bytes(key)
+        segment = self.table.segment_of(name)
+        self.table.acquire(segment)
+        try:
+            if self.table.get(name) is not None:
+                return False
+            self.table.put(name, data, self.table.next_version(), time.time(), expires_at)
+        finally:
+            self.table.release(segment)
+        return True
+
+    def read(self, key: str) -> Optional[Any]:
+        entry = self.read_entry(key)
+        return decode_value(entry.value) if entry is not None else None
+
+    def read_entry(self, key: str) -> Optional[StorageEntry]:
+        name = _key_bytes(key)
+        segment = self.table.segment_of(name)
+        self.table.acquire(segment)
+        try:
+            record = self.table.get(name)
+        finally:
+            self.table.release(segment)
+        return self._entry(record) if record is not None else None
+
+    get_entry = read_entry
+
+    def get_version(self, key: str) -> Optional[int]:
+        entry = self.get_entry(key)
+        return entry.version if entry is not None else None
+
+    def update(self, key: str, value: Any, ttl: Optional[float] = None,
+               if_match: Optional[str] = None) -> bool:
+        expires_at = _expires_at(ttl)
+        data, name = self._pack(value), _key_bytes(key)
+        segment = self.table.segment_of(name)
+        self.table.acquire(segment)
+        try:
+            current = self.table.get(name)
+            if current is None or (if_match is not None and
+                                   make_etag(current[1], current[2]) != if_match):
+                return False
+            self.table.next_version()
+            self.table.put(name, data, current[1] + 1, time.time(), expires_at)
+        finally:
+            self.table.release(segment)
+        return True
+
+    def compare_and_swap(self, key: str, expected_version: int, value: Any,
+                         ttl: Optional[float] = None) -> Tuple[bool, Optional[StorageEntry]]:
+        expires_at = _expires_at(ttl)
+        data, name = self._pack(value), _key_bytes(key)
+        segment = self.table.segment_of(name)
+        self.table.acquire(segment)
+        try:
+            current = self.table.get(name)
+            version = current[1] if current is not None else 0
+            if version != expected_version:
+                return False, self._entry(current) if current is not None else None
+            if current is None:
+                version = self.table.next_version()
+            else:
+                self.table.next_version()
+                version += 1
+            record = (data, version, time.time(), expires_at)
+            self.table.put(name, *record)
+        finally:
+            self.table.release(segment)
+        return True, self._entry(record)
+
+    def modify(self, key: str, transform, create: bool = False,
+               ttl: Optional[float] = None) -> Optional[StorageEntry]:
+        """Replace a value with ``transform(value)`` under the segment lock"""
+        expires_at = _expires_at(ttl)
+        name = _key_bytes(key)
+        segment = self.table.segment_of(name)
+        self.table.acquire(segment)
+        try:
+            current = self.table.get(name)
+            if current is None and not create:
+                return None
+            value = transform(decode_value(self._entry(current).value)
+                              if current is not None else None)
+            data = self._pack(value)
+            if current is None:
+                record = (data, self.table.next_version(), time.time(), expires_at)
+            else:
+                self.table.next_version()
+                record = (data, current[1] + 1, time.time(), current[3])
+            self.table.put(name, *record)
+        finally:
+            self.table.release(segment)
+        return self._entry(record)
+
+    def delete(self, key: str, if_match: Optional[str] = None) -> bool:
+        name = _key_bytes(key)
+        segment = self.table.segment_of(name)
+        self.table.acquire(segment)
+        try:
+            current = self.table.get(name)
+            if current is None or (if_match is not None and
+                                   make_etag(current[1], current[2]) != if_match):
+                return False
+            self.table.next_version()
+            return self.table.remove(name)
+        finally:
+            self.table.release(segment)
+
+    def _group_by_segment(self, keys) -> Dict[int, List[Tuple[str, bytes]]]:
+        groups: Dict[int, List[Tuple[str, bytes]]] = {}
+        for key in keys:
+            name = _key_bytes(key)
+            groups.setdefault(self.table.segment_of(name), []).append((key, name))
+        return groups
+
+    def read_many(self, keys: List[str]) -> Dict[str, Optional[Any]]:
+        return {key: self.read(key) for key in keys}
+
+    def put_many(self, items: Dict[str, Any], overwrite: bool = False,
+                 ttl: Optional[float] = None) -> Dict[str, str]:
+        """Create (or with overwrite, update) several keys taking each segment lock once"""
+        expires_at = _expires_at(ttl)
+        packed = {key: self._pack(value) for key, value in items.items()}
+        results: Dict[str, str] = {}
+        for segment, names in self._group_by_segment(items).items():
+            self.table.acquire(segment)
+            try:
+                for key, name in names:
+                    current = self.table.get(name)
+                    if current is None:
+                        version = self.table.next_version()
+                        results[key] = 'created'
+                    elif overwrite:
+                        self.table.next_version()
+                        version = current[1] + 1
+                        results[key] = 'updated'
+                    else:
+                        results[key] = 'exists'
+                        continue
+                    self.table.put(name, packed[key], version, time.time(), expires_at)
+            finally:
+                self.table.release(segment)
+        return results
+
+    def delete_many(self, keys: List[str]) -> Dict[str, bool]:
+        results: Dict[str, bool] = {}
+        for segment, names in self._group_by_segment(keys).items():
+            self.table.acquire(segment)
+            try:
+                for key, name in names:
+                    results[key] = self.table.get(name) is not None and self.table.remove(name)
+                    if results[key]:
+                        self.table.next_version()
+            finally:
+                self.table.release(segment)
+        return results
+
+    def entry_size(self, key: str) -> Optional[int]:
+        entry = self.get_entry(key)
+        return len(_key_bytes(key)) + entry.size if entry is not None else None
+
+    def get_global_version(self) -> int:
+        return self.table.version
+
+    def memory_usage(self) -> Dict[str, Any]:
+        stats = self.table.stats()
+        total = stats['bytes'] + stats['used'] * _SLOT.size
+        return {
+            'entries': stats['used'],
+            'total_bytes': total,
+            'bytes_per_entry': total / stats['used'] if stats['used'] else 0.0,
+            'entry_overhead': _SLOT.size,
+            'table_bytes': stats['table_bytes']
+        }
+
+    def lock_stats(self) -> Dict[str, Dict[str, int]]:
+        """Segment lock acquisitions and contention seen by this process"""
+        return {'segment': {'acquisitions': self.table.acquisitions,
+                            'contended': self.table.contended}}
+
+    def stats(self) -> Dict[str, Any]:
+        table = self.table.stats()
+        memory = self.memory_usage()
+        return {
+            'keys': table['used'],
+            'bytes': memory['total_bytes'],
+            'bytes_per_entry': memory['bytes_per_entry'],
+            'evictions': 0,
+            'eviction_policy': None,
+            'max_entries': table['capacity'],
+            'max_bytes': None,
+            'expired': table['expired'],
+            'version': self.table.version,
+            'segments': table['segments'],
+            'table_bytes': table['table_bytes'],
+            'worker_pid': os.getpid()
+        }
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def get_tombstone(self, key: str) -> None:
+        # Deletes here are never replicated, so no tombstones are kept
+        return None
@@ -0,0 +1,86 @@
+# src/store/snapshot.py
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+from .codec import decode_value
+
+class SnapshotRegistry:
+    """Global versions of the open snapshots.
+
+    Writers read ``versions`` and ``oldest`` without the lock; both are
+    replaced, never mutated, and ``oldest`` is None while no snapshot is
+    open and no old versions need to be kept.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open: Dict[int, int] = {}
+        self.versions: Tuple[int, ...] = ()
+        self.oldest: Optional[int] = None
+
+    def register(self, version: int):
+        with self._lock:
+            self._open[version] = self._open.get(version, 0) + 1
+            self._publish()
+
+    def release(self, version: int):
+        with self._lock:
+            remaining = self._open.get(version, 0) - 1
+            if remaining > 0:
+                self._open[version] = remaining
+                return
+            self._open.pop(version, None)
+            self._publish()
+
+    def _publish(self):
+        self.versions = tuple(sorted(self._open))
+        self.oldest = self.versions[0] if self.versions else None
+
+    def __len__(self) -> int:
+        return sum(self._open.values())
+
+class Snapshot:
+    """A read-only view of the store as of one global version.
+
+    Reads walk a key's version chain back to the newest version written at
+    or before ``version`` and take no lock. The store keeps every version a
+    snapshot can see until it is closed, so close it, or use it as a
+    context manager, once the read is done.
+    """
+
+    def __init__(self, store, version: int, timestamp: float):
+        self.store = store
+        self.version = version
+        # TTLs are judged at the time the snapshot was taken
+        self.timestamp = timestamp
+        self.closed = False
+
+    def get_entry(self, key: str):
+        """Return the entry ``key`` had at this snapshot's version"""
+        if self.closed:
+            raise ValueError("snapshot is closed")
+        return self.store._entry_at(key, self.version, self.timestamp)
+
+    def read(self, key: str) -> Optional[Any]:
+        entry = self.get_entry(key)
+        return decode_value(entry.value) if entry is not None else None
+
+    def scan(self, prefix: Optional[str] = None, start: Optional[str] = None,
+             end: Optional[str] = None, after: Optional[str] = None,
+             limit: Optional[int] = None) -> Iterator[Tuple[str, Any]]:
+        """Like ``DistributedStore.scan``, as of this snapshot"""
+        return self.store.scan(prefix, start, end, after, limit, snapshot=self)
+
+    def iter_entries(self) -> Iterator[Tuple[str, Any]]:
+        """Yield every (key, entry) pair in this snapshot, in no order"""
+        return self.store.iter_entries(snapshot=self)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.store._release_snapshot(self)
+
+    def __enter__(self) -> 'Snapshot':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
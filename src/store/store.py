@@ -1,84 +1,991 @@
-from threading import Lock
-from typing import Dict, Optional, Any, List, Tuple
+import bisect
+from typing import Callable, Dict, Optional, Any, List, Tuple, Iterator
+import sys
 import time
 import uuid
+from .merkle import MerkleTree, MergedMerkleTree, DEFAULT_MERKLE_DEPTH
+from .eviction import EvictionPolicy, create_policy, estimate_size
+from .expiry import ExpiryScheduler
+from .index import SortedKeyIndex, MergedKeyIndex
+from .changes import ChangeFeed, DEFAULT_CAPACITY as DEFAULT_FEED_CAPACITY
+from .codec import ValueCodec, decode_value, create_value_codec, DEFAULT_THRESHOLD
+from .snapshot import Snapshot, SnapshotRegistry
+from src.metrics import REGISTRY, LOCK_BUCKETS, InstrumentedLock
+from src.profiling import record_lock_wait
+
+DEFAULT_SHARD_COUNT = 16
+
+LOCK_WAIT = REGISTRY.histogram('kv_store_lock_wait_seconds',
+                               'Time spent waiting for a store lock', ['lock'], LOCK_BUCKETS)
+LOCK_HOLD = REGISTRY.histogram('kv_store_lock_hold_seconds',
+                               'Time a store lock was held', ['lock'], LOCK_BUCKETS)
+
+# Identifies entries written by this process; shared by every entry
+LOCAL_NODE_ID = sys.intern(str(uuid.uuid4()))
 
 class StorageEntry:
-    def __init__(self, value: Any, version: int, timestamp: float):
+    # Slots keep each entry to a fixed-size object instead of one with a __dict__
+    __slots__ = ('value', 'version', 'timestamp', 'node_id', 'size', 'expires_at',
+                 'seq', 'prev')
+
+    def __init__(self, value: Any, version: int, timestamp: float,
+                 expires_at: Optional[float] = None, node_id: str = LOCAL_NODE_ID):
         self.value = value
         self.version = version
         self.timestamp = timestamp
-        self.node_id = str(uuid.uuid4())
+        self.node_id = node_id
+        self.size = 0
+        self.expires_at = expires_at
+        # Global version the entry was installed at, and the entry it
+        # replaced while a snapshot might still read it
+        self.seq = 0
+        self.prev: Optional['StorageEntry'] = None
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        return self.expires_at is not None and self.expires_at <= (now or time.time())
+
+    def etag(self) -> str:
+        return make_etag(self.version, self.timestamp)
+
+def make_etag(version: int, timestamp: float) -> str:
+    """Entity tag for one version of a value.
+
+    Two nodes can assign the same version to different writes, which merge
+    tells apart by timestamp, so the tag carries both.
+    """
+    return f"{version}-{int(timestamp * 1000000):x}"
+
+# Entry object, its timestamp float, and the shard dict, Merkle leaf and
+# ordered index slots
+ENTRY_OVERHEAD = sys.getsizeof(StorageEntry(None, 0, 0.0)) + sys.getsizeof(0.0) + 72
+
+def _prefix_end(prefix: str) -> Optional[str]:
+    """Smallest string greater than every string starting with ``prefix``"""
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def _live(entry: Optional[StorageEntry]) -> Optional[StorageEntry]:
+    """Return ``entry`` unless it is missing or past its TTL"""
+    if entry is None or (entry.expires_at is not None and entry.expires_at <= time.time()):
+        return None
+    return entry
+
+# Value of the placeholder left for a deleted key while snapshots are open
+_DELETED = object()
+
+def _visible(entry: Optional[StorageEntry], version: int,
+             now: float) -> Optional[StorageEntry]:
+    """Walk a version chain back to the live entry a snapshot at ``version`` reads"""
+    while entry is not None and entry.seq > version:
+        entry = entry.prev
+    if entry is None or entry.value is _DELETED or entry.is_expired(now):
+        return None
+    return entry
+
+def _prune(entry: StorageEntry, versions: Tuple[int, ...]) -> bool:
+    """Unlink the versions below ``entry`` that no open snapshot reads.
+
+    ``versions`` are the open snapshots' versions in ascending order. A
+    version is read by the snapshots between its own tag and the tag of the
+    version that replaced it. Returns whether older versions are still linked.
+    """
+    keep = entry
+    newer = entry.seq
+    node = entry.prev if versions else None
+    while node is not None:
+        position = bisect.bisect_left(versions, node.seq)
+        if position < len(versions) and versions[position] < newer:
+            keep.prev = node
+            keep = node
+        if node.seq <= versions[0]:
+            break
+        newer = node.seq
+        node = node.prev
+    keep.prev = None
+    return entry.prev is not None
+
+def _expires_at(ttl: Optional[float]) -> Optional[float]:
+    if ttl is None:
+        return None
+    if ttl <= 0:
+        raise ValueError("ttl must be positive")
+    return time.time() + ttl
+
+class _Shard:
+    """A hash partition of the store with its own lock and version counter"""
+    __slots__ = ('lock', 'entries', 'version', 'bytes', 'policy', 'evictions',
+                 'retired', 'versioned', 'index', 'merkle', 'tombstones', 'evicted')
+
+    def __init__(self, merkle_depth: int = DEFAULT_MERKLE_DEPTH):
+        # Where writers contend; wait and hold times are recorded under
+        # the 'shard' label, summed over all shards
+        self.lock = InstrumentedLock(LOCK_WAIT.labels('shard'), LOCK_HOLD.labels('shard'),
+                                     on_wait=record_lock_wait)
+        self.entries: Dict[str, StorageEntry] = {}
+        # Deleted keys whose old versions open snapshots may still read,
+        # and live keys that have older versions linked
+        self.retired: Dict[str, StorageEntry] = {}
+        self.versioned: set = set()
+        # The shard's keys in order, updated under the shard lock
+        self.index = SortedKeyIndex()
+        # The shard's part of the Merkle tree, also updated under its lock
+        self.merkle = MerkleTree(merkle_depth)
+        # Deleted keys as (version, timestamp), kept for the grace period
+        self.tombstones: Dict[str, Tuple[int, float]] = {}
+        # Evicted keys as (version, timestamp, expires_at). Their digest
+        # stays in the Merkle tree so anti-entropy does not pull them back
+        self.evicted: Dict[str, Tuple[int, float, Optional[float]]] = {}
+        self.version = 0
+        self.bytes = 0
+        self.policy: Optional[EvictionPolicy] = None
+        self.evictions = 0
 
 class DistributedStore:
-    def __init__(self):
-        self._store: Dict[str, StorageEntry] = {}
-        self._lock = Lock()
+    def __init__(self, num_shards: int = DEFAULT_SHARD_COUNT,
+                 merkle_depth: int = DEFAULT_MERKLE_DEPTH,
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 eviction_policy: str = 'lru',
+                 feed_capacity: int = DEFAULT_FEED_CAPACITY):
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        self._shards: List[_Shard] = [_Shard(merkle_depth) for _ in range(num_shards)]
+        self._num_shards = num_shards
+        # Only guards the global version counter; entries are guarded per shard
+        self._lock = InstrumentedLock(LOCK_WAIT.labels('version'), LOCK_HOLD.labels('version'),
+                                      on_wait=record_lock_wait)
         self._version = 0
-        self._node_id = str(uuid.uuid4())
+        self._node_id = LOCAL_NODE_ID
+        self._persistence = None
+        self.merkle = MergedMerkleTree([shard.merkle for shard in self._shards])
+        self.tombstone_grace: Optional[float] = None
+        self.expiry = ExpiryScheduler(self)
+        self.index = MergedKeyIndex([shard.index for shard in self._shards])
+        self.codec: Optional[ValueCodec] = None
+        self.changes = ChangeFeed(feed_capacity)
+        self.snapshots = SnapshotRegistry()
+        self.max_entries: Optional[int] = None
+        self.max_bytes: Optional[int] = None
+        self.eviction_policy: Optional[str] = None
+        if max_entries is not None or max_bytes is not None:
+            self.configure_eviction(eviction_policy, max_entries, max_bytes)
+
+    def configure_eviction(self, policy: str, max_entries: Optional[int] = None,
+                           max_bytes: Optional[int] = None):
+        """Bound the store by entry count and/or approximate bytes.
+
+        The budget covers the whole store. A write that takes it over the
+        budget evicts from its own shard, chosen by that shard's policy
+        instance, and only falls back to other shards when its own has
+        nothing left to give, so writers never wait on each other's locks.
+
+        An evicted key keeps its digest in the Merkle tree until it is
+        written again, deleted or past its expiry, so replicas still agree
+        with this node and anti-entropy does not bring it back.
+        """
+        if (max_entries is not None and max_entries < 1) or \
+                (max_bytes is not None and max_bytes < 1):
+            raise ValueError("max_entries and max_bytes must be positive")
+        create_policy(policy)  # validate the name before touching any shard
+        self.eviction_policy = policy
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        for shard in self._shards:
+            with shard.lock:
+                shard.policy = create_policy(policy)
+                for key in shard.entries:
+                    shard.policy.record_insert(key)
+                self._evict_locked(shard)
+
+    def configure_tombstones(self, grace: Optional[float]):
+        """Keep a versioned tombstone for each deleted key for ``grace`` seconds.
+
+        Tombstones are merged and compared by anti-entropy like entries, so
+        a replica still holding a deleted key cannot bring it back. They are
+        kept in memory only; ``None`` turns them off.
+        """
+        if grace is not None and grace <= 0:
+            raise ValueError("grace must be positive")
+        self.tombstone_grace = grace
+
+    def configure_codec(self, codec: Optional[str] = 'zlib',
+                        threshold: int = DEFAULT_THRESHOLD):
+        """Store values of at least ``threshold`` bytes compressed with ``codec``.
+
+        Only new writes are affected; ``None`` or 'none' turns compression off.
+        Encoded values are decoded on read, so callers never see the change.
+        """
+        self.codec = create_value_codec(codec, threshold)
+
+    def _encode(self, value: Any) -> Any:
+        return self.codec.encode(value) if self.codec is not None else value
+
+    def enable_persistence(self, persistence):
+        """Recover state from disk and log every later mutation"""
+        persistence.recover(self)
+        # Recovery does not rebuild the change feed, so start it from here
+        self.changes.reset(self._version)
+        self._persistence = persistence
+        persistence.start(self)
+
+    @property
+    def is_persistent(self) -> bool:
+        return self._persistence is not None
 
-    def create(self, key: str, value: Any) -> bool:
+    def close(self):
+        """Flush and detach the persistence layer, if any"""
+        persistence, self._persistence = self._persistence, None
+        if persistence is not None:
+            persistence.close()
+
+    def _shard_for(self, key: str) -> _Shard:
+        return self._shards[hash(key) % self._num_shards]
+
+    def _next_version(self, key: Optional[str] = None, operation: Optional[str] = None,
+                      value: Any = None, key_version: Optional[int] = None) -> int:
+        """Take the next global version, recording the change it stands for.
+
+        Appending under the version lock keeps the change feed in version
+        order. ``key_version`` is the entry's own version when it differs.
+        """
         with self._lock:
-            if key in self._store:
+            self._version += 1
+            if key is not None:
+                self.changes.append(self._version, key, operation, value, key_version)
+            return self._version
+
+    def _observe_version(self, version: int):
+        with self._lock:
+            if version > self._version:
+                self._version = version
+
+    def _install_locked(self, shard: _Shard, key: str, entry: StorageEntry):
+        """Store an entry and update the shard's bookkeeping; caller holds the lock"""
+        entry.size = ENTRY_OVERHEAD + estimate_size(key) + estimate_size(entry.value)
+        old = shard.entries.get(key)
+        entry.seq = self._version
+        if self.snapshots.oldest is not None:
+            self._chain_locked(shard, key, entry, old)
+        else:
+            shard.entries[key] = entry
+        if old is None:
+            shard.index.add(key)
+        shard.version += 1
+        shard.bytes += entry.size - (old.size if old is not None else 0)
+        if old is not None:
+            previous = (old.version, old.timestamp)
+        else:
+            tombstone = shard.tombstones.pop(key, None)
+            evicted = shard.evicted.pop(key, None)
+            previous = (*tombstone, True) if tombstone is not None else \
+                evicted[:2] if evicted is not None else None
+        shard.merkle.update(key, previous, (entry.version, entry.timestamp))
+        if shard.policy is not None:
+            shard.policy.record_insert(key)
+        if entry.expires_at is not None:
+            self.expiry.schedule(key, entry.expires_at)
+
+    def _chain_locked(self, shard: _Shard, key: str, entry: StorageEntry,
+                      old: Optional[StorageEntry]):
+        """Install ``entry`` over the versions open snapshots still read"""
+        entry.prev = old if old is not None else shard.retired.get(key)
+        if _prune(entry, self.snapshots.versions):
+            shard.versioned.add(key)
+        # Publish before dropping the placeholder so lock-free readers
+        # always find one of them
+        shard.entries[key] = entry
+        shard.retired.pop(key, None)
+
+    def _uninstall_locked(self, shard: _Shard, key: str) -> StorageEntry:
+        """Drop an entry and update the shard's bookkeeping; caller holds the lock"""
+        old = shard.entries[key]
+        if self.snapshots.oldest is not None:
+            # Leave a placeholder over the old versions; the key stays in
+            # the index so snapshot scans still find it
+            placeholder = StorageEntry(_DELETED, old.version, time.time(), None, old.node_id)
+            placeholder.seq = self._version
+            placeholder.prev = old
+            _prune(placeholder, self.snapshots.versions)
+            shard.retired[key] = placeholder
+            shard.versioned.discard(key)
+            del shard.entries[key]
+        else:
+            del shard.entries[key]
+            shard.index.remove(key)
+        shard.version += 1
+        shard.bytes -= old.size
+        shard.merkle.update(key, (old.version, old.timestamp), None)
+        if shard.policy is not None:
+            shard.policy.record_remove(key)
+        return old
+
+    def _bury_locked(self, shard: _Shard, key: str, version: int, timestamp: float):
+        """Record a tombstone for a deleted key; caller holds the shard lock"""
+        if self.tombstone_grace is None or timestamp + self.tombstone_grace <= time.time():
+            return
+        old = shard.tombstones.get(key)
+        shard.tombstones[key] = (version, timestamp)
+        shard.merkle.update(key, (*old, True) if old is not None else None,
+                            (version, timestamp, True))
+
+    def _evict_key_locked(self, shard: _Shard, key: str) -> int:
+        """Evict one entry, keeping its digest in the Merkle tree"""
+        old = shard.entries[key]
+        lsn = self._remove_locked(shard, key)
+        shard.evicted[key] = (old.version, old.timestamp, old.expires_at)
+        shard.merkle.update(key, None, (old.version, old.timestamp))
+        shard.evictions += 1
+        return lsn
+
+    def _forget_evicted_locked(self, shard: _Shard, key: str):
+        evicted = shard.evicted.pop(key, None)
+        if evicted is not None:
+            shard.merkle.update(key, evicted[:2], None)
+
+    def _over_budget(self) -> bool:
+        # Other shards' counters are read without their locks; a total that
+        # is briefly stale only delays an eviction to the next write
+        if self.max_entries is not None and \
+                sum(len(shard.entries) for shard in self._shards) > self.max_entries:
+            return True
+        if self.max_bytes is not None and \
+                sum(shard.bytes for shard in self._shards) > self.max_bytes:
+            return True
+        return False
+
+    def _evict_locked(self, shard: _Shard, keep: Optional[str] = None) -> int:
+        """Evict until the store fits its budget, sparing ``keep``"""
+        lsn = 0
+        while shard.policy is not None and self._over_budget():
+            victim = shard.policy.choose_victim(exclude=keep)
+            if victim is None or victim not in shard.entries:
+                return max(lsn, self._evict_elsewhere(shard))
+            lsn = max(lsn, self._evict_key_locked(shard, victim))
+        return lsn
+
+    def _evict_elsewhere(self, full: _Shard) -> int:
+        """Evict from the largest other shards whose lock is free"""
+        lsn = 0
+        # Only try-locks: the caller already holds a shard lock
+        for shard in sorted(self._shards, key=lambda shard: shard.bytes, reverse=True):
+            if shard is full or not shard.entries or not shard.lock.acquire(False):
+                continue
+            try:
+                while shard.policy is not None and self._over_budget():
+                    victim = shard.policy.choose_victim()
+                    if victim is None or victim not in shard.entries:
+                        break
+                    lsn = max(lsn, self._evict_key_locked(shard, victim))
+            finally:
+                shard.lock.release()
+            if not self._over_budget():
+                break
+        return lsn
+
+    def _put_locked(self, shard: _Shard, key: str, entry: StorageEntry) -> int:
+        """Install an entry, log it and enforce the budget; caller holds the lock"""
+        self._install_locked(shard, key, entry)
+        lsn = 0
+        if self._persistence is not None:
+            lsn = self._persistence.log_put(key, entry, self._version)
+        return max(lsn, self._evict_locked(shard, keep=key))
+
+    def _remove_locked(self, shard: _Shard, key: str) -> int:
+        """Remove an entry and log it; the caller holds the shard lock"""
+        self._uninstall_locked(shard, key)
+        if self._persistence is not None:
+            return self._persistence.log_delete(key, self._version)
+        return 0
+
+    def _wait_durable(self, lsn: int):
+        # Called after the shard lock is released so fsyncs never block the shard
+        if lsn and self._persistence is not None:
+            self._persistence.wait(lsn)
+
+    def _replay(self, op: str, key: str, value: Any, version: int, timestamp: float,
+                expires_at: Optional[float] = None):
+        """Apply a recovered log record without logging it again"""
+        shard = self._shard_for(key)
+        entry = StorageEntry(value, version, timestamp, expires_at, self._node_id)
+        with shard.lock:
+            if op == 'del' or entry.is_expired():
+                if key in shard.entries:
+                    self._uninstall_locked(shard, key)
+                return
+            self._install_locked(shard, key, entry)
+            self._evict_locked(shard, keep=key)
+        self._observe_version(version)
+
+    def create(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        expires_at = _expires_at(ttl)
+        value = self._encode(value)
+        shard = self._shard_for(key)
+        with shard.lock:
+            if _live(shard.entries.get(key)) is not None:
                 return False
-            
+
             entry = StorageEntry(
                 value=value,
-                version=self._version + 1,
-                timestamp=time.time()
+                version=self._next_version(key, 'create', value),
+                timestamp=time.time(),
+                expires_at=expires_at,
+                node_id=self._node_id
             )
-            self._store[key] = entry
-            self._version += 1
-            return True
+            lsn = self._put_locked(shard, key, entry)
+        self._wait_durable(lsn)
+        return True
 
     def read(self, key: str) -> Optional[Any]:
-        with self._lock:
-            if key not in self._store:
-                return None
-            return self._store[key].value
+        entry = self.read_entry(key)
+        return decode_value(entry.value) if entry is not None else None
 
-    def update(self, key: str, value: Any) -> bool:
-        with self._lock:
-            if key not in self._store:
+    def read_entry(self, key: str) -> Optional[StorageEntry]:
+        """Return the live entry for a client read, recording the access.
+
+        The entry's value is in stored form; ``decode_value`` restores it.
+        """
+        # Entries are replaced, never mutated, so a plain dict lookup is safe
+        # without the shard lock and never waits behind writers or merges.
+        shard = self._shard_for(key)
+        entry = _live(shard.entries.get(key))
+        if entry is None:
+            return None
+        if shard.policy is not None:
+            shard.policy.record_access(key)
+        return entry
+
+    def update(self, key: str, value: Any, ttl: Optional[float] = None,
+               if_match: Optional[str] = None) -> bool:
+        """Replace a value; the new TTL (or none) replaces the old one.
+
+        With ``if_match`` the update only happens while the current entry
+        still has that ETag.
+        """
+        expires_at = _expires_at(ttl)
+        value = self._encode(value)
+        shard = self._shard_for(key)
+        with shard.lock:
+            current = _live(shard.entries.get(key))
+            if current is None or (if_match is not None and current.etag() != if_match):
                 return False
-            
+
             entry = StorageEntry(
                 value=value,
-                version=self._store[key].version + 1,
-                timestamp=time.time()
+                version=current.version + 1,
+                timestamp=time.time(),
+                expires_at=expires_at,
+                node_id=self._node_id
             )
-            self._store[key] = entry
-            self._version += 1
-            return True
+            self._next_version(key, 'update', value, entry.version)
+            lsn = self._put_locked(shard, key, entry)
+        self._wait_durable(lsn)
+        return True
 
-    def delete(self, key: str) -> bool:
-        with self._lock:
-            if key not in self._store:
+    def delete(self, key: str, if_match: Optional[str] = None) -> bool:
+        shard = self._shard_for(key)
+        with shard.lock:
+            current = _live(shard.entries.get(key))
+            if current is None or (if_match is not None and current.etag() != if_match):
                 return False
-            del self._store[key]
-            self._version += 1
-            return True
+            # The global version is past every key version, so the
+            # tombstone is newer than the entry it replaces
+            version = self._next_version(key, 'delete')
+            lsn = self._remove_locked(shard, key)
+            self._bury_locked(shard, key, version, time.time())
+        self._wait_durable(lsn)
+        return True
 
-    def get_version(self, key: str) -> Optional[int]:
-        with self._lock:
-            if key not in self._store:
+    def compare_and_swap(self, key: str, expected_version: int, value: Any,
+                         ttl: Optional[float] = None) -> Tuple[bool, Optional[StorageEntry]]:
+        """Write ``value`` only while the key is at ``expected_version``.
+
+        An expected version of 0 means the key must not exist yet. Returns
+        whether the write happened and the key's entry afterwards, None if
+        it does not exist.
+        """
+        expires_at = _expires_at(ttl)
+        value = self._encode(value)
+        shard = self._shard_for(key)
+        with shard.lock:
+            current = _live(shard.entries.get(key))
+            version = current.version if current is not None else 0
+            if version != expected_version:
+                return False, current
+            if current is None:
+                entry = StorageEntry(value, self._next_version(key, 'create', value),
+                                     time.time(), expires_at, self._node_id)
+            else:
+                entry = StorageEntry(value, version + 1, time.time(), expires_at, self._node_id)
+                self._next_version(key, 'update', value, entry.version)
+            lsn = self._put_locked(shard, key, entry)
+        self._wait_durable(lsn)
+        return True, entry
+
+    def modify(self, key: str, transform: Callable[[Any], Any], create: bool = False,
+               ttl: Optional[float] = None) -> Optional[StorageEntry]:
+        """Replace a value with ``transform(value)`` as one step under the shard lock.
+
+        ``transform`` gets the decoded value, or None for a missing key,
+        which is only created when ``create`` is set, with ``ttl``. An
+        existing key keeps its TTL. If ``transform`` raises, nothing is
+        written. Returns the new entry, or None when the key is missing.
+        """
+        expires_at = _expires_at(ttl)
+        shard = self._shard_for(key)
+        with shard.lock:
+            current = _live(shard.entries.get(key))
+            if current is None and not create:
                 return None
-            return self._store[key].version
+            value = self._encode(transform(decode_value(current.value)
+                                           if current is not None else None))
+            if current is None:
+                entry = StorageEntry(value, self._next_version(key, 'create', value),
+                                     time.time(), expires_at, self._node_id)
+            else:
+                entry = StorageEntry(value, current.version + 1, time.time(),
+                                     current.expires_at, self._node_id)
+                self._next_version(key, 'update', value, entry.version)
+            lsn = self._put_locked(shard, key, entry)
+        self._wait_durable(lsn)
+        return entry
+
+    def _group_by_shard(self, keys) -> Dict[int, List[str]]:
+        groups: Dict[int, List[str]] = {}
+        for key in keys:
+            groups.setdefault(hash(key) % self._num_shards, []).append(key)
+        return groups
+
+    def read_many(self, keys: List[str]) -> Dict[str, Optional[Any]]:
+        """Read several keys, returning None for missing ones"""
+        return {key: self.read(key) for key in keys}
+
+    def put_many(self, items: Dict[str, Any], overwrite: bool = False,
+                 ttl: Optional[float] = None) -> Dict[str, str]:
+        """Create (or with overwrite, update) several keys taking each shard lock once.
+
+        Returns a status per key: 'created', 'updated' or 'exists'.
+        """
+        expires_at = _expires_at(ttl)
+        if self.codec is not None:
+            items = {key: self.codec.encode(value) for key, value in items.items()}
+        results: Dict[str, str] = {}
+        lsn = 0
+        for index, keys in self._group_by_shard(items).items():
+            shard = self._shards[index]
+            with shard.lock:
+                for key in keys:
+                    current = _live(shard.entries.get(key))
+                    if current is None:
+                        entry = StorageEntry(items[key],
+                                             self._next_version(key, 'create', items[key]),
+                                             time.time(), expires_at, self._node_id)
+                        results[key] = 'created'
+                    elif overwrite:
+                        entry = StorageEntry(items[key], current.version + 1, time.time(),
+                                             expires_at, self._node_id)
+                        self._next_version(key, 'update', items[key], entry.version)
+                        results[key] = 'updated'
+                    else:
+                        results[key] = 'exists'
+                        continue
+                    lsn = max(lsn, self._put_locked(shard, key, entry))
+        self._wait_durable(lsn)
+        return results
+
+    def delete_many(self, keys: List[str]) -> Dict[str, bool]:
+        """Delete several keys taking each shard lock once"""
+        results: Dict[str, bool] = {}
+        lsn = 0
+        for index, shard_keys in self._group_by_shard(keys).items():
+            shard = self._shards[index]
+            with shard.lock:
+                for key in shard_keys:
+                    if _live(shard.entries.get(key)) is None:
+                        results[key] = False
+                        continue
+                    version = self._next_version(key, 'delete')
+                    lsn = max(lsn, self._remove_locked(shard, key))
+                    self._bury_locked(shard, key, version, time.time())
+                    results[key] = True
+        self._wait_durable(lsn)
+        return results
+
+    def expire_keys(self, keys: List[str], now: Optional[float] = None) -> int:
+        """Remove the given keys if their TTL has passed, returning how many were"""
+        now = now or time.time()
+        removed = 0
+        lsn = 0
+        for index, shard_keys in self._group_by_shard(keys).items():
+            shard = self._shards[index]
+            with shard.lock:
+                for key in shard_keys:
+                    entry = shard.entries.get(key)
+                    if entry is None or not entry.is_expired(now):
+                        continue
+                    self._next_version(key, 'expire')
+                    lsn = max(lsn, self._remove_locked(shard, key))
+                    removed += 1
+        self._wait_durable(lsn)
+        return removed
+
+    def drop_many(self, keys: List[str]) -> int:
+        """Remove local copies of keys this node stopped replicating.
+
+        Like eviction, this is not a delete: no version is taken and
+        watchers, the change feed and replicas never hear of it, and no
+        tombstone is left. Only the log records it so recovery agrees.
+        """
+        dropped = 0
+        lsn = 0
+        for index, shard_keys in self._group_by_shard(keys).items():
+            shard = self._shards[index]
+            with shard.lock:
+                for key in shard_keys:
+                    self._forget_evicted_locked(shard, key)
+                    if key in shard.entries:
+                        lsn = max(lsn, self._remove_locked(shard, key))
+                        dropped += 1
+        self._wait_durable(lsn)
+        return dropped
+
+    def get_entry(self, key: str) -> Optional[StorageEntry]:
+        """Return the stored entry with its version and timestamp"""
+        return _live(self._shard_for(key).entries.get(key))
+
+    def get_leaf_entries(self, leaves: List[int]) -> Dict[str, Tuple[Any, int, float, Optional[float]]]:
+        """Return the entries of the given Merkle leaves in merge() format"""
+        result = {}
+        for shard in self._shards:
+            with shard.lock:
+                for leaf in leaves:
+                    for key in shard.merkle.leaf_keys(leaf):
+                        entry = _live(shard.entries.get(key))
+                        if entry is not None:
+                            result[key] = (entry.value, entry.version, entry.timestamp,
+                                           entry.expires_at)
+        return result
+
+    def get_leaf_tombstones(self, leaves: List[int]) -> Dict[str, Tuple[int, float]]:
+        """Return the tombstones of the given Merkle leaves in merge_tombstones() format"""
+        result = {}
+        for shard in self._shards:
+            with shard.lock:
+                for leaf in leaves:
+                    for key in shard.merkle.leaf_keys(leaf):
+                        tombstone = shard.tombstones.get(key)
+                        if tombstone is not None:
+                            result[key] = tombstone
+        return result
+
+    def get_tombstone(self, key: str) -> Optional[Tuple[int, float]]:
+        """Return the (version, timestamp) a deleted key was buried with"""
+        return self._shard_for(key).tombstones.get(key)
+
+    def get_version(self, key: str) -> Optional[int]:
+        entry = _live(self._shard_for(key).entries.get(key))
+        if entry is None:
+            return None
+        return entry.version
+
+    def get_global_version(self) -> int:
+        """Return the store-wide version counter"""
+        return self._version
+
+    def get_shard_versions(self) -> List[int]:
+        """Return the mutation counter of every shard"""
+        return [shard.version for shard in self._shards]
+
+    def iter_entries(self, snapshot: Optional[Snapshot] = None
+                     ) -> Iterator[Tuple[str, StorageEntry]]:
+        """Yield (key, entry) pairs, copying one shard at a time.
+
+        Without a snapshot each shard is seen as of its own copy; with one,
+        every entry is the one the snapshot reads.
+        """
+        for shard in self._shards:
+            # Hold each shard lock only for the copy, never across a yield
+            with shard.lock:
+                items = list(shard.entries.items())
+                if snapshot is not None and shard.retired:
+                    items.extend(shard.retired.items())
+            if snapshot is None:
+                now = time.time()
+                yield from ((key, entry) for key, entry in items if not entry.is_expired(now))
+                continue
+            for key, entry in items:
+                entry = _visible(entry, snapshot.version, snapshot.timestamp)
+                if entry is not None:
+                    yield key, entry
+
+    def scan(self, prefix: Optional[str] = None, start: Optional[str] = None,
+             end: Optional[str] = None, after: Optional[str] = None,
+             limit: Optional[int] = None, snapshot: Optional[Snapshot] = None
+             ) -> Iterator[Tuple[str, StorageEntry]]:
+        """Yield live (key, entry) pairs in key order from the ordered index.
+
+        ``start`` is inclusive and ``end`` exclusive; ``prefix`` narrows both.
+        ``after`` resumes a previous scan just past the last key it returned.
+        No store lock is held between items, so writers are never stalled;
+        pass a ``snapshot`` to see the store as of a single version.
+        """
+        get_entry = self.get_entry if snapshot is None else snapshot.get_entry
+        lower, inclusive = start, True
+        if prefix:
+            if lower is None or lower < prefix:
+                lower = prefix
+            upper = _prefix_end(prefix)
+            if upper is not None and (end is None or upper < end):
+                end = upper
+        if after is not None and (lower is None or after >= lower):
+            lower, inclusive = after, False
+        count = 0
+        for key in self.index.irange(lower, end, inclusive):
+            if limit is not None and count >= limit:
+                return
+            entry = get_entry(key)
+            if entry is None:
+                continue
+            count += 1
+            yield key, entry
+
+    def snapshot_chunks(self, chunk_size: int = 1000, after: Optional[str] = None,
+                        key_filter: Optional[Callable[[str], bool]] = None,
+                        snapshot: Optional[Snapshot] = None
+                        ) -> Iterator[List[Tuple[str, Any, int, float, Optional[float]]]]:
+        """Yield the store in key order as lists of at most ``chunk_size`` entries.
+
+        Items are (key, value, version, timestamp, expires_at). Entries are
+        read one at a time through ``scan``, so only one chunk is held in
+        memory and writers are never blocked by a running snapshot.
+        """
+        chunk = []
+        for key, entry in self.scan(after=after, snapshot=snapshot):
+            if key_filter is not None and not key_filter(key):
+                continue
+            chunk.append((key, entry.value, entry.version, entry.timestamp, entry.expires_at))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
 
     def get_all_entries(self) -> List[Tuple[str, Any, int]]:
-        """Return all entries as (key, value, version) tuples"""
-        with self._lock:
-            return [(key, entry.value, entry.version) 
-                    for key, entry in self._store.items()]
+        """Return all entries as (key, value, version) tuples, as of one version"""
+        with self.snapshot() as snapshot:
+            return [(key, decode_value(entry.value), entry.version)
+                    for key, entry in snapshot.iter_entries()]
+
+    def snapshot(self) -> Snapshot:
+        """Open a consistent read-only view of the store at the current version.
+
+        All shard locks are taken together, only to wait out writes that
+        are half done; reads through the snapshot take no lock at all.
+        """
+        for shard in self._shards:
+            shard.lock.acquire()
+        try:
+            version = self._version
+            self.snapshots.register(version)
+        finally:
+            for shard in reversed(self._shards):
+                shard.lock.release()
+        return Snapshot(self, version, time.time())
+
+    def _entry_at(self, key: str, version: int, now: float) -> Optional[StorageEntry]:
+        shard = self._shard_for(key)
+        entry = shard.entries.get(key)
+        if entry is None:
+            entry = shard.retired.get(key)
+        return _visible(entry, version, now)
+
+    def _release_snapshot(self, snapshot: Snapshot):
+        self.snapshots.release(snapshot.version)
+        self._collect_versions()
+
+    def _collect_versions(self):
+        """Drop the old versions no open snapshot can read any more"""
+        for shard in self._shards:
+            if not shard.versioned and not shard.retired:
+                continue
+            with shard.lock:
+                versions = self.snapshots.versions
+                for key in list(shard.versioned):
+                    entry = shard.entries.get(key)
+                    if entry is None or not _prune(entry, versions):
+                        shard.versioned.discard(key)
+                for key, placeholder in list(shard.retired.items()):
+                    if versions and placeholder.seq > versions[0]:
+                        _prune(placeholder, versions)
+                        continue
+                    del shard.retired[key]
+                    if key not in shard.entries:
+                        shard.index.remove(key)
 
-    def merge(self, other_store: Dict[str, Tuple[Any, int, float]]):
-        """Merge another store's entries based on version and timestamp"""
+    def retained_versions(self) -> int:
+        """Return how many keys hold versions kept only for open snapshots"""
+        return sum(len(shard.versioned) + len(shard.retired) for shard in self._shards)
+
+    def merge(self, other_store: Dict[str, Tuple[Any, ...]]):
+        """Merge another store's entries based on version and timestamp.
+
+        Items are (value, version, timestamp) with an optional absolute
+        expiry time as a fourth element. Values may arrive already encoded
+        by a peer and are stored as they are.
+        """
+        lsn = 0
+        now = time.time()
+        for index, keys in self._group_by_shard(other_store).items():
+            shard = self._shards[index]
+            # Values are compressed before the lock is taken, like in put_many
+            incoming = []
+            for key in keys:
+                value, version, timestamp, *rest = other_store[key]
+                expires_at = rest[0] if rest else None
+                if expires_at is None or expires_at > now:
+                    incoming.append((key, self._encode(value), version, timestamp, expires_at))
+            changes = []
+            with shard.lock:
+                for key, value, version, timestamp, expires_at in incoming:
+                    current = _live(shard.entries.get(key))
+                    if current is None:
+                        # A write the key's deletion already superseded, or
+                        # the version this node evicted
+                        tombstone = shard.tombstones.get(key)
+                        if tombstone is not None and (version, timestamp) <= tombstone:
+                            continue
+                        evicted = shard.evicted.get(key)
+                        if evicted is not None and (version, timestamp) <= evicted[:2]:
+                            continue
+                    if current is None or (
+                        version > current.version or
+                        (version == current.version and
+                         timestamp > current.timestamp)
+                    ):
+                        entry = StorageEntry(value, version, timestamp,
+                                             expires_at, self._node_id)
+                        changes.append((key, 'create' if current is None else 'update', entry))
+                if changes:
+                    # Versions are taken before the entries land so their
+                    # snapshot tags are already past every open snapshot
+                    self._record_merged(changes)
+                    for key, _, entry in changes:
+                        lsn = max(lsn, self._put_locked(shard, key, entry))
+        self._wait_durable(lsn)
+
+    def merge_tombstones(self, tombstones: Dict[str, Tuple[int, float]]):
+        """Apply deletions replicated from a peer as (version, timestamp).
+
+        A tombstone removes the entry it is newer than, by the same rule
+        ``merge`` uses, and is kept if tombstones are on and it is still
+        within the grace period.
+        """
+        lsn = 0
+        for index, keys in self._group_by_shard(tombstones).items():
+            shard = self._shards[index]
+            with shard.lock:
+                changes = []
+                for key in keys:
+                    version, timestamp = tombstones[key]
+                    current = _live(shard.entries.get(key))
+                    if current is not None and (version, timestamp) > \
+                            (current.version, current.timestamp):
+                        changes.append((key, 'delete', StorageEntry(None, version, timestamp)))
+                if changes:
+                    self._record_merged(changes)
+                    for key, _, _ in changes:
+                        lsn = max(lsn, self._remove_locked(shard, key))
+                for key in keys:
+                    version, timestamp = tombstones[key]
+                    if key in shard.entries:
+                        continue
+                    evicted = shard.evicted.get(key)
+                    if evicted is not None:
+                        if (version, timestamp) <= evicted[:2]:
+                            continue
+                        self._forget_evicted_locked(shard, key)
+                    if (version, timestamp) > shard.tombstones.get(key, (0, 0.0)):
+                        self._bury_locked(shard, key, version, timestamp)
+            self._observe_version(max(tombstones[key][0] for key in keys))
+        self._wait_durable(lsn)
+
+    def purge_tombstones(self, now: Optional[float] = None) -> int:
+        """Drop tombstones past the grace period, returning how many were.
+
+        Evicted keys past their expiry are forgotten as well, as replicas
+        have dropped their copies by then; they are not counted.
+        """
+        now = now or time.time()
+        grace = self.tombstone_grace or 0.0
+        purged = 0
+        for shard in self._shards:
+            with shard.lock:
+                expired = [key for key, (_, timestamp) in shard.tombstones.items()
+                           if timestamp + grace <= now]
+                for key in expired:
+                    version, timestamp = shard.tombstones.pop(key)
+                    shard.merkle.update(key, (version, timestamp, True), None)
+                for key in [key for key, (_, _, expires_at) in shard.evicted.items()
+                            if expires_at is not None and expires_at <= now]:
+                    self._forget_evicted_locked(shard, key)
+                purged += len(expired)
+        return purged
+
+    def _record_merged(self, changes: List[Tuple[str, str, StorageEntry]]):
+        """Advance the global version past merged entries and feed their changes.
+
+        Replicated changes take a global version of their own, so watchers
+        see them in the same feed as local writes; a change reuses its entry
+        version when that is still ahead. One lock covers the batch.
+        """
         with self._lock:
-            for key, (value, version, timestamp) in other_store.items():
-                if key not in self._store or (
-                    version > self._store[key].version or
-                    (version == self._store[key].version and 
-                     timestamp > self._store[key].timestamp)
-                ):
-                    self._store[key] = StorageEntry(value, version, timestamp)
-                    self._version = max(self._version, version)
\ No newline at end of file
+            for key, operation, entry in changes:
+                self._version = max(self._version + 1, entry.version)
+                self.changes.append(self._version, key, operation, entry.value, entry.version)
+
+    def entry_size(self, key: str) -> Optional[int]:
+        """Return the estimated bytes held by one key, entry and value"""
+        entry = self.get_entry(key)
+        return entry.size if entry is not None else None
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """Return the estimated total bytes and the average bytes per entry"""
+        entries = len(self)
+        total = sum(shard.bytes for shard in self._shards)
+        return {
+            'entries': entries,
+            'total_bytes': total,
+            'bytes_per_entry': total / entries if entries else 0.0,
+            'entry_overhead': ENTRY_OVERHEAD
+        }
+
+    def lock_stats(self) -> Dict[str, Dict[str, int]]:
+        """Return how often each kind of store lock was taken and how often it was contended"""
+        return {
+            'version': {'acquisitions': self._lock.acquisitions,
+                        'contended': self._lock.contended},
+            'shard': {'acquisitions': sum(shard.lock.acquisitions for shard in self._shards),
+                      'contended': sum(shard.lock.contended for shard in self._shards)}
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Return key count, estimated bytes and eviction counters"""
+        memory = self.memory_usage()
+        return {
+            'keys': memory['entries'],
+            'bytes': memory['total_bytes'],
+            'bytes_per_entry': memory['bytes_per_entry'],
+            'evictions': sum(shard.evictions for shard in self._shards),
+            'eviction_policy': self.eviction_policy,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'pending_expirations': self.expiry.pending(),
+            'expired': self.expiry.expired,
+            'version': self._version,
+            'snapshots': len(self.snapshots),
+            'retained_versions': self.retained_versions(),
+            'tombstones': sum(len(shard.tombstones) for shard in self._shards)
+        }
+
+    def __len__(self) -> int:
+        return sum(len(shard.entries) for shard in self._shards)
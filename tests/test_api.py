@@ -2,6 +2,7 @@
 import pytest
 from src.app import create_app
 import json
+import base64
 
 @pytest.fixture
 def client():
@@ -68,4 +69,291 @@ def test_invalid_requests(client):
     response = client.put('/kv/test_key', 
                          data='invalid json',
                          content_type='application/json')
-    assert response.status_code == 400
\ No newline at end of file
+    assert response.status_code == 400
+
+def test_sync_applies_batched_updates(client):
+    response = client.post('/sync',
+                           data=json.dumps({'updates': [
+                               {'key': 'sync_a', 'value': 'a', 'operation': 'create', 'version': 5, 'timestamp': 1.0},
+                               {'key': 'sync_b', 'value': 'b', 'operation': 'create'}
+                           ]}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    assert response.get_json()['applied'] == 2
+    assert client.get('/kv/sync_a').get_json()['value'] == 'a'
+
+    # Legacy single-update payload
+    response = client.post('/sync',
+                           data=json.dumps({'key': 'sync_a', 'operation': 'delete'}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    assert client.get('/kv/sync_a').status_code == 404
+
+def test_consistency_parameter(client):
+    response = client.put('/kv/consistency_key?consistency=quorum',
+                          data=json.dumps({'value': 'v'}),
+                          content_type='application/json')
+    assert response.status_code == 201
+
+    response = client.get('/kv/consistency_key?consistency=all')
+    assert response.status_code == 200
+
+    response = client.get('/kv/consistency_key?consistency=most')
+    assert response.status_code == 400
+
+    response = client.get('/replica/consistency_key')
+    assert response.get_json()['value'] == 'v'
+    assert response.get_json()['version'] > 0
+
+def test_batch_endpoints(client):
+    response = client.post('/mput',
+                           data=json.dumps({'items': {'batch_a': 1, 'batch_b': 2, 'batch_c': None}}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert results['batch_a']['status'] == 'created'
+    assert results['batch_c']['status'] == 'invalid'
+
+    response = client.post('/mget',
+                           data=json.dumps({'keys': ['batch_a', 'batch_missing']}),
+                           content_type='application/json')
+    results = response.get_json()['results']
+    assert results['batch_a'] == {'status': 'ok', 'value': 1}
+    assert results['batch_missing']['status'] == 'not_found'
+
+    response = client.post('/mdelete',
+                           data=json.dumps({'keys': ['batch_a', 'batch_b', 'batch_missing']}),
+                           content_type='application/json')
+    results = response.get_json()['results']
+    assert results['batch_a']['status'] == 'deleted'
+    assert results['batch_missing']['status'] == 'not_found'
+
+    response = client.post('/mget', data=json.dumps({}), content_type='application/json')
+    assert response.status_code == 400
+
+def test_put_with_ttl(client):
+    response = client.put('/kv/ttl_key',
+                          data=json.dumps({'value': 'v', 'ttl': 30}),
+                          content_type='application/json')
+    assert response.status_code == 201
+
+    response = client.put('/kv/ttl_bad',
+                          data=json.dumps({'value': 'v', 'ttl': -1}),
+                          content_type='application/json')
+    assert response.status_code == 400
+
+    response = client.post('/sync',
+                           data=json.dumps({'updates': [
+                               {'key': 'ttl_synced', 'value': 'v', 'operation': 'create',
+                                'version': 1, 'timestamp': 1.0, 'expires_at': 1.0}]}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    assert client.get('/kv/ttl_synced').status_code == 404
+
+def test_metrics_endpoint(client):
+    client.put('/kv/metrics-key', data=json.dumps({'value': 'v'}), content_type='application/json')
+    client.get('/kv/metrics-key')
+    client.get('/kv/missing-metrics-key')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    text = response.get_data(as_text=True)
+    assert '# TYPE kv_http_request_duration_seconds histogram' in text
+    assert 'kv_http_request_duration_seconds_bucket{route="/kv/<key>",method="GET",le="+Inf"}' in text
+    assert 'kv_http_requests_total{route="/kv/<key>",method="GET",status="404"}' in text
+    assert 'kv_store_lock_acquisitions_total{lock="version"}' in text
+    assert 'kv_store_lock_acquisitions_total{lock="shard"}' in text
+    assert 'kv_store_lock_hold_seconds_count{lock="shard"}' in text
+    assert '\nkv_keys ' in text
+    assert '\nkv_memory_bytes ' in text
+
+def test_scan_pages_with_cursor(client):
+    items = {f"scan-tenant/{i:04d}": i for i in range(25)}
+    client.post('/mput', data=json.dumps({'items': items}), content_type='application/json')
+
+    keys, cursor = [], None
+    while True:
+        url = '/scan?prefix=scan-tenant/&limit=10' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        page = json.loads(response.get_data(as_text=True))
+        keys.extend(item['key'] for item in page['items'])
+        cursor = page['cursor']
+        if cursor is None:
+            break
+    assert keys == sorted(items)
+    assert page['items'][-1] == {'key': 'scan-tenant/0024', 'value': 24, 'version': page['items'][-1]['version']}
+
+    assert client.get('/scan?limit=0').status_code == 400
+    assert client.get('/scan?cursor=%%%').status_code == 400
+
+def test_snapshot_streams_chunks(client):
+    for i in range(25):
+        client.put(f'/kv/snap_{i:02d}', json={'value': i})
+
+    response = client.get('/snapshot?chunk_size=10&after=snap_')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.data.splitlines()]
+    assert 'version' in lines[0]
+    assert lines[-1] == {'done': True, 'count': sum(len(line['entries']) for line in lines[1:-1])}
+    assert all(len(line['entries']) <= 10 for line in lines[1:-1])
+    keys = [entry[0] for line in lines[1:-1] for entry in line['entries']]
+    assert keys == sorted(keys)
+    assert [key for key in keys if key.startswith('snap_')] == [f'snap_{i:02d}' for i in range(25)]
+
+    assert client.get('/snapshot?chunk_size=0').status_code == 400
+    assert client.get('/ready').get_json() == {'ready': True}
+
+def test_conditional_get_and_writes(client):
+    response = client.put('/kv/etag_key', json={'value': 'v1'})
+    etag = response.headers['ETag']
+    assert client.get('/kv/etag_key').headers['ETag'] == etag
+
+    response = client.get('/kv/etag_key', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert client.get('/kv/etag_key', headers={'If-None-Match': '"0-0"'}).status_code == 200
+
+    # A stale tag is rejected, the current one updates and gets a new tag
+    assert client.put('/kv/etag_key', json={'value': 'v2'},
+                      headers={'If-Match': '"0-0"'}).status_code == 412
+    response = client.put('/kv/etag_key', json={'value': 'v2'}, headers={'If-Match': etag})
+    assert response.status_code == 200
+    new_etag = response.headers['ETag']
+    assert new_etag != etag
+    assert client.get('/kv/etag_key').get_json() == {'value': 'v2'}
+
+    assert client.delete('/kv/etag_key', headers={'If-Match': etag}).status_code == 412
+    assert client.delete('/kv/etag_key', headers={'If-Match': new_etag}).status_code == 200
+    assert client.put('/kv/etag_key', json={'value': 'v3'},
+                      headers={'If-Match': '*'}).status_code == 412
+
+def test_binary_values(client):
+    payload = bytes(range(256)) * 40
+    response = client.put('/kv/binary_key?ttl=60', data=payload,
+                          content_type='application/octet-stream')
+    assert response.status_code == 201
+
+    response = client.get('/kv/binary_key')
+    assert response.mimetype == 'application/octet-stream'
+    assert response.data == payload
+    value = client.post('/mget', json={'keys': ['binary_key']}).get_json()['results']['binary_key']
+    assert value['value'] == {'__b64__': base64.b64encode(payload).decode('ascii')}
+
+def test_watch_long_poll_and_resume(client):
+    since = client.get('/watch?timeout=0').get_json()['version']
+    client.put('/kv/cfg.a', json={'value': 1})
+    client.put('/kv/other', json={'value': 2})
+    client.delete('/kv/cfg.a')
+
+    response = client.get(f'/watch?prefix=cfg.&since={since}')
+    body = response.get_json()
+    assert [(e['key'], e['operation']) for e in body['events']] == [
+        ('cfg.a', 'create'), ('cfg.a', 'delete')]
+    assert body['events'][0]['value'] == 1
+
+    # Nothing new after the returned version, so a zero timeout comes back empty
+    body = client.get(f"/watch?prefix=cfg.&since={body['version']}&timeout=0").get_json()
+    assert body['events'] == []
+
+    # A waiting watcher is woken by the write
+    import threading
+    from src.api.routes import store
+    writer = threading.Timer(0.1, lambda: store.create('cfg.b', 3))
+    writer.start()
+    body = client.get(f"/watch?key=cfg.b&since={body['version']}&timeout=5").get_json()
+    writer.join()
+    assert [e['key'] for e in body['events']] == ['cfg.b']
+
+    assert client.get('/watch?since=999999999999').status_code == 410
+
+def test_watch_server_sent_events(client):
+    since = client.get('/watch?timeout=0').get_json()['version']
+    client.put('/kv/sse_key', json={'value': 'v'})
+    response = client.get(f'/watch?key=sse_key&since={since}',
+                          headers={'Accept': 'text/event-stream'})
+    assert response.mimetype == 'text/event-stream'
+    chunks = response.response
+    assert next(chunks).startswith(b'retry:')
+    message = next(chunks).decode()
+    assert message.startswith('id: ') and 'event: create' in message
+    assert json.loads(message.split('data: ', 1)[1])['value'] == 'v'
+    response.close()
+
+def test_request_traces_and_profile_endpoints(client):
+    response = client.put('/admin/tracing', json={'sample_rate': 1.0, 'slow_ms': 0})
+    assert response.status_code == 200 and response.get_json()['sample_rate'] == 1.0
+    client.put('/kv/traced', json={'value': {'n': 1}})
+    client.get('/kv/traced')
+    traces = client.get('/admin/traces?limit=10').get_json()['traces']
+    spans = {trace['route'] + ' ' + trace['method']: [span['name'] for span in trace['spans']]
+             for trace in traces}
+    assert spans['/kv/<key> PUT'] == ['parse', 'store', 'serialize']
+    assert spans['/kv/<key> GET'] == ['store', 'serialize']
+    assert client.put('/admin/tracing', json={'sample_rate': 2}).status_code == 400
+    client.put('/admin/tracing', json={'sample_rate': 0})
+
+    assert client.post('/admin/profile/start?seconds=0').status_code == 400
+    assert client.post('/admin/profile/start?seconds=5&interval=0.001').status_code == 202
+    assert client.post('/admin/profile/start?seconds=5').status_code == 409
+    response = client.post('/admin/profile/stop')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    assert response.headers['X-Profile-Running'] == 'false'
+
+def test_atomic_operations(client):
+    assert client.post('/kv/hits/incr', json={}).get_json()['value'] == 1
+    assert client.post('/kv/hits/incr', json={'delta': 10}).get_json()['value'] == 11
+    response = client.post('/kv/hits/decr', json={'delta': 2})
+    version = response.get_json()['version']
+    assert response.get_json()['value'] == 9
+    assert response.headers['ETag'] == client.get('/kv/hits').headers['ETag']
+    assert client.post('/kv/hits/incr', json={'delta': 'x'}).status_code == 400
+    assert client.post('/kv/hits/append', json={'values': [1]}).status_code == 409
+
+    response = client.post('/kv/hits/cas', json={'value': 0, 'version': version - 1})
+    assert response.status_code == 412
+    assert response.get_json()['version'] == version
+    response = client.post('/kv/hits/cas', json={'value': 0, 'version': version})
+    assert response.get_json() == {'status': 'swapped', 'version': version + 1}
+    assert client.post('/kv/fresh/cas', json={'value': 'x', 'version': 0}).status_code == 200
+    assert client.post('/kv/fresh/cas', json={'value': 'y', 'version': 0}).status_code == 412
+
+    assert client.post('/kv/log/append', json={'values': ['a', 'b']}).get_json()['length'] == 2
+    response = client.post('/kv/log/append', json={'items': ['c']})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'values must be a list'
+    client.post('/kv/user/merge', json={'fields': {'name': 'x', 'tags': {'a': 1}}})
+    response = client.post('/kv/user/merge', json={'fields': {'name': None, 'tags': {'b': 2}}})
+    assert response.get_json()['value'] == {'tags': {'a': 1, 'b': 2}}
+
+def test_forwarded_request_keeps_key_quoted(client):
+    from unittest.mock import Mock
+    cluster = Mock(is_owner=Mock(return_value=False),
+                   replica_peers=Mock(return_value=['http://owner']))
+    cluster.forward.return_value = Mock(content=b'{}', status_code=200,
+                                        headers={'Content-Type': 'application/json'})
+    client.application.cluster = cluster
+    response = client.get('/kv/a%3Fb%25c?consistency=one')
+    assert response.status_code == 200
+    assert cluster.forward.call_args.args[2] == '/kv/a%3Fb%25c?consistency=one'
+
+def test_write_deleted_before_replication_is_not_replicated(client, monkeypatch):
+    from unittest.mock import Mock
+    from src.api import routes
+    cluster = Mock()
+    client.application.cluster = cluster
+    # As if a concurrent delete removed the key right after the write
+    monkeypatch.setattr(routes.store, 'get_entry', lambda key: None)
+    response = client.put('/kv/raced', data=b'\x00\xff',
+                          content_type='application/octet-stream')
+    assert response.status_code == 201
+    cluster.write_batch.assert_not_called()
+
+def test_merkle_leaves_rejects_non_integer_leaves(client):
+    for leaves in (['0'], [None], [1.5], [True]):
+        response = client.post('/merkle/leaves', json={'leaves': leaves})
+        assert response.status_code == 400
+
+    response = client.post('/merkle/leaves', json={'leaves': [0, 1]})
+    assert response.status_code == 200
@@ -0,0 +1,50 @@
+# tests/test_benchmarks.py
+import random
+from collections import Counter
+from benchmarks.performance import LatencyHistogram, ZipfianGenerator, WORKLOADS
+from benchmarks.microbench import run_suite, check_baseline
+
+def test_histogram_percentiles_within_precision():
+    histogram = LatencyHistogram()
+    for micros in range(1, 100001):
+        histogram.record(micros / 1e6)
+    assert histogram.count == 100000
+    for percent, expected in ((50, 0.05), (99, 0.099), (99.9, 0.0999)):
+        assert abs(histogram.percentile(percent) - expected) / expected < 0.02
+    assert histogram.summary()['max'] == 0.1
+
+def test_histogram_merge_and_round_trip():
+    first, second = LatencyHistogram(), LatencyHistogram()
+    first.record(0.001)
+    second.record(0.5)
+    first.merge(second)
+    restored = LatencyHistogram.from_dict(first.to_dict())
+    assert restored.count == 2
+    assert restored.summary() == first.summary()
+
+def test_zipfian_is_skewed():
+    rng = random.Random(1)
+    generator = ZipfianGenerator(1000)
+    counts = Counter(generator.next(rng) for _ in range(20000))
+    assert all(0 <= index < 1000 for index in counts)
+    hottest = sum(count for _, count in counts.most_common(10))
+    assert hottest > 20000 * 0.2
+
+def test_workload_mix():
+    rng = random.Random(1)
+    ops = Counter(WORKLOADS['read-heavy'].choose(rng) for _ in range(10000))
+    assert set(ops) == {'read', 'update'}
+    assert 0.93 < ops['read'] / 10000 < 0.97
+
+def test_microbench_detects_regressions():
+    results = run_suite(['read', 'merge'], key_counts=[200], thread_counts=[1, 2], repeat=1)
+    assert [result['name'] for result in results] == [
+        'read/keys=200/threads=1', 'read/keys=200/threads=2', 'merge/keys=200/threads=1']
+    assert all(result['ops'] == 200 and result['ns_per_op'] > 0 for result in results)
+
+    baseline = {'tolerance': 0.25, 'cases': {
+        'read/keys=200/threads=1': {'ns_per_op': results[0]['ns_per_op'] / 2},
+        'read/keys=200/threads=2': {'ns_per_op': results[1]['ns_per_op'] / 2, 'tolerance': 2.0},
+        'merge/keys=200/threads=1': {'ns_per_op': results[2]['ns_per_op'] * 2}}}
+    regressions = check_baseline(results, baseline)
+    assert [regression['name'] for regression in regressions] == ['read/keys=200/threads=1']
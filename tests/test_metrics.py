@@ -0,0 +1,68 @@
+# tests/test_metrics.py
+import threading
+import time
+from src.metrics import MetricsRegistry, InstrumentedLock, render_samples
+
+def test_histogram_combines_thread_cells():
+    registry = MetricsRegistry()
+    latency = registry.histogram('test_latency_seconds', 'Test latency', ['route'],
+                                 buckets=(0.01, 0.1))
+
+    def work():
+        for _ in range(1000):
+            latency.labels('/a').observe(0.005)
+            latency.labels('/a').observe(0.05)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    text = registry.render()
+    assert 'test_latency_seconds_bucket{route="/a",le="0.01"} 4000' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 8000' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 8000' in text
+    assert 'test_latency_seconds_count{route="/a"} 8000' in text
+    # Cells of finished threads are folded into the totals
+    assert registry.render() == text
+
+def test_short_lived_threads_reuse_cells():
+    registry = MetricsRegistry()
+    requests = registry.counter('test_requests_total', 'Test requests')
+
+    # Like a server that starts a thread per request
+    for _ in range(50):
+        threads = [threading.Thread(target=requests.inc, args=(2,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert requests.labels().value() == 800
+    assert len(requests.labels()._cells._cells) <= 16
+
+def test_counter_and_samples():
+    registry = MetricsRegistry()
+    requests = registry.counter('test_requests_total', 'Requests', ['status'])
+    requests.labels('200').inc()
+    requests.labels('200').inc(2)
+    assert 'test_requests_total{status="200"} 3' in registry.render()
+    assert render_samples('test_keys', 'Keys', [({'peer': 'a"b'}, 5)]).endswith(
+        'test_keys{peer="a\\"b"} 5\n')
+
+def test_instrumented_lock_counts_contention():
+    registry = MetricsRegistry()
+    wait = registry.histogram('test_wait_seconds', 'Wait').labels()
+    hold = registry.histogram('test_hold_seconds', 'Hold').labels()
+    lock = InstrumentedLock(wait, hold, hold_sample=1)
+    waiter = threading.Thread(target=lambda: lock.acquire() and lock.release())
+    with lock:
+        assert lock.locked()
+        assert not lock.acquire(False)
+        waiter.start()
+        time.sleep(0.05)
+    waiter.join()
+    assert lock.acquisitions == 2
+    assert lock.contended == 1
+    assert wait.snapshot()[2] == 1
+    assert hold.snapshot()[2] == 2
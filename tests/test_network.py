@@ -2,6 +2,8 @@
 import pytest
 from src.network.cluster import ClusterManager
 from src.network.discovery import NodeDiscovery
+from src.network.replication import PeerReplicator
+from src.store.consistency import ConsistencyLevel
 import requests
 from unittest.mock import patch, Mock
 import threading
@@ -40,16 +42,57 @@ def test_add_remove_node(cluster_manager):
     assert new_node not in cluster_manager.nodes
     assert len(cluster_manager.nodes) == 2
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_broadcast_update(mock_post, cluster_manager):
     mock_response = Mock()
     mock_response.status_code = 200
     mock_post.return_value = mock_response
 
     cluster_manager.broadcast_update("test_key", "test_value", "create")
-    
+    assert cluster_manager.flush()
+
     # Should make two POST requests (one for each seed node)
     assert mock_post.call_count == 2
+    cluster_manager.stop()
+
+@patch('requests.Session.post')
+def test_replication_coalesces_and_batches(mock_post):
+    mock_response = Mock()
+    mock_response.status_code = 200
+    mock_post.return_value = mock_response
+
+    replicator = PeerReplicator("http://localhost:8001", batch_size=10)
+    for i in range(3):
+        replicator.enqueue({'key': 'hot', 'value': i, 'operation': 'update'})
+    replicator.enqueue({'key': 'cold', 'value': 'x', 'operation': 'create'})
+
+    stats = replicator.stats()
+    assert stats['queue_depth'] == 2
+    assert stats['coalesced'] == 2
+
+    replicator.drain()
+
+    # One /sync call carrying both keys, with only the latest write for 'hot'
+    assert mock_post.call_count == 1
+    updates = mock_post.call_args.kwargs['json']['updates']
+    assert [u['key'] for u in updates] == ['hot', 'cold']
+    assert updates[0]['value'] == 2
+    assert replicator.stats()['sent'] == 2
+
+def test_replication_queue_is_bounded():
+    replicator = PeerReplicator("http://localhost:8001", max_pending=2)
+    assert replicator.enqueue({'key': 'a', 'value': 1, 'operation': 'create'})
+    assert replicator.enqueue({'key': 'b', 'value': 1, 'operation': 'create'})
+    assert not replicator.enqueue({'key': 'c', 'value': 1, 'operation': 'create'})
+    assert replicator.stats()['dropped'] == 1
+
+@patch('requests.Session.post', side_effect=requests.ConnectionError)
+def test_replication_failure_is_counted(mock_post):
+    replicator = PeerReplicator("http://localhost:8001")
+    replicator.enqueue({'key': 'a', 'value': 1, 'operation': 'create'})
+    replicator.drain()
+    assert replicator.stats()['failed'] == 1
+    assert mock_post.call_args.kwargs['timeout'] == replicator.timeout
 
 def test_node_discovery_registration(node_discovery):
     # Test node registration
@@ -80,4 +123,497 @@ def test_heartbeat_mechanism(mock_post, node_discovery):
     assert mock_post.call_count > 0
 
     # Clean up
-    node_discovery.stop()
\ No newline at end of file
+    node_discovery.stop()
+
+def test_quorum_write_returns_after_enough_acks(cluster_manager):
+    ok = Mock(status_code=200)
+    with patch('requests.Session.post', side_effect=[ok, requests.ConnectionError()]) as mock_post:
+        result = cluster_manager.write(
+            {'key': 'k', 'value': 'v', 'operation': 'create', 'version': 1},
+            required_acks=2)
+    assert result.success
+    assert result.ack_count == 2
+    assert "http://localhost:8000" in result.acks
+
+    with patch('requests.Session.post', side_effect=requests.ConnectionError):
+        result = cluster_manager.write(
+            {'key': 'k', 'value': 'v', 'operation': 'create', 'version': 1},
+            required_acks=3)
+    assert not result.success
+    assert result.ack_count == 1
+    cluster_manager.stop()
+
+def test_quorum_read_collects_replica_versions(cluster_manager):
+    from src.store.consistency import ReadResult, ConsistencyManager
+    replica = Mock(status_code=200)
+    replica.json.return_value = {'value': 'newer', 'version': 7, 'timestamp': 1.0}
+
+    local = ReadResult()
+    local.value, local.version = 'older', 3
+    with patch('requests.Session.get', return_value=replica) as mock_get:
+        results = cluster_manager.read('k?a#b%/c', local, required_acks=3)
+
+    assert len(results) == 3
+    assert mock_get.call_args[0][0].endswith('/replica/k%3Fa%23b%25%2Fc')
+    assert ConsistencyManager.select_latest(results).value == 'newer'
+    cluster_manager.stop()
+
+@patch('requests.Session.post')
+def test_broadcast_updates_share_one_sync_call(mock_post, cluster_manager):
+    mock_post.return_value = Mock(status_code=200)
+    cluster_manager.broadcast_updates([
+        {'key': f'k{i}', 'value': i, 'operation': 'create'} for i in range(20)
+    ])
+    assert cluster_manager.flush()
+
+    # One batched call per peer rather than one per key
+    assert mock_post.call_count == 2
+    assert all(len(call.kwargs['json']['updates']) == 20 for call in mock_post.call_args_list)
+    cluster_manager.stop()
+
+class _ClientSession:
+    """Routes requests.Session calls to a Flask test client"""
+    def __init__(self, client):
+        self.client = client
+
+    def post(self, url, json=None, timeout=None):
+        response = self.client.post('/' + url.split('/', 3)[3], json=json)
+        return Mock(status_code=response.status_code,
+                    json=Mock(return_value=response.get_json()))
+
+def test_anti_entropy_transfers_only_differences():
+    from src.app import create_app
+    from src.api.routes import store as peer_store
+    from src.store.store import DistributedStore
+    from src.network.anti_entropy import AntiEntropy
+
+    peer = create_app().test_client()
+    local = DistributedStore(merkle_depth=peer_store.merkle.depth)
+    for key, value, version in peer_store.get_all_entries():
+        entry = peer_store.get_entry(key)
+        local.merge({key: (value, version, entry.timestamp)})
+    for i in range(200):
+        item = (i, 1, 1.0)
+        peer_store.merge({f"ae_{i}": item})
+        local.merge({f"ae_{i}": item})
+
+    peer_store.merge({"ae_3": ("peer newer", 5, 2.0)})
+    local.merge({"ae_9": ("local newer", 4, 2.0)})
+
+    cluster = Mock(node_address="http://local")
+    cluster.peers.return_value = ["http://peer"]
+    cluster.shares.return_value = True
+    anti_entropy = AntiEntropy(local, cluster)
+    anti_entropy.session = _ClientSession(peer)
+
+    assert anti_entropy.sync_with("http://peer") > 0
+    assert local.read("ae_3") == "peer newer"
+    assert peer_store.read("ae_9") == "local newer"
+    assert local.merkle.root() == peer_store.merkle.root()
+    assert anti_entropy.keys_pulled < 10
+
+    # Converged trees need a single root comparison
+    compared = anti_entropy.nodes_compared
+    assert anti_entropy.sync_with("http://peer") == 0
+    assert anti_entropy.nodes_compared == compared + 1
+
+def test_anti_entropy_does_not_restore_deleted_keys():
+    from src.app import create_app
+    from src.api.routes import store as peer_store
+    from src.store.store import DistributedStore
+    from src.network.anti_entropy import AntiEntropy
+
+    peer = create_app().test_client()
+    local = DistributedStore(merkle_depth=peer_store.merkle.depth)
+    local.merge({key: (value, version, peer_store.get_entry(key).timestamp)
+                 for key, value, version in peer_store.get_all_entries()})
+    for store in (local, peer_store):
+        store.configure_tombstones(60)
+        store.merge({"gone_local": ("v", 1, 1.0), "gone_peer": ("v", 1, 1.0)})
+    try:
+        local.delete("gone_local")
+        peer_store.delete("gone_peer")
+        anti_entropy = AntiEntropy(local, Mock(node_address="http://local"))
+        anti_entropy.cluster.shares.return_value = True
+        anti_entropy.session = _ClientSession(peer)
+
+        assert anti_entropy.sync_with("http://peer") > 0
+        assert local.read("gone_peer") is None
+        assert peer_store.read("gone_local") is None
+        assert local.merkle.root() == peer_store.merkle.root()
+        assert anti_entropy.sync_with("http://peer") == 0
+    finally:
+        peer_store.configure_tombstones(None)
+        peer_store.purge_tombstones()
+
+def test_anti_entropy_does_not_restore_evicted_keys():
+    from src.app import create_app
+    from src.api.routes import store as peer_store
+    from src.store.store import DistributedStore
+    from src.network.anti_entropy import AntiEntropy
+
+    peer = create_app().test_client()
+    # One shard, so the least recently used keys overall are evicted
+    local = DistributedStore(num_shards=1, merkle_depth=peer_store.merkle.depth)
+    keys = [f"cached_{i}" for i in range(20)]
+    for store in (local, peer_store):
+        store.merge({key: ("v", 1, 1.0) for key in keys})
+    local.merge({key: (value, version, peer_store.get_entry(key).timestamp)
+                 for key, value, version in peer_store.get_all_entries()})
+    local.configure_eviction('lru', max_entries=len(local) - 5)
+    anti_entropy = AntiEntropy(local, Mock(node_address="http://local"))
+    anti_entropy.cluster.shares.return_value = True
+    anti_entropy.session = _ClientSession(peer)
+    try:
+        evicted = [key for key in keys if local.read(key) is None]
+        assert len(evicted) == 5
+        assert local.merkle.root() == peer_store.merkle.root()
+        assert anti_entropy.sync_with("http://peer") == 0
+
+        # A newer write to an evicted key is still pulled
+        peer_store.merge({evicted[0]: ("newer", 2, 2.0)})
+        assert anti_entropy.sync_with("http://peer") > 0
+        assert local.read(evicted[0]) == "newer"
+        assert local.stats()['evictions'] == 6
+        assert anti_entropy.sync_with("http://peer") == 0
+    finally:
+        peer_store.delete_many(keys)
+
+def test_anti_entropy_exchanges_only_shared_ranges():
+    from src.app import create_app
+    from src.api.routes import store as peer_store
+    from src.store.store import DistributedStore
+    from src.network.anti_entropy import AntiEntropy
+
+    peer = create_app().test_client()
+    cluster = ClusterManager("http://local", ["http://peer", "http://other"],
+                             replication_factor=2)
+    local = DistributedStore(merkle_depth=peer_store.merkle.depth)
+    keys = [f"owned_{i}" for i in range(60)]
+    peer_store.merge({key: ("peer", 1, 1.0) for key in keys[:30]})
+    local.merge({key: ("local", 1, 1.0) for key in keys[30:]})
+    anti_entropy = AntiEntropy(local, cluster)
+    anti_entropy.session = _ClientSession(peer)
+    try:
+        anti_entropy.sync_with("http://peer")
+        for key in keys[:30]:
+            assert (local.read(key) == "peer") == cluster.shares(key, "http://peer")
+        for key in keys[30:]:
+            assert (peer_store.read(key) == "local") == cluster.shares(key, "http://peer")
+    finally:
+        peer_store.delete_many(keys)
+        cluster.stop()
+
+def test_hash_ring_moves_only_affected_keys():
+    from src.network.ring import HashRing
+    nodes = [f"http://node{i}" for i in range(4)]
+    ring = HashRing(nodes)
+    keys = [f"key_{i}" for i in range(2000)]
+    before = {key: ring.owners(key, 2) for key in keys}
+    assert all(len(set(owners)) == 2 for owners in before.values())
+
+    grown = ring.copy()
+    grown.add_node("http://node4")
+    changed = [key for key in keys if set(grown.owners(key, 2)) != set(before[key])]
+    # Roughly R / N of the keys move; every move involves the new node
+    assert 0 < len(changed) < len(keys) * 0.6
+    assert all("http://node4" in grown.owners(key, 2) for key in changed)
+    assert ring.owners("key_1", 2) == before["key_1"]
+
+@patch('requests.Session.post')
+def test_partitioned_replication_targets_owners(mock_post):
+    mock_post.return_value = Mock(status_code=200)
+    nodes = [f"http://localhost:800{i}" for i in range(1, 5)]
+    cluster = ClusterManager("http://localhost:8000", nodes, replication_factor=2)
+    assert cluster.is_partitioned
+    assert cluster.consistency_manager().get_required_acks(ConsistencyLevel.ALL) == 2
+
+    cluster.broadcast_updates([{'key': f'k{i}', 'value': i, 'operation': 'create'}
+                               for i in range(50)])
+    assert cluster.flush()
+    sent = sum(len(call.kwargs['json']['updates']) for call in mock_post.call_args_list)
+    expected = sum(len(cluster.replica_peers(f'k{i}')) for i in range(50))
+    assert sent == expected < 50 * 4
+    cluster.stop()
+
+@patch('requests.Session.post')
+def test_rebalance_streams_changed_ranges(mock_post):
+    from src.store.store import DistributedStore
+    mock_post.return_value = Mock(status_code=200)
+    store = DistributedStore()
+    cluster = ClusterManager("http://localhost:8000", ["http://localhost:8001"],
+                             replication_factor=1, store=store)
+    owned = [f"key_{i}" for i in range(500) if cluster.is_owner(f"key_{i}")]
+    for key in owned:
+        store.create(key, key)
+
+    version = store.get_global_version()
+    cluster.add_node("http://localhost:8002")
+    cluster.rebalancer.wait()
+
+    moved = [key for key in owned if not cluster.is_owner(key)]
+    assert moved
+    sent = [u['key'] for call in mock_post.call_args_list for u in call.kwargs['json']['updates']]
+    assert sorted(sent) == sorted(moved)
+    assert all(call.args[0] == "http://localhost:8002/sync" for call in mock_post.call_args_list)
+    # Keys handed over are dropped locally, the rest stay put
+    assert len(store) == len(owned) - len(moved)
+    # Dropping a handed-over copy is not a delete
+    assert store.get_global_version() == version
+    assert store.changes.read(version)[0] == []
+    cluster.stop()
+
+def test_node_discovery_listeners(node_discovery):
+    joined, left = [], []
+    node_discovery.add_listener(joined.append, left.append)
+    node_discovery.register_node("http://localhost:8003")
+    node_discovery.register_node("http://localhost:8003")
+    node_discovery.remove_node("http://localhost:8003")
+    assert joined == ["http://localhost:8003"]
+    assert left == ["http://localhost:8003"]
+
+class _FakeNetwork:
+    """Routes discovery pings between in-process nodes, with links that can be cut"""
+
+    def __init__(self, *addresses, **kwargs):
+        self.nodes = {address: NodeDiscovery(address, [a for a in addresses if a != address],
+                                             **kwargs)
+                      for address in addresses}
+        self.down = set()
+        self.cut = set()
+
+    def post(self, url, json=None, timeout=None):
+        address, path = url.rsplit('/', 1)
+        sender = json['sender']
+        if address in self.down or address not in self.nodes or (sender, address) in self.cut:
+            raise requests.ConnectionError()
+        node = self.nodes[address]
+        data = node.handle_ping(json) if path == 'heartbeat' else node.handle_ping_req(json)
+        return Mock(status_code=200, json=Mock(return_value=data))
+
+    def round(self, times=1):
+        for _ in range(times):
+            for address, node in self.nodes.items():
+                if address not in self.down:
+                    node.run_once()
+
+NODES = ["http://a", "http://b", "http://c", "http://d"]
+
+def test_swim_detects_failed_node():
+    network = _FakeNetwork(*NODES, heartbeat_interval=0.01, suspicion_mult=1)
+    left = []
+    network.nodes["http://a"].add_listener(lambda node: None, left.append)
+    network.down.add("http://d")
+    with patch('requests.post', side_effect=network.post):
+        network.round(4)
+        states = {m['address']: m['state'] for m in network.nodes["http://a"].get_members()}
+        assert states["http://d"] in ("suspect", "inactive")
+        time.sleep(0.05)
+        network.round(4)
+    for address in NODES[:3]:
+        assert "http://d" not in network.nodes[address].get_nodes()
+    assert left == ["http://d"]
+
+def test_swim_indirect_probe_avoids_false_suspicion():
+    network = _FakeNetwork(*NODES[:3], heartbeat_interval=0.01)
+    network.cut.add(("http://a", "http://c"))
+    with patch('requests.post', side_effect=network.post):
+        network.round(6)
+    states = {m['address']: m['state'] for m in network.nodes["http://a"].get_members()}
+    assert states == {"http://b": "active", "http://c": "active"}
+
+def test_swim_suspect_refutes_and_joins_spread():
+    network = _FakeNetwork(*NODES[:3], heartbeat_interval=10)
+    a, b = network.nodes["http://a"], network.nodes["http://b"]
+    incarnation = b.incarnation
+    with patch('requests.post', side_effect=network.post):
+        a.apply_updates([{'node': "http://b", 'state': 'suspect', 'incarnation': incarnation}])
+        a.register_node("http://e")
+        network.round(3)
+    assert b.incarnation == incarnation + 1
+    assert {m['address']: m['state'] for m in a.get_members()}["http://b"] == "active"
+    # The join reached every node through piggybacked updates
+    assert "http://e" in b.get_nodes()
+    assert "http://e" in network.nodes["http://c"].get_nodes()
+
+def test_swim_dead_node_is_readmitted_when_it_pings():
+    network = _FakeNetwork(*NODES[:3], heartbeat_interval=10)
+    a, b = network.nodes["http://a"], network.nodes["http://b"]
+    incarnation = b.incarnation
+    a.apply_updates([{'node': "http://b", 'state': 'inactive', 'incarnation': incarnation}])
+    # The rumour is no longer piggybacked, so only a's acks can tell b
+    a._broadcasts.clear()
+    with patch('requests.post', side_effect=network.post):
+        network.round(4)
+    assert b.incarnation > incarnation
+    assert {m['address']: m['state'] for m in a.get_members()}["http://b"] == "active"
+    assert "http://b" in a.get_nodes()
+
+class _StreamingClientSession:
+    """Serves requests.Session.get(stream=True) from a Flask test client"""
+    def __init__(self, client, on_line=None):
+        self.client = client
+        self.on_line = on_line
+        self.requests = []
+
+    def get(self, url, params=None, stream=False, timeout=None):
+        self.requests.append(dict(params or {}))
+        response = self.client.get('/' + url.split('/', 3)[3], query_string=params)
+        lines = response.get_data().split(b'\n')
+
+        def iter_lines():
+            for number, line in enumerate(lines):
+                if self.on_line:
+                    self.on_line(number)
+                yield line
+        return Mock(status_code=response.status_code, iter_lines=iter_lines)
+
+def test_bootstrap_streams_snapshot_and_replays_buffered_writes():
+    from src.app import create_app
+    from src.api.routes import store as peer_store
+    from src.store.store import DistributedStore
+    from src.network.bootstrap import Bootstrapper
+
+    peer = create_app().test_client()
+    for i in range(250):
+        peer_store.merge({f"boot_{i:03d}": (i, 3, 1.0)})
+    local = DistributedStore()
+    replayed = []
+
+    def apply_updates(updates):
+        replayed.extend(updates)
+        for update in updates:
+            if update['operation'] == 'delete':
+                local.delete(update['key'])
+            else:
+                local.merge({update['key']: (update['value'], update['version'], 2.0)})
+
+    bootstrap = Bootstrapper(local, ["http://peer"], apply_updates, chunk_size=50)
+
+    def write_during_transfer(line_number):
+        if line_number == 2:
+            assert bootstrap.buffer([
+                {'key': 'boot_200', 'operation': 'delete'},
+                {'key': 'boot_001', 'operation': 'update', 'value': 'old', 'version': 4},
+                {'key': 'boot_001', 'operation': 'update', 'value': 'new', 'version': 5}])
+            assert not bootstrap.is_ready
+
+    bootstrap.session = _StreamingClientSession(peer, write_during_transfer)
+
+    assert bootstrap.run()
+    assert bootstrap.state == 'ready'
+    # boot_200 was streamed after the delete arrived but stays deleted
+    assert local.read("boot_200") is None
+    assert local.read("boot_001") == "new"
+    assert local.read("boot_249") == 249
+    assert [update['value'] for update in replayed if update['key'] == 'boot_001'] == ['new']
+    assert bootstrap.chunks_received >= 5
+    assert not bootstrap.buffer([{'key': 'late', 'operation': 'update'}])
+
+def test_bootstrap_resumes_from_last_key_on_next_peer():
+    from src.app import create_app
+    from src.api.routes import store as peer_store
+    from src.store.store import DistributedStore
+    from src.network.bootstrap import Bootstrapper
+
+    peer = create_app().test_client()
+    for i in range(100):
+        peer_store.merge({f"resume_{i:03d}": (i, 1, 1.0)})
+    local = DistributedStore()
+    bootstrap = Bootstrapper(local, ["http://a", "http://b"], lambda updates: None,
+                             chunk_size=10, retry_delay=0)
+    failing = _StreamingClientSession(peer)
+
+    dropped_after = []
+
+    def drop_connection(line_number):
+        if line_number == 3:
+            dropped_after.append(bootstrap.last_key)
+            raise requests.ConnectionError("peer went away")
+    failing.on_line = drop_connection
+    healthy = _StreamingClientSession(peer)
+    sessions = iter([failing, healthy])
+
+    original = bootstrap._transfer
+    def transfer(node):
+        bootstrap.session = next(sessions)
+        return original(node)
+    bootstrap._transfer = transfer
+
+    assert bootstrap.run()
+    # Two chunks made it before the drop; the next peer starts after them
+    assert dropped_after[0] is not None
+    assert healthy.requests[0]['after'] == dropped_after[0]
+    assert all(local.read(f"resume_{i:03d}") == i for i in range(100))
+
+def test_hint_queue_survives_restart(tmp_path):
+    from src.network.handoff import HintQueue
+    path = str(tmp_path / "peer.hints")
+    queue = HintQueue("http://peer", max_hints=3, path=path)
+    queue.add([{'key': 'a', 'value': 1}, {'key': 'b', 'value': 1}])
+    batch = queue.peek(10)
+    # 'a' is written again while the first batch is in flight
+    queue.add([{'key': 'a', 'value': 2}, {'key': 'c', 'value': 1}, {'key': 'd', 'value': 1}])
+    queue.ack(batch)
+    assert queue.dropped == 1
+    queue.close()
+
+    reloaded = HintQueue("http://peer", path=path)
+    assert [update for _, update in reloaded.peek(10)] == [{'key': 'a', 'value': 2},
+                                                           {'key': 'c', 'value': 1}]
+
+def test_hinted_handoff_replays_missed_writes_on_rejoin():
+    from src.network.handoff import HintedHandoff
+    handoff = HintedHandoff(batch_size=2, rate=0)
+    cluster = ClusterManager("http://a", ["http://b", "http://c"], handoff=handoff)
+    reachable = {"http://c"}
+    sent = []
+
+    def post(url, json=None, timeout=None):
+        peer = url.rsplit('/', 1)[0]
+        if peer not in reachable:
+            raise requests.ConnectionError()
+        sent.append((peer, json['updates']))
+        return Mock(status_code=200)
+
+    with patch.object(handoff.session, 'post', side_effect=post), \
+            patch.object(cluster._session, 'post', side_effect=post):
+        cluster.remove_node("http://b")
+        for i in range(5):
+            cluster.broadcast_update(f"k{i}", i, 'update', version=i + 1)
+        cluster.broadcast_update("k0", "newer", 'update', version=10)
+        assert handoff.pending("http://b") == 5
+        # A peer marked down gets nothing until discovery sees it again
+        assert handoff.replay("http://b") == 0
+
+        reachable.add("http://b")
+        # Rejoining wakes the replay thread
+        with patch.object(cluster, '_change_ring'):
+            cluster.add_node("http://b")
+        deadline = time.time() + 2
+        while handoff.pending("http://b") and time.time() < deadline:
+            time.sleep(0.01)
+    replayed = [update for peer, updates in sent if peer == "http://b" for update in updates]
+    assert [update['key'] for update in replayed] == ["k1", "k2", "k3", "k4", "k0"]
+    assert replayed[-1]['value'] == "newer"
+    assert all(len(updates) <= 2 for peer, updates in sent if peer == "http://b")
+    assert handoff.replayed == 5
+    cluster.stop()
+
+def test_hinted_handoff_replays_recovered_hints_after_restart(tmp_path):
+    from src.network.handoff import HintedHandoff
+    directory = str(tmp_path / "hints")
+    handoff = HintedHandoff(directory=directory, rate=0)
+    with patch.object(handoff.session, 'post', side_effect=requests.ConnectionError()):
+        handoff.hint("http://b", [{'key': 'k', 'value': 1, 'operation': 'update'}])
+        handoff.stop()
+
+    with patch('requests.Session.post', return_value=Mock(status_code=200)) as mock_post:
+        restarted = HintedHandoff(directory=directory, rate=0)
+        deadline = time.time() + 2
+        while restarted.pending("http://b") and time.time() < deadline:
+            time.sleep(0.01)
+        restarted.stop()
+    assert mock_post.call_args[1]['json'] == {'updates': [{'key': 'k', 'value': 1,
+                                                          'operation': 'update'}]}
+    assert HintedHandoff(directory=directory).pending("http://b") == 0
@@ -0,0 +1,104 @@
+# tests/test_persistence.py
+import os
+import pytest
+from src.store.store import DistributedStore
+from src.store.persistence import PersistenceManager, FsyncPolicy
+
+@pytest.fixture
+def data_dir(tmp_path):
+    return str(tmp_path / "data")
+
+def open_store(data_dir, fsync='batch'):
+    store = DistributedStore()
+    store.enable_persistence(PersistenceManager(data_dir, fsync=fsync, snapshot_interval=3600))
+    return store
+
+@pytest.mark.parametrize("fsync", [policy.value for policy in FsyncPolicy])
+def test_recovery_from_wal(data_dir, fsync):
+    store = open_store(data_dir, fsync)
+    store.create("key1", "value1")
+    store.create("key2", {"nested": [1, 2]})
+    store.update("key1", "value2")
+    store.delete("key2")
+    store.put_many({"a": 1, "b": 2})
+    store.delete_many(["b"])
+    version = store.get_global_version()
+    store.close()
+
+    recovered = open_store(data_dir)
+    assert recovered.read("key1") == "value2"
+    assert recovered.get_version("key1") == 2
+    assert recovered.read("key2") is None
+    assert recovered.read("a") == 1
+    assert recovered.read("b") is None
+    assert recovered.get_global_version() == version
+    recovered.close()
+
+def test_snapshot_compacts_wal(data_dir):
+    store = open_store(data_dir)
+    for i in range(100):
+        store.create(f"key_{i}", i)
+    for i in range(50):
+        store.delete(f"key_{i}")
+    store._persistence.snapshot(store)
+    store.create("after_snapshot", "x")
+    store.close()
+
+    # Only the segment written after the snapshot is kept
+    assert len([name for name in os.listdir(data_dir) if name.startswith('wal-')]) == 1
+    assert len([name for name in os.listdir(data_dir) if name.startswith('snapshot-')]) == 1
+
+    recovered = open_store(data_dir)
+    assert len(recovered) == 51
+    assert recovered.read("key_99") == 99
+    assert recovered.read("after_snapshot") == "x"
+    recovered.close()
+
+def test_truncated_wal_tail_is_ignored(data_dir):
+    store = open_store(data_dir)
+    store.create("key1", "value1")
+    store.close()
+
+    segment = sorted(name for name in os.listdir(data_dir) if name.startswith('wal-'))[-1]
+    with open(os.path.join(data_dir, segment), 'ab') as f:
+        f.write(b'["put","key2",')
+
+    recovered = open_store(data_dir)
+    assert recovered.read("key1") == "value1"
+    assert recovered.read("key2") is None
+    recovered.close()
+
+def test_recovery_keeps_ttl(data_dir):
+    import time
+    store = open_store(data_dir)
+    store.create("short", "x", ttl=0.05)
+    store.create("long", "y", ttl=60)
+    store.close()
+    time.sleep(0.1)
+
+    recovered = open_store(data_dir)
+    assert recovered.read("short") is None
+    assert recovered.get_entry("long").expires_at is not None
+    recovered.close()
+
+def test_recovery_keeps_bytes_values(data_dir):
+    store = open_store(data_dir)
+    store.create("blob", b"\x00\xffraw")
+    store.create("doc", {"__b64__": 1})
+    store.configure_codec('zlib', threshold=100)
+    store.create("large", "compressible " * 100)
+    store.close()
+
+    recovered = open_store(data_dir)
+    assert recovered.read("blob") == b"\x00\xffraw"
+    assert recovered.read("doc") == {"__b64__": 1}
+    assert recovered.read("large") == "compressible " * 100
+    recovered.close()
+
+def test_data_dir_is_locked_while_open(data_dir):
+    store = open_store(data_dir)
+    with pytest.raises(RuntimeError):
+        PersistenceManager(data_dir)
+    assert len([name for name in os.listdir(data_dir) if name.startswith('wal-')]) == 1
+    store.close()
+    open_store(data_dir).close()
@@ -0,0 +1,178 @@
+# tests/test_prefork.py
+import os
+import sys
+import time
+import signal
+import socket
+import subprocess
+import multiprocessing
+import pytest
+import requests
+from src.store.shared import SharedStore, SharedHashTable, CapacityError
+from src.store.atomic import increment
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_shared_table_reuses_slots_and_refuses_what_cannot_fit():
+    table = SharedHashTable(capacity=32, key_size=8, value_size=8, segments=2)
+    # Churn far past capacity: deleted slots are reused or compacted away
+    for round in range(20):
+        for i in range(10):
+            table.put(f"k{round}-{i}".encode(), b"v", 1, time.time())
+        for i in range(10):
+            assert table.remove(f"k{round}-{i}".encode())
+    assert len(table) == 0
+    table.put(b"key", b"value", 3, 1.5)
+    assert table.get(b"key") == (b"value", 3, 1.5, None)
+    with pytest.raises(CapacityError):
+        table.put(b"key", b"too long value", 4, 2.0)
+    with pytest.raises(CapacityError):
+        table.put(b"much too long key", b"v", 1, 1.0)
+    with pytest.raises(CapacityError):
+        for i in range(32):
+            table.put(f"f{i}".encode(), b"v", 1, time.time())
+
+def _increment(store, key, times):
+    for _ in range(times):
+        while True:
+            entry = store.get_entry(key)
+            if store.update(key, entry.value + 1, if_match=entry.etag()):
+                break
+
+def test_shared_store_atomic_operations():
+    store = SharedStore(capacity=64, segments=2)
+    swapped, entry = store.compare_and_swap("k", 0, "a")
+    assert swapped and store.read("k") == "a"
+    swapped, current = store.compare_and_swap("k", 0, "b")
+    assert not swapped and current.version == entry.version
+    assert store.modify("n", increment(2), create=True, ttl=60).value == 2
+    assert store.modify("n", increment(3)).value == 5
+    assert store.get_entry("n").expires_at is not None
+
+def _worker(store, worker):
+    for i in range(50):
+        assert store.create(f"w{worker}/{i}", {'worker': worker, 'i': i})
+    _increment(store, "counter", 50)
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork")
+def test_shared_store_is_shared_by_forked_processes():
+    store = SharedStore(capacity=1000, segments=8)
+    store.create("counter", 0)
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_worker, args=(store, n)) for n in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+    assert len(store) == 201
+    assert store.read("w3/49") == {'worker': 3, 'i': 49}
+    assert store.read("counter") == 200
+
+def _die_holding_lock(table, segment):
+    table.acquire(segment)
+    table.put(b"torn", b"value", 2, 1.0)
+    # Exit as if killed halfway through rewriting the value
+    offset, _ = table._probe(segment, b"torn")
+    table._memory[offset + table.slot_size - table.value_size] = ord("X")
+    os._exit(1)
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork")
+def test_lock_held_by_a_dead_worker_is_taken_over():
+    table = SharedHashTable(capacity=32, key_size=8, value_size=8, segments=2,
+                            lock_timeout=0.05)
+    table.put(b"kept", b"v", 1, 1.0)
+    segment = table.segment_of(b"torn")
+    process = multiprocessing.get_context('fork').Process(target=_die_holding_lock,
+                                                          args=(table, segment))
+    process.start()
+    process.join(10)
+    assert process.exitcode == 1
+
+    table.acquire(segment)
+    try:
+        # The half-written slot is dropped and the counts agree again
+        assert table.get(b"torn") is None
+        assert len(table) == 1 and table.get(b"kept") == (b"v", 1, 1.0, None)
+    finally:
+        table.release(segment)
+    # The lock works normally afterwards
+    table.acquire(segment)
+    table.release(segment)
+    assert table.next_version() == 1
+
+class _DieOnPublish:
+    """Stands in for the region map writer and exits before it writes"""
+
+    def __init__(self, real):
+        self.unpack_from = real.unpack_from
+
+    def pack_into(self, *args):
+        os._exit(1)
+
+def _die_compacting(table, segment):
+    from src.store import shared
+    shared._REGION = _DieOnPublish(shared._REGION)
+    table.acquire(segment)
+    table._compact(segment)
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork")
+def test_worker_dying_mid_compaction_loses_nothing():
+    table = SharedHashTable(capacity=32, key_size=8, value_size=8, segments=1,
+                            lock_timeout=0.05)
+    for i in range(10):
+        table.put(f"k{i}".encode(), b"v", i, 1.0)
+    table.remove(b"k0")
+    process = multiprocessing.get_context('fork').Process(target=_die_compacting,
+                                                          args=(table, 0))
+    process.start()
+    process.join(10)
+    assert process.exitcode == 1
+
+    table.acquire(0)
+    try:
+        assert len(table) == 9
+        assert all(table.get(f"k{i}".encode()) == (b"v", i, 1.0, None) for i in range(1, 10))
+        # The next compaction takes the dead worker's compaction lock over
+        table._compact(0)
+        assert len(table) == 9 and table.get(b"k9") == (b"v", 9, 1.0, None)
+    finally:
+        table.release(0)
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@pytest.mark.skipif(not hasattr(socket, 'SO_REUSEPORT'), reason="needs SO_REUSEPORT")
+def test_prefork_workers_serve_one_store():
+    port = _free_port()
+    env = dict(os.environ, WORKERS='2', PORT=str(port), PYTHONPATH=ROOT)
+    for name in ('NODE_ADDRESS', 'SEED_NODES', 'DATA_DIR', 'RESP_PORT'):
+        env.pop(name, None)
+    server = subprocess.Popen([sys.executable, '-c', 'from src.app import main; main()'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 15
+        while True:
+            try:
+                requests.get(f"{base}/stats", timeout=1)
+                break
+            except requests.ConnectionError:
+                assert time.time() < deadline, "server did not start"
+                time.sleep(0.1)
+        assert requests.put(f"{base}/kv/shared", json={'value': 42}).status_code == 201
+        workers = set()
+        # Every request opens a new connection, which the kernel may hand to any worker
+        for _ in range(40):
+            assert requests.get(f"{base}/kv/shared").json() == {'value': 42}
+            workers.add(requests.get(f"{base}/stats").json()['worker_pid'])
+        assert len(workers) == 2
+        # Routes a standalone node cannot serve are not there at all
+        assert requests.get(f"{base}/scan").status_code == 404
+        assert requests.post(f"{base}/sync", json={'updates': []}).status_code == 404
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(10)
@@ -0,0 +1,49 @@
+# tests/test_profiling.py
+import threading
+import time
+from src.profiling import SamplingProfiler, Tracer
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+def test_profiler_counts_collapsed_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,))
+    worker.start()
+    profiler = SamplingProfiler()
+    try:
+        assert profiler.start(5, interval=0.001)
+        assert not profiler.start(5)
+        time.sleep(0.1)
+        assert profiler.stop()
+    finally:
+        stop.set()
+        worker.join()
+    assert not profiler.running and profiler.samples > 0
+    lines = profiler.collapsed().splitlines()
+    busy = [line for line in lines if '_busy_loop (test_profiling.py' in line]
+    assert busy
+    stack, count = busy[0].rsplit(' ', 1)
+    # Root first, the sampled function last
+    assert stack.split(';')[-1].startswith('_busy_loop') and int(count) > 0
+
+def test_tracer_keeps_slow_sampled_requests():
+    tracer = Tracer(sample_rate=1.0, slow_threshold=0.01, capacity=2)
+    for delay in (0.0, 0.02, 0.03, 0.015):
+        tracer.begin('/kv/<key>', 'GET')
+        with tracer.span('store'):
+            time.sleep(delay)
+        tracer.record('lock_wait', 0.001)
+        tracer.finish(200)
+    slowest = tracer.slowest()
+    # The ring holds the two most recent slow requests, reported slowest first
+    assert [round(trace['spans'][0]['duration_ms'] / 10) for trace in slowest] == [3, 2]
+    assert [span['name'] for span in slowest[0]['spans']] == ['store', 'lock_wait']
+    assert tracer.stats()['sampled'] == 4
+
+    tracer.configure(sample_rate=0)
+    assert tracer.begin('/kv/<key>', 'GET') is None
+    with tracer.span('store'):
+        pass
+    assert tracer.finish(200) is None and tracer.stats()['sampled'] == 4
@@ -0,0 +1,179 @@
+# tests/test_resp.py
+import socket
+import pytest
+from unittest.mock import Mock
+from src.api.resp import RespServer, parse_command, encode_reply, OK
+from src.store.store import DistributedStore
+from src.store.atomic import increment
+from src.store.persistence import PersistenceManager
+
+@pytest.fixture
+def store():
+    return DistributedStore()
+
+@pytest.fixture
+def server(store):
+    server = RespServer(store, host='127.0.0.1', port=0)
+    server.start()
+    yield server
+    server.stop()
+
+def command(*args):
+    return encode_reply([arg.encode() if isinstance(arg, str) else arg for arg in args])
+
+def connect(server):
+    sock = socket.create_connection(('127.0.0.1', server.port), timeout=5)
+    return sock, sock.makefile('rb')
+
+def read_reply(reader):
+    line = reader.readline()
+    kind, rest = line[:1], line[1:-2]
+    if kind in (b'+', b'-'):
+        return rest.decode()
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        length = int(rest)
+        return None if length < 0 else reader.read(length + 2)[:-2]
+    if kind == b'*':
+        return [read_reply(reader) for _ in range(int(rest))]
+    raise AssertionError(f"unexpected reply {line!r}")
+
+def test_parse_command_handles_partial_and_inline():
+    data = bytearray(command('SET', 'key', 'va\r\nlue') + b'PING\r\n')
+    args, pos = parse_command(data)
+    assert args == [b'SET', b'key', b'va\r\nlue']
+    assert parse_command(data, pos) == ([b'PING'], len(data))
+    assert parse_command(bytearray(command('GET', 'key')[:-3])) is None
+    assert encode_reply(OK) == b'+OK\r\n'
+    assert encode_reply({'a': 1}) == b'$8\r\n{"a": 1}\r\n'
+
+def test_basic_commands(server, store):
+    sock, reader = connect(server)
+    sock.sendall(command('PING'))
+    assert read_reply(reader) == 'PONG'
+    sock.sendall(command('SET', 'key1', 'value1'))
+    assert read_reply(reader) == 'OK'
+    assert store.read('key1') == 'value1'
+    sock.sendall(command('SET', 'key1', 'value2', 'NX'))
+    assert read_reply(reader) is None
+    sock.sendall(command('SET', 'key1', 'value2'))
+    assert read_reply(reader) == 'OK'
+    assert store.get_version('key1') == 2
+    sock.sendall(command('GET', 'key1'))
+    assert read_reply(reader) == b'value2'
+    sock.sendall(command('SET', 'session', 'x', 'EX', '60'))
+    assert read_reply(reader) == 'OK'
+    sock.sendall(command('TTL', 'session'))
+    assert 0 < read_reply(reader) <= 60
+    sock.sendall(command('DEL', 'key1', 'missing'))
+    assert read_reply(reader) == 1
+    sock.sendall(command('GET', 'key1'))
+    assert read_reply(reader) is None
+    sock.sendall(command('GET'))
+    assert read_reply(reader).startswith('ERR wrong number of arguments')
+    sock.sendall(command('NOPE'))
+    assert read_reply(reader).startswith('ERR unknown command')
+    sock.sendall(command('MSET', 'a', '1', 'b'))
+    assert read_reply(reader).startswith('ERR wrong number of arguments')
+    sock.close()
+
+def test_failing_commands_are_not_arity_errors(server, store, monkeypatch):
+    def broken(key):
+        raise TypeError('bug in a handler')
+    monkeypatch.setattr(store, 'read', broken)
+    sock, reader = connect(server)
+    sock.sendall(command('GET', 'key') + command('PING'))
+    assert read_reply(reader) == 'ERR bug in a handler'
+    assert read_reply(reader) == 'PONG'
+    sock.close()
+
+def test_failed_offloaded_command_replies_and_continues(server, store):
+    execute = server.execute
+
+    def failing(name, args):
+        if name == 'SET':
+            raise OSError('disk unavailable')
+        return execute(name, args)
+    server.offload = lambda name: name == 'SET'
+    server.execute = failing
+    sock, reader = connect(server)
+    sock.sendall(command('SET', 'a', '1') + command('GET', 'a') + command('PING'))
+    assert read_reply(reader) == 'ERR disk unavailable'
+    assert read_reply(reader) is None
+    assert read_reply(reader) == 'PONG'
+    sock.close()
+
+def test_pipelined_requests_reply_in_order(server, store):
+    sock, reader = connect(server)
+    pipeline = b''.join(command('SET', f'key{i}', str(i)) for i in range(100))
+    pipeline += command('MGET', 'key0', 'key99', 'missing')
+    pipeline += b''.join(command('GET', f'key{i}') for i in range(100))
+    sock.sendall(pipeline)
+    assert [read_reply(reader) for _ in range(100)] == ['OK'] * 100
+    assert read_reply(reader) == [b'0', b'99', None]
+    assert [read_reply(reader) for _ in range(100)] == [str(i).encode() for i in range(100)]
+    assert len(store) == 100
+    sock.close()
+
+def test_binary_values_round_trip(server, store):
+    sock, reader = connect(server)
+    payload = bytes(range(256))
+    sock.sendall(command('SET', 'blob', payload) + command('GET', 'blob'))
+    assert read_reply(reader) == 'OK'
+    assert read_reply(reader) == payload
+    sock.close()
+
+def test_writes_offloaded_when_persistent(tmp_path, store):
+    store.enable_persistence(PersistenceManager(str(tmp_path), fsync='always'))
+    server = RespServer(store, host='127.0.0.1', port=0)
+    server.start()
+    try:
+        sock, reader = connect(server)
+        sock.sendall(command('SET', 'a', '1') + command('GET', 'a') +
+                     command('MSET', 'b', '2', 'c', '3') + command('MGET', 'b', 'c'))
+        assert read_reply(reader) == 'OK'
+        assert read_reply(reader) == b'1'
+        assert read_reply(reader) == 'OK'
+        assert read_reply(reader) == [b'2', b'3']
+        sock.close()
+    finally:
+        server.stop()
+        store.close()
+
+def test_writes_replicate_and_redirect(store):
+    cluster = Mock(is_partitioned=True)
+    cluster.is_owner.side_effect = lambda key: key != 'remote'
+    cluster.owners.return_value = ['http://node2:8000']
+    server = RespServer(store, host='127.0.0.1', port=0, cluster=cluster, peer_port=6380)
+    server.start()
+    try:
+        sock, reader = connect(server)
+        sock.sendall(command('SET', 'local', 'v') + command('GET', 'remote'))
+        assert read_reply(reader) == 'OK'
+        # The owner's RESP address, not its HTTP one
+        assert read_reply(reader) == 'MOVED node2:6380'
+        (updates,), _ = cluster.broadcast_updates.call_args
+        assert updates[0]['key'] == 'local'
+        assert updates[0]['version'] == store.get_version('local')
+        sock.close()
+    finally:
+        server.stop()
+
+def test_counter_commands(server, store):
+    sock, reader = connect(server)
+    sock.sendall(command('INCR', 'hits') + command('INCRBY', 'hits', '10') +
+                 command('DECRBY', 'hits', '3') + command('DECR', 'hits'))
+    assert [read_reply(reader) for _ in range(4)] == [1, 11, 8, 7]
+    # Stored as an integer, so REST /incr can keep counting, and GET
+    # still answers with a bulk string
+    assert store.read('hits') == 7
+    assert store.modify('hits', increment(1)).value == 8
+    sock.sendall(command('GET', 'hits') + command('SET', 'n', '5') + command('INCR', 'n'))
+    assert [read_reply(reader) for _ in range(3)] == [b'8', 'OK', 6]
+    sock.sendall(command('SET', 'name', 'x') + command('INCR', 'name') +
+                 command('INCRBY', 'hits', 'y'))
+    assert read_reply(reader) == 'OK'
+    assert read_reply(reader).startswith('ERR value is not an integer')
+    assert read_reply(reader).startswith('ERR value is not an integer')
+    sock.close()
@@ -100,4 +100,448 @@ def test_read_result():
 
     assert read_result.value == "test_value"
     assert read_result.version == 1
-    assert read_result.node_id == "node1"
\ No newline at end of file
+    assert read_result.node_id == "node1"
+
+def test_sharded_store_distributes_keys():
+    store = DistributedStore(num_shards=4)
+    for i in range(200):
+        store.create(f"key_{i}", i)
+
+    assert len(store) == 200
+    assert sum(store.get_shard_versions()) == 200
+    assert store.get_global_version() == 200
+    assert all(version > 0 for version in store.get_shard_versions())
+
+def test_invalid_shard_count():
+    with pytest.raises(ValueError):
+        DistributedStore(num_shards=0)
+
+def test_concurrent_updates_keep_global_version(store):
+    for i in range(10):
+        store.create(f"key_{i}", 0)
+
+    def concurrent_updates():
+        for _ in range(50):
+            for i in range(10):
+                store.update(f"key_{i}", "value")
+
+    threads = [threading.Thread(target=concurrent_updates) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # 10 creates plus 4 threads x 50 rounds x 10 updates
+    assert store.get_global_version() == 10 + 4 * 50 * 10
+    assert store.get_version("key_0") == 1 + 4 * 50
+
+def test_merge_advances_global_version(store):
+    store.merge({"key1": ("value1", 42, time.time())})
+    assert store.get_global_version() == 42
+    assert len(store.get_all_entries()) == 1
+
+def test_consistency_level_parse():
+    assert ConsistencyLevel.parse("quorum", ConsistencyLevel.ONE) == ConsistencyLevel.QUORUM
+    assert ConsistencyLevel.parse(None, ConsistencyLevel.ONE) == ConsistencyLevel.ONE
+    with pytest.raises(ValueError):
+        ConsistencyLevel.parse("most", ConsistencyLevel.ONE)
+
+def test_select_latest_read_result():
+    results = []
+    for version, value in [(1, "old"), (3, "new"), (0, None)]:
+        result = ReadResult()
+        result.version = version
+        result.value = value
+        results.append(result)
+
+    assert ConsistencyManager.select_latest(results).value == "new"
+    assert ConsistencyManager.select_latest([ReadResult()]) is None
+
+def test_batch_operations(store):
+    store.create("existing", "old")
+    results = store.put_many({"existing": "new", "a": 1, "b": 2})
+    assert results == {"existing": "exists", "a": "created", "b": "created"}
+    assert store.read("existing") == "old"
+
+    results = store.put_many({"existing": "new"}, overwrite=True)
+    assert results == {"existing": "updated"}
+    assert store.read("existing") == "new"
+    assert store.get_version("existing") == 2
+
+    assert store.read_many(["a", "missing"]) == {"a": 1, "missing": None}
+    assert store.delete_many(["a", "missing"]) == {"a": True, "missing": False}
+    assert store.read("a") is None
+
+def test_merkle_tree_tracks_writes():
+    store_a = DistributedStore(merkle_depth=4)
+    store_b = DistributedStore(merkle_depth=4)
+    assert store_a.merkle.root() == store_b.merkle.root() == 0
+
+    entries = {f"key_{i}": (i, 1, 1.0) for i in range(50)}
+    store_a.merge(entries)
+    store_b.merge(entries)
+    assert store_a.merkle.root() == store_b.merkle.root() != 0
+
+    store_b.merge({"key_7": ("changed", 2, 2.0)})
+    assert store_a.merkle.root() != store_b.merkle.root()
+    leaf = store_b.merkle.leaf_for("key_7")
+    node = store_b.merkle.leaf_count + leaf
+    assert store_a.merkle.node_hash(node) != store_b.merkle.node_hash(node)
+    assert "key_7" in store_b.get_leaf_entries([leaf])
+
+    # Deleting and re-adding the same version restores the hash
+    store_b.delete("key_7")
+    store_b.merge({"key_7": (7, 1, 1.0)})
+    assert store_a.merkle.root() == store_b.merkle.root()
+
+def test_tombstones_order_deletes_against_replicated_writes():
+    store = DistributedStore(num_shards=2, merkle_depth=4)
+    store.configure_tombstones(60)
+    store.merge({"k": ("old", 3, 1.0)})
+    store.delete("k")
+    version, timestamp = store.get_tombstone("k")
+    assert version > 3
+
+    # A stale copy cannot bring the key back, and the tombstone is hashed
+    root = store.merkle.root()
+    store.merge({"k": ("old", 3, 1.0)})
+    assert store.read("k") is None
+    assert root != 0 and store.merkle.root() == root
+    assert store.get_leaf_tombstones([store.merkle.leaf_for("k")]) == {"k": (version, timestamp)}
+
+    # A replicated delete removes older entries only
+    store.merge({"a": (1, 2, 1.0), "b": (1, 9, 1.0)})
+    now = time.time()
+    store.merge_tombstones({"a": (5, now), "b": (5, now)})
+    assert store.read("a") is None and store.read("b") == 1
+
+    # Writing the key again replaces its tombstone
+    store.create("k", "new")
+    assert store.get_tombstone("k") is None
+    assert store.purge_tombstones(now=time.time() + 61) == 1
+    store.delete("k")
+    store.delete("b")
+    assert store.purge_tombstones(now=time.time() + 61) == 2
+    assert store.merkle.root() == DistributedStore(merkle_depth=4).merkle.root() == 0
+
+def test_lru_eviction_respects_entry_budget():
+    store = DistributedStore(num_shards=1, max_entries=3, eviction_policy='lru')
+    for key in ["a", "b", "c"]:
+        store.create(key, key)
+    store.read("a")  # "b" is now least recently used
+    store.create("d", "d")
+
+    assert store.read("b") is None
+    assert all(store.read(key) == key for key in ["a", "c", "d"])
+    assert store.stats()['evictions'] == 1
+
+def test_lfu_eviction_keeps_hot_keys():
+    store = DistributedStore(num_shards=1, max_entries=3, eviction_policy='lfu')
+    for key in ["a", "b", "c"]:
+        store.create(key, key)
+    for _ in range(3):
+        store.read("a")
+        store.read("c")
+    store.create("d", "d")
+
+    assert store.read("b") is None
+    assert store.read("a") == "a" and store.read("c") == "c"
+
+def test_sampled_eviction_respects_byte_budget():
+    store = DistributedStore(num_shards=4, max_bytes=20000, eviction_policy='sampled')
+    for i in range(500):
+        store.create(f"key_{i}", "x" * 100)
+
+    stats = store.stats()
+    assert stats['bytes'] <= 20000
+    assert stats['evictions'] > 0
+    assert stats['keys'] == len(store) < 500
+
+def test_eviction_budget_covers_all_shards():
+    store = DistributedStore(max_entries=10)
+    for i in range(1000):
+        store.create(f"key_{i}", i)
+    assert len(store) == 10
+    assert store.read("key_999") == 999
+
+    # Hash skew between shards does not leave the byte budget half used
+    store = DistributedStore(max_bytes=10000, eviction_policy='lru')
+    for i in range(1000):
+        store.create(f"key_{i}", "x" * 100)
+    used = store.stats()['bytes']
+    assert 9000 <= used <= 10000
+
+    with pytest.raises(ValueError):
+        DistributedStore(max_entries=0)
+
+def test_store_tracks_estimated_bytes(store):
+    store.create("key1", "x" * 1000)
+    size = store.stats()['bytes']
+    assert size > 1000
+    store.update("key1", "x")
+    assert store.stats()['bytes'] < size
+    store.delete("key1")
+    assert store.stats()['bytes'] == 0
+
+def test_entries_are_compact(store):
+    store.create("key1", "value1")
+    store.create("key2", "value2")
+    first, second = store.get_entry("key1"), store.get_entry("key2")
+    assert not hasattr(first, '__dict__')
+    assert first.node_id is second.node_id
+
+def test_memory_usage(store):
+    assert store.memory_usage()['bytes_per_entry'] == 0.0
+    store.create("small", "x")
+    store.create("large", "x" * 1000)
+    usage = store.memory_usage()
+    assert usage['entries'] == 2
+    assert usage['total_bytes'] == store.entry_size("small") + store.entry_size("large")
+    assert store.entry_size("large") - store.entry_size("small") == 999
+    assert store.entry_size("missing") is None
+
+def test_unknown_eviction_policy():
+    with pytest.raises(ValueError):
+        DistributedStore(max_entries=10, eviction_policy='random')
+
+def test_ttl_lazy_expiry(store):
+    assert store.create("session", "data", ttl=0.05)
+    assert store.read("session") == "data"
+    time.sleep(0.1)
+
+    # Expired keys read as missing before the expirer removes them
+    assert store.read("session") is None
+    assert store.get_version("session") is None
+    assert not store.update("session", "new")
+    assert store.create("session", "fresh")
+    assert store.read("session") == "fresh"
+
+def test_expirer_removes_in_bounded_batches(store):
+    store.expiry.stop()
+    store.expiry.batch_size = 10
+    calls = []
+    original = store.expire_keys
+    store.expire_keys = lambda keys, now: calls.append(len(keys)) or original(keys, now)
+
+    for i in range(35):
+        store.create(f"key_{i}", i, ttl=60)
+    store.create("persistent", "value")
+
+    assert store.expiry.run_once(now=time.time() + 120) == 35
+    assert max(calls) <= 10
+    assert len(store) == 1
+    assert store.stats()['expired'] == 35
+
+def test_update_replaces_ttl(store):
+    store.create("key1", "value", ttl=60)
+    store.update("key1", "value2")
+    assert store.get_entry("key1").expires_at is None
+    assert store.expiry.run_once(now=time.time() + 120) == 0
+    assert store.read("key1") == "value2"
+
+def test_merge_carries_expiry(store):
+    now = time.time()
+    store.merge({"fresh": ("v", 1, now, now + 60),
+                 "stale": ("v", 1, now, now - 1)})
+    assert store.get_entry("fresh").expires_at == now + 60
+    assert store.read("stale") is None
+
+def test_invalid_ttl(store):
+    with pytest.raises(ValueError):
+        store.create("key1", "value", ttl=0)
+
+def test_sorted_key_index_matches_sorted_set():
+    import random
+    from src.store.index import SortedKeyIndex
+    rng = random.Random(7)
+    index = SortedKeyIndex(block_size=8)
+    reference = set()
+    for _ in range(3000):
+        key = f"k{rng.randrange(500):03d}"
+        if rng.random() < 0.6:
+            assert index.add(key) == (key not in reference)
+            reference.add(key)
+        else:
+            assert index.remove(key) == (key in reference)
+            reference.discard(key)
+    assert len(index) == len(reference)
+    assert list(index.irange(batch=5)) == sorted(reference)
+    assert list(index.irange("k100", "k200", batch=3)) == \
+        sorted(key for key in reference if "k100" <= key < "k200")
+    assert list(index.irange("k100", inclusive_start=False)) == \
+        sorted(key for key in reference if key > "k100")
+
+def test_scan_by_prefix_and_range(store):
+    for tenant in ("acme", "globex"):
+        for i in range(30):
+            store.create(f"{tenant}/{i:03d}", i)
+    store.create("acme", "bare")
+    store.create("other", 1, ttl=0.01)
+    time.sleep(0.02)
+
+    keys = [key for key, _ in store.scan(prefix="acme/")]
+    assert keys == [f"acme/{i:03d}" for i in range(30)]
+    assert [key for key, _ in store.scan(start="acme/028", end="globex/001")] == \
+        ["acme/028", "acme/029", "globex/000"]
+    page = [key for key, _ in store.scan(prefix="globex/", limit=10)]
+    rest = [key for key, _ in store.scan(prefix="globex/", after=page[-1])]
+    assert page + rest == [f"globex/{i:03d}" for i in range(30)]
+    # Expired and deleted keys are skipped
+    store.delete("acme/000")
+    assert [key for key, _ in store.scan(start="acme/", limit=1)] == ["acme/001"]
+    assert [key for key, _ in store.scan(prefix="oth")] == []
+
+def test_conditional_update_and_delete():
+    store = DistributedStore()
+    store.create("cas", "a")
+    etag = store.get_entry("cas").etag()
+    assert not store.update("cas", "b", if_match="0-0")
+    assert store.update("cas", "b", if_match=etag)
+    assert store.read("cas") == "b"
+    assert not store.delete("cas", if_match=etag)
+    assert store.delete("cas", if_match=store.get_entry("cas").etag())
+
+def test_large_values_are_stored_compressed():
+    from src.store.codec import EncodedValue, to_wire, from_wire
+    store = DistributedStore()
+    store.configure_codec('zlib', threshold=1024)
+    document = {'items': [{'id': i, 'name': 'widget', 'tags': ['a', 'b']} for i in range(200)]}
+    store.create("doc", document)
+    store.create("small", {'id': 1})
+    store.put_many({"blob": b"\x00\x01" * 4096, "text": "x" * 5000})
+
+    assert isinstance(store.get_entry("doc").value, EncodedValue)
+    assert store.get_entry("small").value == {'id': 1}
+    assert store.read("doc") == document
+    assert store.read("blob") == b"\x00\x01" * 4096
+    assert store.read("text") == "x" * 5000
+    assert store.entry_size("doc") < 2048
+
+    # Peers receive the encoded bytes and keep them without re-encoding
+    entry = store.get_entry("doc")
+    peer = DistributedStore()
+    peer.merge({"doc": (from_wire(to_wire(entry.value)), entry.version, entry.timestamp)})
+    assert peer.get_entry("doc").value == entry.value
+    assert peer.read("doc") == document
+
+def test_wire_format_escapes_marker_lookalikes():
+    from src.store.codec import to_wire, from_wire
+    for value in [{'__b64__': 'AA=='}, {'__json__': 1}, b'raw', 'text', None]:
+        assert from_wire(to_wire(value)) == value
+
+def test_change_feed_resumes_by_version():
+    store = DistributedStore(feed_capacity=4)
+    start = store.changes.last_version
+    store.create("a", 1)
+    store.update("a", 2)
+    store.merge({"b": ("peer", 7, time.time())})
+    store.delete("a")
+
+    events, complete = store.changes.read(start)
+    assert complete
+    assert [(e.key, e.operation) for e in events] == [
+        ("a", "create"), ("a", "update"), ("b", "create"), ("a", "delete")]
+    assert [e.version for e in events] == sorted(e.version for e in events)
+    assert events[2].key_version == 7
+    assert [e.key for e in store.changes.read(events[1].version)[0]] == ["b", "a"]
+
+    # Once the ring wraps, resuming from before its oldest event is refused
+    store.create("c", 3)
+    assert store.changes.read(start) == ([], False)
+    assert len(store.changes.read(events[0].version)[0]) == 4
+
+def test_snapshot_sees_one_version_until_closed(store):
+    store.put_many({"a": 1, "b": 2, "c": 3})
+    snapshot = store.snapshot()
+    store.update("a", 10)
+    store.delete("b")
+    store.create("d", 4)
+    store.delete("c")
+    store.create("c", 30)
+    store.merge({"e": (5, 99, time.time())})
+
+    assert snapshot.read("a") == 1 and snapshot.read("b") == 2 and snapshot.read("c") == 3
+    assert snapshot.read("d") is None and snapshot.read("e") is None
+    assert [(key, entry.value) for key, entry in snapshot.scan()] == [("a", 1), ("b", 2), ("c", 3)]
+    assert sorted(key for key, _ in snapshot.iter_entries()) == ["a", "b", "c"]
+    assert [key for key, _ in store.scan()] == ["a", "c", "d", "e"]
+    assert store.retained_versions() > 0
+
+    snapshot.close()
+    assert store.retained_versions() == 0
+    assert [key for key, _ in store.scan()] == ["a", "c", "d", "e"]
+    assert "b" not in store.index
+    with pytest.raises(ValueError):
+        snapshot.read("a")
+
+def test_snapshot_keeps_only_versions_open_snapshots_need(store):
+    store.create("k", 0)
+    with store.snapshot() as first:
+        store.update("k", 1)
+        with store.snapshot() as second:
+            for i in range(2, 6):
+                store.update("k", i)
+            assert (first.read("k"), second.read("k"), store.read("k")) == (0, 1, 5)
+            head = store.get_entry("k")
+            assert [head.prev.value, head.prev.prev.value] == [1, 0]
+        # Only the first snapshot's version is still linked below the head
+        head = store.get_entry("k")
+        assert head.prev is not None and head.prev.prev is None
+        assert first.read("k") == 0
+    assert store.get_entry("k").prev is None
+
+def test_snapshot_is_consistent_under_concurrent_writes(store):
+    # Keys are written strictly in order, so any snapshot must see a prefix
+    done = threading.Event()
+
+    def writer():
+        for i in range(3000):
+            store.create(f"k{i:05d}", i)
+            store.update(f"k{i // 2:05d}", -i)
+        done.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    while not done.is_set():
+        with store.snapshot() as snapshot:
+            keys = [key for key, _ in snapshot.scan()]
+            assert keys == [f"k{i:05d}" for i in range(len(keys))]
+    thread.join()
+    assert store.retained_versions() == 0
+
+def test_atomic_operations(store):
+    from src.store.atomic import IncompatibleValueError, increment, append, merge_fields
+    swapped, entry = store.compare_and_swap("k", 0, "a")
+    assert swapped and entry.version == 1
+    swapped, entry = store.compare_and_swap("k", 0, "b")
+    assert not swapped and entry.value == "a"
+    assert store.compare_and_swap("k", 1, "b")[0]
+    assert store.read("k") == "b"
+
+    assert store.modify("n", increment(5)) is None
+    assert store.modify("n", increment(5, initial=10), create=True).value == 15
+    assert store.modify("n", increment(-20)).value == -5
+    with pytest.raises(IncompatibleValueError):
+        store.modify("k", increment(1))
+    assert store.get_version("k") == 2
+
+    store.create("doc", {"a": 1, "b": {"c": 2, "d": 3}})
+    old = store.read("doc")
+    store.modify("doc", merge_fields({"b": {"c": None, "e": 4}, "f": [1]}))
+    assert store.read("doc") == {"a": 1, "b": {"d": 3, "e": 4}, "f": [1]}
+    assert old == {"a": 1, "b": {"c": 2, "d": 3}}
+    assert store.modify("list", append([1, 2]), create=True, ttl=60).value == [1, 2]
+    assert store.modify("list", append([3])).value == [1, 2, 3]
+    assert store.get_entry("list").expires_at is not None
+
+def test_concurrent_increments_are_not_lost(store):
+    from src.store.atomic import increment
+    threads = [threading.Thread(target=lambda: [store.modify("counter", increment(1), create=True)
+                                                for _ in range(200)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.read("counter") == 1600
+    assert store.get_version("counter") == 1600